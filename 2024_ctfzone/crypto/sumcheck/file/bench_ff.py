@@ -0,0 +1,112 @@
+from ff import Fr, alt_bn128_r, mpz
+from Crypto.Util.number import bytes_to_long
+import random
+import sys
+import timeit
+
+# Per-operation timings of the field arithmetic in ff.py against the previous
+# backend, which is kept below exactly as it was: a square-and-multiply loop
+# over FF objects for pow and invert, and full reduction in every constructor.
+
+
+class LegacyFF:
+    value = mpz(0)
+    modulus = mpz(1)
+
+    def __init__(self, x, m) -> None:
+        if type(x) == LegacyFF:
+            self.modulus = x.modulus
+            self.value = x.value
+        else:
+            self.modulus = mpz(m)
+            self.value = mpz(x) % self.modulus
+        pass
+
+    def __add__(self, value: object) -> object:
+        assert self.modulus == value.modulus
+        if type(self) == LegacyFF:
+            return type(self)((self.value + value.value) % self.modulus, self.modulus)
+        else:
+            return type(self)((self.value + value.value) % self.modulus)
+
+    def __sub__(self, value: object) -> object:
+        assert self.modulus == value.modulus
+        return type(self)((self.value - value.value) % self.modulus, self.modulus)
+
+    def __mul__(self, value: object) -> object:
+        assert self.modulus == value.modulus
+        if type(self) == LegacyFF:
+            return type(self)((self.value * value.value) % self.modulus, self.modulus)
+        else:
+            return type(self)((self.value * value.value) % self.modulus)
+
+    def pow(self, power):
+        power = power % (self.modulus - 1)
+        result = LegacyFF(1, self.modulus)
+        running_square = LegacyFF(self.value, self.modulus)
+        for i in range(0, self.modulus.bit_length()):
+            if power & 1:
+                result *= running_square
+            running_square *= running_square
+            power = power >> 1
+        return result
+
+    def invert(self):
+        return self.pow(self.modulus - 2)
+
+    def __truediv__(self, value: object) -> object:
+        assert self.modulus == value.modulus
+        return self * value.invert()
+
+    def __neg__(self) -> object:
+        return self.__class__((self.modulus - self.value) % self.modulus, self.modulus)
+
+
+class LegacyFr(LegacyFF):
+    def __init__(self, x, m=alt_bn128_r):
+        assert m == alt_bn128_r
+        if type(x) == LegacyFr:
+            LegacyFF.__init__(self, x.value, alt_bn128_r)
+        else:
+            LegacyFF.__init__(self, x, alt_bn128_r)
+
+    @staticmethod
+    def from_bytes(data):
+        return LegacyFr(bytes_to_long(data))
+
+
+OPERATIONS = {
+    "construct": lambda field, a, b, data: field(a.value),
+    "from_bytes": lambda field, a, b, data: field.from_bytes(data),
+    "add": lambda field, a, b, data: a + b,
+    "sub": lambda field, a, b, data: a - b,
+    "mul": lambda field, a, b, data: a * b,
+    "neg": lambda field, a, b, data: -a,
+    "pow": lambda field, a, b, data: a.pow(b.value),
+    "invert": lambda field, a, b, data: a.invert(),
+    "div": lambda field, a, b, data: a / b,
+}
+
+
+def time_operation(operation, field, repetitions):
+    data = random.randbytes(32)
+    a = field(bytes_to_long(random.randbytes(32)))
+    b = field(bytes_to_long(random.randbytes(32)))
+    seconds = min(
+        timeit.repeat(
+            lambda: operation(field, a, b, data), number=repetitions, repeat=3
+        )
+    )
+    return seconds / repetitions
+
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'operation':<12}{'legacy (us)':>14}{'current (us)':>14}{'speedup':>10}")
+    for name, operation in OPERATIONS.items():
+        legacy = time_operation(operation, LegacyFr, repetitions)
+        current = time_operation(operation, Fr, repetitions)
+        print(
+            f"{name:<12}{legacy * 1e6:>14.3f}{current * 1e6:>14.3f}"
+            f"{legacy / current:>9.1f}x"
+        )
@@ -0,0 +1,97 @@
+from profiling import capture_spans
+from prover import Prover, Verifier
+from testing_circuits import xor_example_of_size
+import argparse
+import json
+
+# Proves and verifies xor circuits of growing size with profiling enabled and
+# prints one JSON line per size with the spans of both. Given a baseline
+# written earlier with --save, every phase that got slower by more than the
+# tolerance is reported and the exit code is 1.
+
+REGRESSION_TOLERANCE = 1.2
+# Phases this short are too noisy to compare
+MINIMUM_COMPARED_SECONDS = 0.01
+
+
+def benchmark_prover(log_size):
+    with capture_spans() as spans:
+        prover = Prover(xor_example_of_size(log_size))
+        verification_key = prover.generate_verification_key()
+        prover.prove()
+        assert Verifier(prover.export_proof()).verify(verification_key)
+    (prove_span, verify_span) = spans
+    return {
+        "log_size": log_size,
+        "prove": prove_span.to_dict(),
+        "verify": verify_span.to_dict(),
+    }
+
+
+def phase_timings(span, prefix=""):
+    """Seconds of every span by its path, like prove/sumcheck"""
+    path = prefix + span["name"]
+    timings = {path: span["seconds"]}
+    for child in span["children"]:
+        timings.update(phase_timings(child, path + "/"))
+    return timings
+
+
+def find_regressions(result, baseline, tolerance=REGRESSION_TOLERANCE):
+    regressions = []
+    for root in ("prove", "verify"):
+        baseline_timings = phase_timings(baseline[root])
+        for path, seconds in phase_timings(result[root]).items():
+            if path not in baseline_timings:
+                continue
+            previous = baseline_timings[path]
+            if max(previous, seconds) < MINIMUM_COMPARED_SECONDS:
+                continue
+            if seconds > previous * tolerance:
+                regressions.append(
+                    {
+                        "log_size": result["log_size"],
+                        "phase": path,
+                        "baseline_seconds": previous,
+                        "seconds": seconds,
+                    }
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("min_log_size", nargs="?", type=int, default=8)
+    parser.add_argument("max_log_size", nargs="?", type=int, default=None)
+    parser.add_argument("--baseline", help="JSON lines from an earlier --save")
+    parser.add_argument("--save", help="write the results as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    arguments = parser.parse_args()
+    max_log_size = (
+        arguments.max_log_size
+        if arguments.max_log_size is not None
+        else arguments.min_log_size + 2
+    )
+    baseline = dict()
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as f:
+            for line in f:
+                entry = json.loads(line)
+                baseline[entry["log_size"]] = entry
+    results = []
+    regressions = []
+    for log_size in range(arguments.min_log_size, max_log_size + 1):
+        result = benchmark_prover(log_size)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+        if log_size in baseline:
+            regressions.extend(
+                find_regressions(result, baseline[log_size], arguments.tolerance)
+            )
+    if arguments.save is not None:
+        with open(arguments.save, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+    for regression in regressions:
+        print(json.dumps({"regression": regression}), flush=True)
+    exit(1 if regressions else 0)
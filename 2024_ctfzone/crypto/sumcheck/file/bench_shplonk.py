@@ -0,0 +1,92 @@
+from ff import Fr
+from field_vector import FieldVector
+from polynomial import partially_evaluate_multilinear_polynomial
+from profiling import capture_spans, span
+from shplonk import (
+    ProverOpeningClaim,
+    compute_batched_quotient,
+    compute_partially_evaluated_batched_quotient,
+)
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+# Builds the opening claims Gemini hands to Shplonk for a circuit of the given
+# size and computes both Shplonk quotients from them. Prints one JSON line per
+# size with the time, the field vectors allocated, the field multiplications
+# and the peak traced memory, also as a multiple of one polynomial.
+
+# Bytes held by a list of reduced values: the pointer and the mpz object
+BYTES_PER_VALUE = 8 + 48
+
+
+def random_vector(size):
+    return FieldVector([Fr.from_bytes(random.randbytes(32)) for _ in range(size)])
+
+
+def gemini_shaped_claims(log_size):
+    size = 1 << log_size
+    non_shifted_batch = random_vector(size)
+    pre_shift_batch = random_vector(size)
+    pre_shift_batch[0] = Fr(0)
+    layers = [non_shifted_batch + pre_shift_batch.shifted()]
+    for _ in range(log_size):
+        layers.append(
+            partially_evaluate_multilinear_polynomial(
+                layers[-1], Fr.from_bytes(random.randbytes(32))
+            )
+        )
+    r = Fr.from_bytes(random.randbytes(32))
+    points = [(non_shifted_batch, r), (pre_shift_batch, r), (layers[0], r)]
+    points.append((layers[0], -r))
+    r_power = r
+    for layer in layers[1:log_size]:
+        r_power *= r_power
+        points.append((layer, -r_power))
+    return [
+        ProverOpeningClaim(polynomial, x, polynomial.evaluate(x))
+        for polynomial, x in points
+    ]
+
+
+def benchmark_shplonk(log_size):
+    claims = gemini_shaped_claims(log_size)
+    batching_challenge = Fr.from_bytes(random.randbytes(32))
+    opening_challenge = Fr.from_bytes(random.randbytes(32))
+    tracemalloc.start()
+    start = time.perf_counter()
+    with capture_spans() as spans:
+        with span("shplonk_quotients"):
+            batched_quotient = compute_batched_quotient(claims, batching_challenge)
+            difference = compute_partially_evaluated_batched_quotient(
+                claims, batching_challenge, opening_challenge
+            )
+            difference -= batched_quotient
+    seconds = time.perf_counter() - start
+    (_, peak_bytes) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    counters = spans[0].total_counters()
+    return {
+        "log_size": log_size,
+        "claims": len(claims),
+        "seconds": seconds,
+        "counters": counters,
+        "peak_traced_kb": peak_bytes // 1024,
+        "peak_polynomials": round(peak_bytes / (BYTES_PER_VALUE << log_size), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("min_log_size", nargs="?", type=int, default=8)
+    parser.add_argument("max_log_size", nargs="?", type=int, default=None)
+    arguments = parser.parse_args()
+    max_log_size = (
+        arguments.max_log_size
+        if arguments.max_log_size is not None
+        else arguments.min_log_size + 4
+    )
+    for log_size in range(arguments.min_log_size, max_log_size + 1):
+        print(json.dumps(benchmark_shplonk(log_size)), flush=True)
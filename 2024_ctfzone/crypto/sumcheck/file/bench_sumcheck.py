@@ -0,0 +1,56 @@
+from instance import Instance
+from relations import RelationChallenges
+from sumcheck import SumcheckProver, SumcheckChallenges
+from testing_circuits import xor_example_of_size
+from transcript import ProverTranscript
+from ff import Fr
+import json
+import sys
+import time
+
+# Prints one JSON line per instance size with the time of every sumcheck
+# round, so that the cost per 2^k rows can be compared between revisions.
+
+
+def benchmark_sumcheck(log_size):
+    instance = Instance(xor_example_of_size(log_size))
+    relation_challenges = RelationChallenges(Fr(10), Fr(11))
+    sumcheck_challenges = SumcheckChallenges(zeta=Fr(2))
+    instance.generate_permutation_polynomial(
+        relation_challenges.beta, relation_challenges.gamma
+    )
+    instance.generate_logup_inverse_polynomial(
+        relation_challenges.beta, relation_challenges.gamma
+    )
+    instance.generate_zeta_power_polynomial(sumcheck_challenges.zeta)
+    transcript = ProverTranscript()
+    transcript.send_to_verifier(Fr(1))
+    sumcheck_prover = SumcheckProver(
+        instance, transcript, sumcheck_challenges, relation_challenges
+    )
+    sumcheck_prover.alpha = transcript.get_challenge()
+    rounds = []
+    while len(sumcheck_prover.currentPolynomials[0]) > 1:
+        rows = len(sumcheck_prover.currentPolynomials[0])
+        start = time.perf_counter()
+        sumcheck_prover.prove_round()
+        seconds = time.perf_counter() - start
+        rows_per_second = rows / seconds if seconds > 0 else 0
+        rounds.append(
+            {"rows": rows, "seconds": seconds, "rows_per_second": rows_per_second}
+        )
+    return {
+        "log_size": log_size,
+        "seconds": sum(round_timing["seconds"] for round_timing in rounds),
+        "rounds": rounds,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        print(f"Usage: {sys.argv[0]} [min_log_size] [max_log_size]")
+        exit(0)
+    min_log_size = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    max_log_size = int(sys.argv[2]) if len(sys.argv) > 2 else min_log_size + 3
+    for log_size in range(min_log_size, max_log_size + 1):
+        print(json.dumps(benchmark_sumcheck(log_size)), flush=True)
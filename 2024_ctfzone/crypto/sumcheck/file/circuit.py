@@ -10,49 +10,59 @@ WitnessIndexRow = namedtuple(
     "WitnessIndexRow", ["w_l", "w_r", "w_o"], defaults=[0, 0, 0]
 )
 
-LAST_VARIABLE_IN_CLASS = -1
-FIRST_VARIABLE_IN_CLASS = -1
-
-
 class CircuitBuilder:
 
     def add_variable(self, value: Fr):
         index = len(self.variables)
         self.variables.append(value)
-        self.real_variable_indices.append(index)
-        self.previous_variable_in_class.append(FIRST_VARIABLE_IN_CLASS)
-        self.next_variable_in_class.append(LAST_VARIABLE_IN_CLASS)
+        self.parent_variable.append(index)
+        self.class_rank.append(0)
+        self.class_value_index.append(index)
         return index
 
+    def find_real_variable_index(self, index):
+        """Root of the copy-constraint class of a variable, with path compression"""
+        root = index
+        while self.parent_variable[root] != root:
+            root = self.parent_variable[root]
+        while self.parent_variable[index] != root:
+            (self.parent_variable[index], index) = (root, self.parent_variable[index])
+        return root
+
+    def get_real_variable_indices(self):
+        return [
+            self.find_real_variable_index(index) for index in range(len(self.variables))
+        ]
+
     def get_variable_value(self, index):
         assert index < len(self.variables)
-        return self.variables[self.real_variable_indices[index]]
+        return self.variables[
+            self.class_value_index[self.find_real_variable_index(index)]
+        ]
 
     def connect(self, variable_index_1, variable_index_2, fail_on_inequality=True):
         if fail_on_inequality:
             assert self.variables[variable_index_1] == self.variables[variable_index_2]
-        last_variable = variable_index_1
-        while self.next_variable_in_class[last_variable] != LAST_VARIABLE_IN_CLASS:
-            last_variable = self.next_variable_in_class[last_variable]
-        first_variable = variable_index_2
-        while (
-            self.previous_variable_in_class[first_variable] != FIRST_VARIABLE_IN_CLASS
-        ):
-            first_variable = self.previous_variable_in_class[first_variable]
-        new_real_variable_index = self.real_variable_indices[variable_index_1]
-        next_var = first_variable
-        self.real_variable_indices[next_var] = new_real_variable_index
-        while self.previous_variable_in_class[next_var] != LAST_VARIABLE_IN_CLASS:
-            self.real_variable_indices[next_var] = new_real_variable_index
-            next_var = self.previous_variable_in_class[next_var]
-        self.previous_variable_in_class[first_variable] = last_variable
-        self.next_variable_in_class[last_variable] = first_variable
+        root_1 = self.find_real_variable_index(variable_index_1)
+        root_2 = self.find_real_variable_index(variable_index_2)
+        if root_1 == root_2:
+            return
+        # The merged class takes the value of the first variable's class
+        value_index = self.class_value_index[root_1]
+        if self.class_rank[root_1] < self.class_rank[root_2]:
+            (root_1, root_2) = (root_2, root_1)
+        self.parent_variable[root_2] = root_1
+        if self.class_rank[root_1] == self.class_rank[root_2]:
+            self.class_rank[root_1] += 1
+        self.class_value_index[root_1] = value_index
 
     def __init__(self) -> None:
         self.variables = []
-        self.real_variable_indices = []
-        self.previous_variable_in_class = []
-        self.next_variable_in_class = []
+        # Copy constraints as a union-find forest over variable indices
+        self.parent_variable = []
+        self.class_rank = []
+        # Valid at class roots: the variable whose value the whole class takes
+        self.class_value_index = []
         self.rows = []
         self.witness_indices = []
         self.lookup_tables = dict()
@@ -0,0 +1,131 @@
+from msm import pippenger_msm, jacobian_add, INFINITY, P
+from srs_gen import SRS, read_g1_point
+from multiprocessing import Pool
+import atexit
+import os
+import random
+import unittest
+
+# Commitments smaller than this are not worth a round trip to the workers
+MINIMUM_PARALLEL_SIZE = 64
+
+# State of a worker process: the SRS file mapped read-only, shared with every
+# other worker through the page cache. The parent has already validated it.
+worker_srs = None
+
+
+def attach_worker_to_srs(srs_file):
+    global worker_srs
+    worker_srs = SRS(srs_file, validate=False)
+
+
+def commit_chunk_in_worker(task):
+    (index, start, scalars) = task
+    return (
+        index,
+        pippenger_msm(scalars, worker_srs.g1_points(start, start + len(scalars))),
+    )
+
+
+class CommitmentService:
+    """Long-lived pool of workers committing against one SRS file
+
+    Each worker maps the SRS file once when it starts. A commitment sends only
+    the starting SRS index and the scalars of every chunk, and gets a Jacobian
+    integer point back.
+    """
+
+    def __init__(self, srs_file, worker_count=None):
+        self.srs_file = srs_file
+        self.worker_count = worker_count if worker_count else os.cpu_count()
+        self.pool = None
+
+    def start(self):
+        if self.pool is None and self.worker_count > 1:
+            self.pool = Pool(
+                self.worker_count,
+                initializer=attach_worker_to_srs,
+                initargs=(self.srs_file,),
+            )
+        return self
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def is_parallel(self):
+        return self.worker_count > 1
+
+    def commit(self, scalars):
+        """Σ scalars[i] * srs[i] as a Jacobian integer triple"""
+        return self.commit_many([scalars])[0]
+
+    def commit_many(self, scalar_vectors):
+        """One commitment per scalar vector, with the chunks of all of them
+        dispatched to the workers together"""
+        self.start()
+        tasks = []
+        for index, scalars in enumerate(scalar_vectors):
+            scalars = [
+                int(scalar if type(scalar) == int else scalar.value)
+                for scalar in scalars
+            ]
+            chunk_size = max(1, -(-len(scalars) // self.worker_count))
+            tasks.extend(
+                (index, start, scalars[start : start + chunk_size])
+                for start in range(0, len(scalars), chunk_size)
+            )
+        results = [INFINITY] * len(scalar_vectors)
+        for index, partial_result in self.pool.imap_unordered(
+            commit_chunk_in_worker, tasks
+        ):
+            results[index] = jacobian_add(results[index], partial_result)
+        return results
+
+
+commitment_services = dict()
+
+
+def get_commitment_service(srs_file, worker_count=None):
+    """The service shared by every KZG instance using the same SRS file"""
+    key = (os.path.abspath(srs_file), worker_count)
+    if key not in commitment_services:
+        commitment_services[key] = CommitmentService(srs_file, worker_count)
+    return commitment_services[key]
+
+
+def close_all_commitment_services():
+    for service in commitment_services.values():
+        service.close()
+    commitment_services.clear()
+
+
+atexit.register(close_all_commitment_services)
+
+
+class CommitmentServiceTest(unittest.TestCase):
+    def test_matches_local_msm(self):
+        with open("./ronk_srs.bin", "rb") as f:
+            srs_bytes = f.read()
+        scalars = [random.randrange(1 << 254) for _ in range(100)]
+        points = [read_g1_point(srs_bytes, i) for i in range(len(scalars))]
+        expected = pippenger_msm(scalars, points)
+        service = CommitmentService("./ronk_srs.bin", worker_count=2)
+        try:
+            first = service.commit(scalars)
+            (second, empty) = service.commit_many([scalars, []])
+        finally:
+            service.close()
+        self.assertEqual(empty, INFINITY)
+        for result in [first, second]:
+            # Compare x / z^2 and y / z^3 without normalizing
+            (x1, y1, z1) = result
+            (x2, y2, z2) = expected
+            self.assertEqual(x1 * z2 * z2 % P, x2 * z1 * z1 % P)
+            self.assertEqual(y1 * z2**3 % P, y2 * z1**3 % P)
+
+
+if __name__ == "__main__":
+    unittest.main()
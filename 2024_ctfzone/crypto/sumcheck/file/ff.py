@@ -1,12 +1,18 @@
 #!/usr/bin/python3
 try:
-    from gmpy2 import mpz
+    from gmpy2 import mpz, powmod, invert as invert_modulo
 except ImportError:
     print("Won't use gmpy2, will be slower")
 
     def mpz(x):
         return x
 
+    def powmod(x, power, modulus):
+        return pow(x, power, modulus)
+
+    def invert_modulo(x, modulus):
+        return pow(x, -1, modulus)
+
 
 from Crypto.Util.number import long_to_bytes, bytes_to_long
 
@@ -24,6 +30,10 @@ alt_bn128_r = (
 FF_BYTE_LENGTH = 32
 
 
+FR_MODULUS = mpz(alt_bn128_r)
+FQ_MODULUS = mpz(alt_bn128_p)
+
+
 class FF:
     value = mpz(0)
     modulus = mpz(1)
@@ -37,6 +47,15 @@ class FF:
             self.value = mpz(x) % self.modulus
         pass
 
+    def from_reduced(self, value):
+        """Element of the same field as self, value must already be reduced"""
+        element_type = type(self)
+        element = object.__new__(element_type)
+        if element_type.modulus is not self.modulus:
+            element.modulus = self.modulus
+        element.value = value
+        return element
+
     def __eq__(self, value: object) -> bool:
         if type(value) == int:
             return self == type(self)(value)
@@ -45,35 +64,27 @@ class FF:
 
     def __add__(self, value: object) -> object:
         assert self.modulus == value.modulus
-        if type(self) == FF:
-            return type(self)((self.value + value.value) % self.modulus, self.modulus)
-        else:
-            return type(self)((self.value + value.value) % self.modulus)
+        return self.from_reduced((self.value + value.value) % self.modulus)
 
     def __sub__(self, value: object) -> object:
         assert self.modulus == value.modulus
-        return type(self)((self.value - value.value) % self.modulus, self.modulus)
+        return self.from_reduced((self.value - value.value) % self.modulus)
 
     def __mul__(self, value: object) -> object:
         assert self.modulus == value.modulus
-        if type(self) == FF:
-            return type(self)((self.value * value.value) % self.modulus, self.modulus)
-        else:
-            return type(self)((self.value * value.value) % self.modulus)
+        return self.from_reduced(self.value * value.value % self.modulus)
 
     def pow(self, power):
-        power = power % (self.modulus - 1)
-        result = FF(1, self.modulus)
-        running_square = FF(self.value, self.modulus)
-        for i in range(0, self.modulus.bit_length()):
-            if power & 1:
-                result *= running_square
-            running_square *= running_square
-            power = power >> 1
-        return result
+        # Exponents are taken modulo modulus - 1, so 0^(modulus - 1) is 1
+        return self.from_reduced(
+            mpz(powmod(self.value, power % (self.modulus - 1), self.modulus))
+        )
 
     def invert(self):
-        return self.pow(self.modulus - 2)
+        # Zero has no inverse, like 0^(modulus - 2) it maps to zero
+        if self.value == 0:
+            return self.from_reduced(mpz(0))
+        return self.from_reduced(mpz(invert_modulo(self.value, self.modulus)))
 
     def __div__(self, value: object) -> object:
         assert self.modulus == value.modulus
@@ -84,7 +95,7 @@ class FF:
         return self * value.invert()
 
     def __neg__(self) -> object:
-        return self.__class__((self.modulus - self.value) % self.modulus, self.modulus)
+        return self.from_reduced((-self.value) % self.modulus)
 
     def __str__(self) -> str:
         return "FF(" + str(self.value) + ")"
@@ -100,12 +111,13 @@ class FF:
 
 
 class Fr(FF):
+    modulus = FR_MODULUS
+
     def __init__(self, x, m=alt_bn128_r):
         assert m == alt_bn128_r
-        if type(x) == Fr:
-            FF.__init__(self, x.value, alt_bn128_r)
-        else:
-            FF.__init__(self, x, alt_bn128_r)
+        if type(x) is Fr:
+            x = x.value
+        self.value = mpz(x) % FR_MODULUS
 
     def __str__(self) -> str:
         return "Fr(" + str(self.value) + ")"
@@ -117,8 +129,12 @@ class Fr(FF):
 
 
 class Fq(FF):
+    modulus = FQ_MODULUS
+
     def __init__(self, x):
-        FF.__init__(self, x, alt_bn128_p)
+        if type(x) is Fq:
+            x = x.value
+        self.value = mpz(x) % FQ_MODULUS
 
     def __str__(self) -> str:
         return "Fq(" + str(self.value) + ")"
@@ -135,6 +151,14 @@ class TestFFMethods(unittest.TestCase):
         b = FF(2, 4)
         self.assertTrue((a + b).value == 1)
 
+    def test_other_field_is_rejected(self):
+        self.assertEqual(Fr(Fr(5)), Fr(5))
+        self.assertEqual(Fq(Fq(5)), Fq(5))
+        with self.assertRaises(TypeError):
+            Fr(Fq(5))
+        with self.assertRaises(TypeError):
+            Fq(Fr(5))
+
     def test_sub(self):
         a = Fr(0)
         b = Fr(1)
@@ -146,6 +170,22 @@ class TestFFMethods(unittest.TestCase):
         c = a * b
         self.assertTrue(c.value == 1)
 
+    def test_pow_invert(self):
+        a = Fr(12345)
+        self.assertEqual(a.pow(alt_bn128_r - 1), Fr(1))
+        self.assertEqual(a.pow(-1), a.invert())
+        self.assertEqual(a.pow(3), a * a * a)
+        self.assertEqual(Fr(0).invert(), Fr(0))
+        self.assertEqual(Fr(0).pow(0), Fr(1))
+        self.assertEqual(type(a.pow(5)), Fr)
+        b = Fq(7)
+        self.assertEqual(b.invert() * b, Fq(1))
+        self.assertEqual(b - b, Fq(0))
+        self.assertEqual((-b).value, alt_bn128_p - 7)
+        c = FF(3, 7)
+        self.assertEqual((c / FF(2, 7)).value, 5)
+        self.assertEqual(c.pow(6).value, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
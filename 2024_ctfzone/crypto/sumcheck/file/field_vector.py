@@ -0,0 +1,359 @@
+from ff import FF, Fr, FF_BYTE_LENGTH, alt_bn128_r, mpz, invert_modulo
+from profiling import (
+    count,
+    FIELD_MULTIPLICATIONS,
+    FIELD_INVERSIONS,
+    VECTOR_ALLOCATIONS,
+)
+import random
+import unittest
+
+MODULUS = mpz(alt_bn128_r)
+
+
+def to_value(element):
+    if isinstance(element, FF):
+        return element.value
+    return mpz(element) % MODULUS
+
+
+class FieldVector:
+    """A polynomial over Fr stored as one flat list of reduced integers.
+
+    Indexing returns Fr objects so the vector can be used anywhere a list of Fr
+    was used before, while the bulk operations work on the raw values and only
+    reduce once per element.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, elements=()):
+        self.values = [to_value(element) for element in elements]
+
+    @staticmethod
+    def from_values(values):
+        """Wrap a list of already reduced values without copying it"""
+        vector = FieldVector()
+        vector.values = values
+        return vector
+
+    @staticmethod
+    def zeros(length):
+        count(VECTOR_ALLOCATIONS)
+        return FieldVector.from_values([mpz(0)] * length)
+
+    @staticmethod
+    def from_bytes(data):
+        """Inverse of to_bytes, rejecting values that are not reduced"""
+        if len(data) % FF_BYTE_LENGTH != 0:
+            raise ValueError("Field vector data is not a whole number of elements")
+        values = [
+            mpz(int.from_bytes(data[i : i + FF_BYTE_LENGTH], "little"))
+            for i in range(0, len(data), FF_BYTE_LENGTH)
+        ]
+        for value in values:
+            if value >= MODULUS:
+                raise ValueError("Field vector element is out of range")
+        return FieldVector.from_values(values)
+
+    def to_bytes(self):
+        """Every value as FF_BYTE_LENGTH little-endian bytes"""
+        return b"".join(
+            int(value).to_bytes(FF_BYTE_LENGTH, "little") for value in self.values
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        for value in self.values:
+            yield Fr(value)
+
+    def __getitem__(self, index):
+        if type(index) == slice:
+            return FieldVector.from_values(self.values[index])
+        return Fr(self.values[index])
+
+    def __setitem__(self, index, element):
+        self.values[index] = to_value(element)
+
+    def __eq__(self, other):
+        if isinstance(other, FieldVector):
+            return self.values == other.values
+        return self.values == [to_value(element) for element in other]
+
+    def __repr__(self):
+        return "FieldVector(" + str([int(value) for value in self.values]) + ")"
+
+    def __copy__(self):
+        count(VECTOR_ALLOCATIONS)
+        return FieldVector.from_values(list(self.values))
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def copy(self):
+        return self.__copy__()
+
+    def append(self, element):
+        self.values.append(to_value(element))
+
+    def extend(self, elements):
+        if isinstance(elements, FieldVector):
+            self.values.extend(elements.values)
+        else:
+            self.values.extend(to_value(element) for element in elements)
+
+    def to_list(self):
+        return [Fr(value) for value in self.values]
+
+    def __add__(self, other):
+        count(VECTOR_ALLOCATIONS)
+        if isinstance(other, FieldVector):
+            assert len(self.values) == len(other.values)
+            return FieldVector.from_values(
+                [(a + b) % MODULUS for a, b in zip(self.values, other.values)]
+            )
+        scalar = to_value(other)
+        return FieldVector.from_values(
+            [(a + scalar) % MODULUS for a in self.values]
+        )
+
+    def __sub__(self, other):
+        count(VECTOR_ALLOCATIONS)
+        if isinstance(other, FieldVector):
+            assert len(self.values) == len(other.values)
+            return FieldVector.from_values(
+                [(a - b) % MODULUS for a, b in zip(self.values, other.values)]
+            )
+        scalar = to_value(other)
+        return FieldVector.from_values(
+            [(a - scalar) % MODULUS for a in self.values]
+        )
+
+    def __mul__(self, other):
+        if isinstance(other, FieldVector):
+            assert len(self.values) == len(other.values)
+            count(FIELD_MULTIPLICATIONS, len(self.values))
+            count(VECTOR_ALLOCATIONS)
+            return FieldVector.from_values(
+                [(a * b) % MODULUS for a, b in zip(self.values, other.values)]
+            )
+        return self.scale(other)
+
+    def __neg__(self):
+        count(VECTOR_ALLOCATIONS)
+        return FieldVector.from_values([(-a) % MODULUS for a in self.values])
+
+    def scale(self, scalar):
+        scalar = to_value(scalar)
+        count(FIELD_MULTIPLICATIONS, len(self.values))
+        count(VECTOR_ALLOCATIONS)
+        return FieldVector.from_values([(a * scalar) % MODULUS for a in self.values])
+
+    def add_scaled(self, other, scalar):
+        """self += other * scalar, in place. other may be shorter"""
+        assert len(self.values) >= len(other.values)
+        scalar = to_value(scalar)
+        count(FIELD_MULTIPLICATIONS, len(other.values))
+        self.values[: len(other.values)] = [
+            (a + b * scalar) % MODULUS for a, b in zip(self.values, other.values)
+        ]
+        return self
+
+    def __iadd__(self, other):
+        """In place, other may be shorter"""
+        assert len(self.values) >= len(other.values)
+        self.values[: len(other.values)] = [
+            (a + b) % MODULUS for a, b in zip(self.values, other.values)
+        ]
+        return self
+
+    def __isub__(self, other):
+        """In place, other may be shorter"""
+        assert len(self.values) >= len(other.values)
+        self.values[: len(other.values)] = [
+            (a - b) % MODULUS for a, b in zip(self.values, other.values)
+        ]
+        return self
+
+    def divide_by_linear(self, root):
+        """Divide in place by X - root and return the remainder, P(root)"""
+        root = to_value(root)
+        values = self.values
+        if len(values) == 0:
+            return Fr(0)
+        count(FIELD_MULTIPLICATIONS, len(values))
+        carry = mpz(0)
+        for i in range(len(values) - 1, -1, -1):
+            carry = (values[i] + carry * root) % MODULUS
+            values[i] = carry
+        del values[0]
+        return Fr(carry)
+
+    def fold(self, challenge):
+        """Partially evaluate the multilinear polynomial in its lowest variable"""
+        assert len(self.values) % 2 == 0
+        challenge = to_value(challenge)
+        values = self.values
+        count(FIELD_MULTIPLICATIONS, len(values) // 2)
+        count(VECTOR_ALLOCATIONS)
+        return FieldVector.from_values(
+            [
+                (a + (b - a) * challenge) % MODULUS
+                for a, b in zip(values[0::2], values[1::2])
+            ]
+        )
+
+    def fold_in_place(self, challenge):
+        """Same as fold, but overwrites the first half of this vector"""
+        values = self.values
+        half = len(values) // 2
+        assert len(values) == 2 * half
+        challenge = to_value(challenge)
+        count(FIELD_MULTIPLICATIONS, half)
+        for i in range(half):
+            a = values[2 * i]
+            values[i] = (a + (values[2 * i + 1] - a) * challenge) % MODULUS
+        del values[half:]
+        return self
+
+    def shifted(self):
+        """Coefficients moved one position down, with a zero appended"""
+        count(VECTOR_ALLOCATIONS)
+        return FieldVector.from_values(self.values[1:] + [mpz(0)])
+
+    def evaluate(self, point):
+        """Evaluate as a univariate polynomial in monomial form"""
+        point = to_value(point)
+        count(FIELD_MULTIPLICATIONS, len(self.values))
+        result = mpz(0)
+        for value in reversed(self.values):
+            result = (result * point + value) % MODULUS
+        return Fr(result)
+
+    def evaluate_at_opposite_points(self, point):
+        """(P(point), P(-point)) from one pass over the even and odd halves"""
+        point = to_value(point)
+        square = point * point % MODULUS
+        values = self.values
+        count(FIELD_MULTIPLICATIONS, len(values) + 1)
+        even = mpz(0)
+        for value in reversed(values[0::2]):
+            even = (even * square + value) % MODULUS
+        odd = mpz(0)
+        for value in reversed(values[1::2]):
+            odd = (odd * square + value) % MODULUS
+        odd = odd * point % MODULUS
+        return (Fr((even + odd) % MODULUS), Fr((even - odd) % MODULUS))
+
+    def sum(self):
+        return Fr(sum(self.values) % MODULUS)
+
+
+def batch_inverse_values(values):
+    """Inverses of reduced values with a single field inversion
+
+    Zeros are skipped in the running product and map to zero.
+    """
+    count(FIELD_INVERSIONS)
+    count(FIELD_MULTIPLICATIONS, 3 * len(values))
+    prefix_products = [mpz(0)] * len(values)
+    running_product = mpz(1)
+    for i, value in enumerate(values):
+        prefix_products[i] = running_product
+        if value != 0:
+            running_product = running_product * value % MODULUS
+    running_inverse = mpz(invert_modulo(running_product, MODULUS))
+    result = [mpz(0)] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        value = values[i]
+        if value != 0:
+            result[i] = running_inverse * prefix_products[i] % MODULUS
+            running_inverse = running_inverse * value % MODULUS
+    return result
+
+
+def batch_divide_values(numerators, denominators):
+    """numerators[i] / denominators[i], zero where the denominator is zero"""
+    assert len(numerators) == len(denominators)
+    count(FIELD_MULTIPLICATIONS, len(numerators))
+    return [
+        numerator * inverse % MODULUS
+        for numerator, inverse in zip(numerators, batch_inverse_values(denominators))
+    ]
+
+
+def as_field_vector(polynomial):
+    if isinstance(polynomial, FieldVector):
+        return polynomial
+    return FieldVector(polynomial)
+
+
+class FieldVectorTest(unittest.TestCase):
+    def test_compatible_with_lists(self):
+        elements = [Fr.from_bytes(random.randbytes(32)) for _ in range(16)]
+        vector = FieldVector(elements)
+        self.assertEqual(len(vector), 16)
+        self.assertEqual(vector.to_list(), elements)
+        self.assertEqual(vector[3], elements[3])
+        vector[3] += Fr(1)
+        self.assertEqual(vector[3], elements[3] + Fr(1))
+        self.assertEqual(vector[1:4].to_list(), [elements[1], vector[2], vector[3]])
+        self.assertEqual(FieldVector.from_bytes(vector.to_bytes()), vector)
+        with self.assertRaises(ValueError):
+            FieldVector.from_bytes(b"\xff" * FF_BYTE_LENGTH)
+
+    def test_bulk_operations(self):
+        a = [Fr.from_bytes(random.randbytes(32)) for _ in range(8)]
+        b = [Fr.from_bytes(random.randbytes(32)) for _ in range(8)]
+        scalar = Fr.from_bytes(random.randbytes(32))
+        vector_a = FieldVector(a)
+        vector_b = FieldVector(b)
+        self.assertEqual((vector_a + vector_b).to_list(), [x + y for x, y in zip(a, b)])
+        self.assertEqual((vector_a - vector_b).to_list(), [x - y for x, y in zip(a, b)])
+        self.assertEqual((vector_a * vector_b).to_list(), [x * y for x, y in zip(a, b)])
+        self.assertEqual(vector_a.scale(scalar).to_list(), [x * scalar for x in a])
+        self.assertEqual(
+            vector_a.copy().add_scaled(vector_b, scalar).to_list(),
+            [x + y * scalar for x, y in zip(a, b)],
+        )
+        self.assertEqual(
+            vector_a.fold(scalar).to_list(),
+            [a[i] + (a[i + 1] - a[i]) * scalar for i in range(0, 8, 2)],
+        )
+        self.assertEqual(vector_a.copy().fold_in_place(scalar), vector_a.fold(scalar))
+        accumulator = vector_a.copy()
+        accumulator += vector_b[:3]
+        accumulator -= vector_b[:2]
+        self.assertEqual(accumulator.to_list(), a[:2] + [a[2] + b[2]] + a[3:])
+        quotient = vector_a.copy()
+        remainder = quotient.divide_by_linear(scalar)
+        self.assertEqual(remainder, vector_a.evaluate(scalar))
+        self.assertEqual(len(quotient), 7)
+        product = [Fr(0)] + quotient.to_list()
+        for i in range(7):
+            product[i] -= quotient[i] * scalar
+        product[0] += remainder
+        self.assertEqual(product, a)
+        self.assertEqual(
+            batch_divide_values(vector_a.values, vector_b.values),
+            [(x / y).value for x, y in zip(a, b)],
+        )
+        self.assertEqual(
+            batch_inverse_values([mpz(2), mpz(0), mpz(4)]),
+            [Fr(2).invert().value, 0, Fr(4).invert().value],
+        )
+        expected = Fr(0)
+        for x in reversed(a):
+            expected = expected * scalar + x
+        self.assertEqual(vector_a.evaluate(scalar), expected)
+        for vector in [vector_a, vector_a[:5], FieldVector()]:
+            self.assertEqual(
+                vector.evaluate_at_opposite_points(scalar),
+                (vector.evaluate(scalar), vector.evaluate(-scalar)),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
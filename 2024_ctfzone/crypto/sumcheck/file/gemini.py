@@ -1,5 +1,6 @@
 from transcript import ProverTranscript, VerifierTranscript, map_tuple_from_int_to_Fq
 from ff import Fr, Fq
+from field_vector import as_field_vector
 from kzg import KZG, batch_commitments, convert_to_working_point
 from polynomial import (
     evaluate_multilinear_polynomial,
@@ -9,6 +10,7 @@ from polynomial import (
     batch_polynomials,
 )
 from shplonk import ProverOpeningClaim, VerifierOpeningClaim
+from profiling import span
 import unittest
 
 
@@ -19,14 +21,19 @@ class GeminiProver:
         shifting_polynomials: list[list[Fr]],
         transcript: ProverTranscript,
         evaluation_point: list[Fr],
+        kzg: KZG = None,
     ) -> list[ProverOpeningClaim]:
-        self.original_polynomials = original_polynomials
-        self.shifting_polynomials = shifting_polynomials
+        self.original_polynomials = [
+            as_field_vector(polynomial) for polynomial in original_polynomials
+        ]
+        self.shifting_polynomials = [
+            as_field_vector(polynomial) for polynomial in shifting_polynomials
+        ]
         self.transcript = transcript
         self.evaluation_point = evaluation_point
         self.challenge_index = 0
         self.commitments = []
-        self.kzg = KZG()
+        self.kzg = kzg if kzg is not None else KZG()
         self.evaluations = []
         self.opening_claims = []
 
@@ -42,49 +49,51 @@ class GeminiProver:
             self.rho.pow(len(self.original_polynomials)),
         )
         assert pre_shift_batch[0] == Fr(0)
-        self.sequential_polynomials = [
-            list(
-                [
-                    non_shifted_batch[i]
-                    + pre_shift_batch[(i + 1) % len(non_shifted_batch)]
-                    for i in range(len(non_shifted_batch))
-                ]
-            )
-        ]
+        self.sequential_polynomials = [non_shifted_batch + pre_shift_batch.shifted()]
 
-        self.transcript.send_to_verifier(
-            map_tuple_from_int_to_Fq(self.kzg.commit(self.sequential_polynomials[0]))
-        )
-
-        # Compute partial evaluations of batched poly and commit to them
-        for i in range(len(self.evaluation_point)):
-            partially_evaluated = partially_evaluate_multilinear_polynomial(
-                self.sequential_polynomials[-1],
-                self.evaluation_point[self.challenge_index],
-            )
-            self.challenge_index += 1
-            self.sequential_polynomials.append(partially_evaluated)
-            partially_evaluated_commitment = self.kzg.commit(partially_evaluated)
-            self.transcript.send_to_verifier(
-                map_tuple_from_int_to_Fq(partially_evaluated_commitment)
-            )
+        with span("fold"):
+            # Compute every partial evaluation of the batched poly first, so
+            # that all of them are committed in one batch
+            for i in range(len(self.evaluation_point)):
+                self.sequential_polynomials.append(
+                    partially_evaluate_multilinear_polynomial(
+                        self.sequential_polynomials[-1],
+                        self.evaluation_point[self.challenge_index],
+                    )
+                )
+                self.challenge_index += 1
+        with span("batch_commit"):
+            commitments = self.kzg.commit_many(self.sequential_polynomials)
+        for commitment in commitments:
+            self.transcript.send_to_verifier(map_tuple_from_int_to_Fq(commitment))
 
         self.r = self.transcript.get_challenge()
         r = self.r
 
-        self.evaluations.append(evaluate_polynomial(non_shifted_batch, r))
+        # The batched poly is non_shifted_batch(X) + pre_shift_batch(X) / X, so
+        # its evaluations at r and -r follow from the ones of the two batches
+        (non_shifted_at_r, non_shifted_at_minus_r) = (
+            non_shifted_batch.evaluate_at_opposite_points(r)
+        )
+        (pre_shift_at_r, pre_shift_at_minus_r) = (
+            pre_shift_batch.evaluate_at_opposite_points(r)
+        )
+        r_inverse = r.invert()
+        self.evaluations.append(non_shifted_at_r)
         self.opening_claims.append(
             ProverOpeningClaim(non_shifted_batch, r, self.evaluations[-1])
         )
-        self.evaluations.append(evaluate_polynomial(pre_shift_batch, r))
+        self.evaluations.append(pre_shift_at_r)
         self.opening_claims.append(
             ProverOpeningClaim(pre_shift_batch, r, self.evaluations[-1])
         )
-        self.evaluations.append(evaluate_polynomial(self.sequential_polynomials[0], r))
+        self.evaluations.append(non_shifted_at_r + pre_shift_at_r * r_inverse)
         self.opening_claims.append(
             ProverOpeningClaim(self.sequential_polynomials[0], r, self.evaluations[-1])
         )
-        self.evaluations.append(evaluate_polynomial(self.sequential_polynomials[0], -r))
+        self.evaluations.append(
+            non_shifted_at_minus_r - pre_shift_at_minus_r * r_inverse
+        )
         self.opening_claims.append(
             ProverOpeningClaim(self.sequential_polynomials[0], -r, self.evaluations[-1])
         )
@@ -1,16 +1,30 @@
-from polynomial import batch_inverse
+from polynomial import batch_inverse, batch_divide
 from circuit import CircuitBuilder
-from ff import Fr, alt_bn128_r
+from ff import Fr, alt_bn128_r, mpz
+from field_vector import FieldVector, MODULUS
+from instance_file import InstanceFile, write_instance_file
 from collections import namedtuple
 from uint import Uint8
-from relations import PermutationConsequentRelationNoPublicInputs, RelationChallenges
+from relations import (
+    RelationChallenges,
+    PERMUTATION_GRAND_PRODUCT_TERMS,
+    LOOKUP_WIRE_ROW,
+    LOOKUP_INVERSE_DENOMINATOR,
+    evaluate_on_columns,
+)
 import random
 import unittest
 from proof_polynomials import *
 
+# Columns known before the first challenge, enough to rebuild an instance
+COMMITTED_INSTANCE_COLUMNS = AllPolynomials._fields[
+    : NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS + NUMBER_OF_INITIAL_WITNESS_POLYNOMIALS
+]
+
 
 def compute_permutation_mapping(circuit_builder: CircuitBuilder):
     num_gates = circuit_builder.get_num_gates()
+    real_variable_indices = circuit_builder.get_real_variable_indices()
     cycles = dict()
 
     def add_to_cycle(gate_index, polynomial_index, real_variable_index):
@@ -21,9 +35,9 @@ def compute_permutation_mapping(circuit_builder: CircuitBuilder):
 
     for i in range(num_gates):
         witness_indices = circuit_builder.witness_indices[i]
-        real_index_w_l = circuit_builder.real_variable_indices[witness_indices.w_l]
-        real_index_w_r = circuit_builder.real_variable_indices[witness_indices.w_r]
-        real_index_w_o = circuit_builder.real_variable_indices[witness_indices.w_o]
+        real_index_w_l = real_variable_indices[witness_indices.w_l]
+        real_index_w_r = real_variable_indices[witness_indices.w_r]
+        real_index_w_o = real_variable_indices[witness_indices.w_o]
         add_to_cycle(i, 0, real_index_w_l)
         add_to_cycle(i, 1, real_index_w_r)
         add_to_cycle(i, 2, real_index_w_o)
@@ -40,16 +54,133 @@ def compute_permutation_mapping(circuit_builder: CircuitBuilder):
 
 class Instance:
 
-    def __init__(self, circuit_builder, disable_lookup_multiplicity=False):
+    def __init__(
+        self, circuit_builder, disable_lookup_multiplicity=False, proving_key=None
+    ):
         self.builder = circuit_builder
         num_gates = circuit_builder.get_num_gates()
         num_table_rows = circuit_builder.get_num_table_rows()
         self.instance_size = max(num_gates, num_table_rows)
         instance_size = self.instance_size
-        self.all_polynomials = AllPolynomials(
-            *[[] for _ in range(NUMBER_OF_POLYNOMIALS)]
+        if proving_key is None:
+            self.all_polynomials = AllPolynomials(
+                *[FieldVector() for _ in range(NUMBER_OF_POLYNOMIALS)]
+            )
+            self.fill_fixed_polynomials()
+        else:
+            # Selectors, copy constraints and tables come precomputed
+            proving_key.check_circuit(circuit_builder)
+            self.all_polynomials = AllPolynomials(
+                *[polynomial.copy() for polynomial in proving_key.polynomials],
+                *[
+                    FieldVector()
+                    for _ in range(
+                        NUMBER_OF_POLYNOMIALS - NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS
+                    )
+                ],
+            )
+        self.lookup_dict = dict()
+        for i in range(num_table_rows):
+            self.lookup_dict[
+                tuple(
+                    map(
+                        lambda x: x.value,
+                        (
+                            self.all_polynomials.table_0[i],
+                            self.all_polynomials.table_1[i],
+                            self.all_polynomials.table_2[i],
+                            self.all_polynomials.table_3[i],
+                        ),
+                    )
+                )
+            ] = i
+
+        # Fill witnesses
+        for i in range(num_gates):
+            witness_indices = self.builder.witness_indices[i]
+            self.all_polynomials.w_l.append(
+                Fr(self.builder.get_variable_value(witness_indices.w_l))
+            )
+            self.all_polynomials.w_r.append(
+                Fr(self.builder.get_variable_value(witness_indices.w_r))
+            )
+            self.all_polynomials.w_o.append(
+                Fr(self.builder.get_variable_value(witness_indices.w_o))
+            )
+
+        for i in range(self.instance_size - num_gates):
+            self.all_polynomials.w_l.append(Fr(0))
+            self.all_polynomials.w_r.append(Fr(0))
+            self.all_polynomials.w_o.append(Fr(0))
+        self.all_polynomials.w_l_shift.extend(self.all_polynomials.w_l.shifted())
+        self.all_polynomials.w_r_shift.extend(self.all_polynomials.w_r.shifted())
+        self.all_polynomials.w_o_shift.extend(self.all_polynomials.w_o.shifted())
+        self.all_polynomials.table_multiplicity.extend(
+            FieldVector.zeros(self.instance_size)
         )
+        if not disable_lookup_multiplicity:
+            # Witness values are only used as lookup keys, so no challenges
+            lookup_wire_rows = evaluate_on_columns(
+                LOOKUP_WIRE_ROW, self.all_polynomials, RelationChallenges(Fr(0), Fr(0))
+            )
+            q_lookup = self.all_polynomials.q_lookup.values
+            table_multiplicity = self.all_polynomials.table_multiplicity.values
+            for i in range(num_gates):
+                if q_lookup[i] != 0:
+                    table_index = self.lookup_dict[
+                        tuple(terms[i] for terms in lookup_wire_rows)
+                    ]
+                    table_multiplicity[table_index] += 1
+
+    @staticmethod
+    def from_file(instance_file: InstanceFile):
+        """Rebuild an instance from the committed columns of an instance file
 
+        Fixed and witness columns are loaded whole from the file, the shifted
+        witnesses are derived from them. There is no circuit builder behind
+        such an instance.
+        """
+        instance = Instance.__new__(Instance)
+        instance.builder = None
+        instance.instance_size = instance_file.instance_size
+        for name in COMMITTED_INSTANCE_COLUMNS:
+            if name not in instance_file:
+                raise ValueError(f"Instance file has no column {name}")
+        instance.all_polynomials = AllPolynomials(
+            *[
+                (
+                    instance_file.load(name)
+                    if name in COMMITTED_INSTANCE_COLUMNS
+                    else FieldVector()
+                )
+                for name in AllPolynomials._fields
+            ]
+        )
+        instance.all_polynomials.w_l_shift.extend(instance.all_polynomials.w_l.shifted())
+        instance.all_polynomials.w_r_shift.extend(instance.all_polynomials.w_r.shifted())
+        instance.all_polynomials.w_o_shift.extend(instance.all_polynomials.w_o.shifted())
+        return instance
+
+    def save(self, filename, names=None):
+        """Write columns to an instance file, by default every filled one"""
+        if names is None:
+            names = [
+                name
+                for name in AllPolynomials._fields
+                if len(getattr(self.all_polynomials, name)) != 0
+            ]
+        write_instance_file(
+            filename,
+            self.instance_size,
+            [(name, getattr(self.all_polynomials, name)) for name in names],
+        )
+
+    def fill_fixed_polynomials(self):
+        """Lagrange, id, sigma, selector and table polynomials"""
+        circuit_builder = self.builder
+        num_gates = circuit_builder.get_num_gates()
+        num_table_rows = circuit_builder.get_num_table_rows()
+        instance_size = self.instance_size
         permutation_map = compute_permutation_mapping(circuit_builder)
         # Fill lagrange polynomials
         self.all_polynomials.lagrange_first.extend(
@@ -124,75 +255,12 @@ class Instance:
                 self.all_polynomials.table_1.append(Fr(a))
                 self.all_polynomials.table_2.append(Fr(b))
                 self.all_polynomials.table_3.append(Fr(c))
-        self.lookup_dict = dict()
-        for i in range(num_table_rows):
-            self.lookup_dict[
-                tuple(
-                    map(
-                        lambda x: x.value,
-                        (
-                            self.all_polynomials.table_0[i],
-                            self.all_polynomials.table_1[i],
-                            self.all_polynomials.table_2[i],
-                            self.all_polynomials.table_3[i],
-                        ),
-                    )
-                )
-            ] = i
         for i in range(self.instance_size - num_table_rows):
             self.all_polynomials.table_0.append(Fr(0))
             self.all_polynomials.table_1.append(Fr(0))
             self.all_polynomials.table_2.append(Fr(0))
             self.all_polynomials.table_3.append(Fr(0))
 
-        # Fill witnesses
-        for i in range(num_gates):
-            witness_indices = self.builder.witness_indices[i]
-            self.all_polynomials.w_l.append(
-                Fr(self.builder.get_variable_value(witness_indices.w_l))
-            )
-            self.all_polynomials.w_r.append(
-                Fr(self.builder.get_variable_value(witness_indices.w_r))
-            )
-            self.all_polynomials.w_o.append(
-                Fr(self.builder.get_variable_value(witness_indices.w_o))
-            )
-
-        for i in range(self.instance_size - num_gates):
-            self.all_polynomials.w_l.append(Fr(0))
-            self.all_polynomials.w_r.append(Fr(0))
-            self.all_polynomials.w_o.append(Fr(0))
-        self.all_polynomials.w_l_shift.extend(self.all_polynomials.w_l[1:] + [Fr(0)])
-        self.all_polynomials.w_r_shift.extend(self.all_polynomials.w_r[1:] + [Fr(0)])
-        self.all_polynomials.w_o_shift.extend(self.all_polynomials.w_o[1:] + [Fr(0)])
-        self.all_polynomials.table_multiplicity.extend(
-            [Fr(0) for _ in range(self.instance_size)]
-        )
-        if not disable_lookup_multiplicity:
-            for i in range(num_gates):
-                if self.all_polynomials.q_lookup[i] != Fr(0):
-                    self.all_polynomials.table_multiplicity[
-                        self.lookup_dict[
-                            tuple(
-                                map(
-                                    lambda x: x.value,
-                                    (
-                                        self.all_polynomials.q_m[i],
-                                        self.all_polynomials.w_l[i]
-                                        + self.all_polynomials.q_l[i]
-                                        * self.all_polynomials.w_l_shift[i],
-                                        self.all_polynomials.w_r[i]
-                                        + self.all_polynomials.q_r[i]
-                                        * self.all_polynomials.w_r_shift[i],
-                                        self.all_polynomials.w_o[i]
-                                        + self.all_polynomials.q_o[i]
-                                        * self.all_polynomials.w_o_shift[i],
-                                    ),
-                                )
-                            )
-                        ]
-                    ] += Fr(1)
-
     def generate_zeta_power_polynomial(self, zeta):
         current_power = Fr(1)
         for _ in range(self.instance_size):
@@ -200,66 +268,32 @@ class Instance:
             current_power *= zeta
 
     def generate_permutation_polynomial(self, beta, gamma):
-        numerators = [Fr(1)]
-        denominators = [Fr(1)]
-        permutation_relation = PermutationConsequentRelationNoPublicInputs(
-            RelationChallenges(beta, gamma)
+        (row_numerators, row_denominators) = evaluate_on_columns(
+            PERMUTATION_GRAND_PRODUCT_TERMS,
+            self.all_polynomials,
+            RelationChallenges(beta, gamma),
         )
-        for i in range(self.instance_size):
-            numerators.append(
-                numerators[-1]
-                * permutation_relation.compute_numerator(self.all_polynomials, i)
-            )
-            denominators.append(
-                denominators[-1]
-                * permutation_relation.compute_denominator(self.all_polynomials, i)
-            )
-        denominators = batch_inverse(denominators)
-
-        permutation_pre_polynomial = [a * b for (a, b) in zip(numerators, denominators)]
-        assert permutation_pre_polynomial[-1] == Fr(1)
+        numerators = [1]
+        denominators = [1]
+        for numerator, denominator in zip(row_numerators, row_denominators):
+            numerators.append(numerators[-1] * numerator % MODULUS)
+            denominators.append(denominators[-1] * denominator % MODULUS)
+        permutation_pre_polynomial = batch_divide(numerators, denominators).values
+        assert permutation_pre_polynomial[-1] == 1
         self.all_polynomials.permutation.extend(
-            [Fr(0)] + [Fr(x) for x in permutation_pre_polynomial[1:-1]]
+            FieldVector.from_values([mpz(0)] + permutation_pre_polynomial[1:-1])
         )
         self.all_polynomials.permutation_shift.extend(
-            [Fr(x) for x in permutation_pre_polynomial[1:-1]] + [Fr(0)]
+            FieldVector.from_values(permutation_pre_polynomial[1:-1] + [mpz(0)])
         )
 
-        ev = permutation_relation.evaluate(self.all_polynomials)
-
     def generate_logup_inverse_polynomial(self, beta, gamma):
-        numerators = []
-        beta_sqr = beta * beta
-        beta_cube = beta_sqr * beta
-        for i in range(self.instance_size):
-            numerator = (
-                gamma
-                + self.all_polynomials.q_m[i]
-                + (
-                    self.all_polynomials.w_l[i]
-                    + self.all_polynomials.q_l[i] * self.all_polynomials.w_l_shift[i]
-                )
-                * beta
-                + (
-                    self.all_polynomials.w_r[i]
-                    + self.all_polynomials.q_r[i] * self.all_polynomials.w_r_shift[i]
-                )
-                * beta_sqr
-                + (
-                    self.all_polynomials.w_o[i]
-                    + self.all_polynomials.q_o[i] * self.all_polynomials.w_o_shift[i]
-                )
-                * beta_cube
-            ) * (
-                gamma
-                + self.all_polynomials.table_0[i]
-                + self.all_polynomials.table_1[i] * beta
-                + self.all_polynomials.table_2[i] * beta_sqr
-                + self.all_polynomials.table_3[i] * beta_cube
-            )
-            numerators.append(numerator)
-        denominators = batch_inverse(numerators)
-        self.all_polynomials.log_inverse.extend(denominators)
+        (numerators,) = evaluate_on_columns(
+            LOOKUP_INVERSE_DENOMINATOR,
+            self.all_polynomials,
+            RelationChallenges(beta, gamma),
+        )
+        self.all_polynomials.log_inverse.extend(batch_inverse(numerators))
 
 
 class TestInstance(unittest.TestCase):
@@ -271,6 +305,50 @@ class TestInstance(unittest.TestCase):
         for a, b in zip(polynomial, inverse_polynomial):
             self.assertEqual(a * b, Fr(1))
 
+    def test_connected_variables_share_a_cycle(self):
+        cb = CircuitBuilder()
+        indices = [cb.add_variable(Fr(7)) for _ in range(6)]
+        for index in indices:
+            cb.create_constant_gate(index, 7)
+        # Merge two classes of three variables
+        cb.connect(indices[0], indices[1])
+        cb.connect(indices[2], indices[1])
+        cb.connect(indices[3], indices[4])
+        cb.connect(indices[5], indices[4])
+        cb.connect(indices[4], indices[0])
+        real_variable_indices = cb.get_real_variable_indices()
+        self.assertEqual(len({real_variable_indices[index] for index in indices}), 1)
+        permutation_map = compute_permutation_mapping(cb)
+        gates = [3 + i for i in range(6)]
+        cycle = [permutation_map[(gates[0], 0)]]
+        while cycle[-1] != (gates[0], 0):
+            cycle.append(permutation_map[cycle[-1]])
+        self.assertEqual(sorted(cycle), [(gate, 0) for gate in gates])
+
+        cb.connect(cb.zero_index, indices[2], False)
+        self.assertEqual(cb.get_variable_value(indices[5]), Fr(0))
+
+    def test_instance_file(self):
+        import os
+        import tempfile
+
+        cb = CircuitBuilder()
+        Uint8(cb, 0xFF) ^ Uint8(cb, 0xF)
+        instance = Instance(cb)
+        filename = os.path.join(tempfile.mkdtemp(), "instance.bin")
+        instance.save(filename)
+        with InstanceFile(filename) as instance_file:
+            restored = Instance.from_file(instance_file)
+        for name in AllPolynomials._fields:
+            self.assertEqual(
+                getattr(restored.all_polynomials, name),
+                getattr(instance.all_polynomials, name),
+            )
+        instance.save(filename, ["w_l"])
+        with InstanceFile(filename) as instance_file:
+            with self.assertRaises(ValueError):
+                Instance.from_file(instance_file)
+
     def test_polynomial_creation(self):
         cb = CircuitBuilder()
         a = Uint8(cb, 0xFF)
@@ -0,0 +1,141 @@
+from field_vector import FieldVector
+from proof_polynomials import AllPolynomials
+from ff import FF_BYTE_LENGTH
+import mmap
+import os
+import struct
+import tempfile
+import unittest
+
+INSTANCE_FILE_MAGIC = b"RONK_IN\x01"
+# Magic, instance size, number of columns
+HEADER_SIZE = len(INSTANCE_FILE_MAGIC) + 8
+# Rows read or written at a time when streaming a column
+STREAM_CHUNK_ROWS = 1 << 12
+
+
+def write_instance_file(filename, instance_size, named_columns):
+    """Store columns one after another as FF_BYTE_LENGTH little-endian limbs
+
+    named_columns is a list of (name, column) with names from AllPolynomials.
+    Columns are written chunk by chunk, so no copy of a whole column is made.
+    """
+    with open(filename, "wb") as f:
+        f.write(INSTANCE_FILE_MAGIC)
+        f.write(struct.pack("<II", instance_size, len(named_columns)))
+        for name, _ in named_columns:
+            f.write(struct.pack("<I", AllPolynomials._fields.index(name)))
+        for name, column in named_columns:
+            if len(column) != instance_size:
+                raise ValueError(f"Column {name} does not have {instance_size} rows")
+            for start in range(0, instance_size, STREAM_CHUNK_ROWS):
+                f.write(column[start : start + STREAM_CHUNK_ROWS].to_bytes())
+
+
+class InstanceFile:
+    """An instance file mapped into memory and decoded on demand
+
+    read and chunks decode only the rows asked for, load decodes a whole
+    column. The mapped pages read still count towards resident memory.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[: len(INSTANCE_FILE_MAGIC)] != INSTANCE_FILE_MAGIC:
+            raise ValueError("Instance file magic incorrect")
+        if len(self.buffer) < HEADER_SIZE:
+            raise ValueError("Malformed instance file")
+        (self.instance_size, column_count) = struct.unpack_from(
+            "<II", self.buffer, len(INSTANCE_FILE_MAGIC)
+        )
+        data_offset = HEADER_SIZE + 4 * column_count
+        column_size = self.instance_size * FF_BYTE_LENGTH
+        if len(self.buffer) != data_offset + column_count * column_size:
+            raise ValueError("Malformed instance file")
+        self.column_offsets = dict()
+        for i in range(column_count):
+            (field_index,) = struct.unpack_from("<I", self.buffer, HEADER_SIZE + 4 * i)
+            if field_index >= len(AllPolynomials._fields):
+                raise ValueError("Malformed instance file")
+            self.column_offsets[AllPolynomials._fields[field_index]] = (
+                data_offset + i * column_size
+            )
+
+    def __contains__(self, name):
+        return name in self.column_offsets
+
+    def names(self):
+        return list(self.column_offsets.keys())
+
+    def read(self, name, start, end):
+        """Rows start..end-1 of a column as a FieldVector"""
+        if name not in self.column_offsets:
+            raise KeyError(f"Instance file has no column {name}")
+        assert 0 <= start <= end <= self.instance_size
+        offset = self.column_offsets[name]
+        return FieldVector.from_bytes(
+            self.buffer[
+                offset + start * FF_BYTE_LENGTH : offset + end * FF_BYTE_LENGTH
+            ]
+        )
+
+    def load(self, name):
+        return self.read(name, 0, self.instance_size)
+
+    def chunks(self, names, chunk_rows=STREAM_CHUNK_ROWS):
+        """Yield (start, value lists of every named column) for each chunk"""
+        for start in range(0, self.instance_size, chunk_rows):
+            end = min(start + chunk_rows, self.instance_size)
+            yield (start, [self.read(name, start, end).values for name in names])
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class InstanceFileTest(unittest.TestCase):
+    def test_round_trip(self):
+        from instance import Instance
+        from testing_circuits import standard_xor_example
+
+        instance = Instance(standard_xor_example())
+        filename = os.path.join(tempfile.mkdtemp(), "instance.bin")
+        named_columns = [
+            (name, getattr(instance.all_polynomials, name))
+            for name in ("q_m", "w_l", "table_3")
+        ]
+        write_instance_file(filename, instance.instance_size, named_columns)
+        with InstanceFile(filename) as instance_file:
+            self.assertEqual(instance_file.instance_size, instance.instance_size)
+            self.assertEqual(instance_file.names(), ["q_m", "w_l", "table_3"])
+            for name, column in named_columns:
+                self.assertEqual(instance_file.load(name), column)
+            chunks = list(instance_file.chunks(["w_l"], 100))
+            self.assertEqual(chunks[1][0], 100)
+            self.assertEqual(
+                sum([values for _, (values,) in chunks], []),
+                instance.all_polynomials.w_l.values,
+            )
+            self.assertFalse("w_r" in instance_file)
+
+    def test_malformed_file_is_rejected(self):
+        filename = os.path.join(tempfile.mkdtemp(), "instance.bin")
+        write_instance_file(filename, 2, [("w_l", FieldVector([1, 2]))])
+        with open(filename, "rb") as f:
+            data = f.read()
+        for corrupted in [data[:-1], b"X" + data[1:], data[:-1] + b"\xff"]:
+            with open(filename, "wb") as f:
+                f.write(corrupted)
+            with self.assertRaises(ValueError):
+                InstanceFile(filename).load("w_l")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,17 +6,35 @@ from py_ecc.optimized_bn128.optimized_curve import (
     multiply,
     normalize,
     add,
+    neg,
     curve_order,
 )
-from py_ecc.optimized_bn128.optimized_pairing import pairing
 from py_ecc.fields import optimized_bn128_FQ, optimized_bn128_FQ2
-from srs_gen import load_from_file
+from srs_gen import SRS
 from ff import Fr, Fq
+from field_vector import as_field_vector
+from msm import (
+    pippenger_msm,
+    FixedBaseMSM,
+    ShortMSM,
+    SHORT_MSM_MAXIMUM_SIZE,
+    batch_to_affine,
+    from_py_ecc_point,
+    to_py_ecc_point,
+)
+from commitment_service import get_commitment_service, MINIMUM_PARALLEL_SIZE
+from pairing import PreparedG2, check_pairing_product
+from profiling import count, SCALAR_MULTIPLICATIONS
 from copy import deepcopy
+from collections import namedtuple
+from secrets import randbits
 
 import logging
 import os
-from multiprocessing import Pool
+
+# An opening reduced to the pairing equation e(left, G2) == e(right, tau * G2)
+KZGPairingClaim = namedtuple("KZGPairingClaim", ["left", "right"])
+BATCHING_SCALAR_BITS = 128
 
 
 def convert_to_working_point(commitment):
@@ -40,13 +58,17 @@ def convert_to_working_point(commitment):
 
 
 def batch_commitments(commitments, batching_scalar, starting_scalar=Fr(1)):
-    working_commitments = list(map(convert_to_working_point, commitments))
-    result = Z1
+    count(SCALAR_MULTIPLICATIONS, len(commitments))
+    points = [
+        from_py_ecc_point(convert_to_working_point(commitment))
+        for commitment in commitments
+    ]
+    scalars = []
     running_scalar = starting_scalar
-    for commitment in working_commitments:
-        result = add(result, multiply(commitment, running_scalar.value))
+    for _ in commitments:
+        scalars.append(running_scalar)
         running_scalar *= batching_scalar
-    return result
+    return to_py_ecc_point(pippenger_msm(scalars, points))
 
 
 def map_to_optimized_fq(elements):
@@ -58,92 +80,158 @@ def map_to_optimized_fq(elements):
     )
 
 
-def msm(scalars_and_points):
-    if len(scalars_and_points) == 0:
-        return Z1
-    first_pair = scalars_and_points[0]
-    start = multiply(
-        first_pair[1],
-        # G1,
-        first_pair[0].value,
-    )
-    for i in range(1, len(scalars_and_points)):
-        current_pair = scalars_and_points[i]
-        adder = multiply(
-            current_pair[1],
-            # G1,
-            current_pair[0].value,
-        )
+srs_cache = dict()
+
+
+def load_srs(srs_file):
+    """Map and validate an SRS file once per process"""
+    key = os.path.abspath(srs_file)
+    if key not in srs_cache:
+        srs_cache[key] = SRS(srs_file)
+    return srs_cache[key]
+
+
+prepared_g2_cache = dict()
+
 
-        start = add(start, adder)
-    return start
+def load_prepared_g2(srs_file):
+    """Miller loop lines of G2 and -tau * G2, computed once per SRS"""
+    key = os.path.abspath(srs_file)
+    if key not in prepared_g2_cache:
+        srs = load_srs(srs_file)
+        prepared_g2_cache[key] = (PreparedG2(G2), PreparedG2(neg(srs.g2)))
+    return prepared_g2_cache[key]
+
+
+short_msm_cache = dict()
+
+
+def load_short_msm(srs_file):
+    """Small multiples of the first SRS points, computed once per SRS"""
+    key = os.path.abspath(srs_file)
+    if key not in short_msm_cache:
+        srs = load_srs(srs_file)
+        size = min(SHORT_MSM_MAXIMUM_SIZE, len(srs))
+        short_msm_cache[key] = ShortMSM(srs.g1_points(0, size))
+    return short_msm_cache[key]
 
 
 class KZG:
-    def __init__(self, srs_file="./ronk_srs.bin"):
-        self.srs = load_from_file(srs_file)
-        self.srs_size = len(self.srs[0])
+    def __init__(
+        self,
+        srs_file="./ronk_srs.bin",
+        fixed_base_window_bits=None,
+        worker_count=None,
+    ):
+        self.srs_file = srs_file
+        self.srs = load_srs(srs_file)
+        self.srs_size = len(self.srs)
+        self.commitment_service = get_commitment_service(srs_file, worker_count)
         logging.log(logging.INFO, f"Loaded srs of size {self.srs_size}")
+        # Precomputing the windows of every SRS point costs a few seconds and
+        # a table of srs_size * 254 / window_bits points, so it is opt-in
+        self.fixed_base_msm = None
+        if fixed_base_window_bits is not None:
+            self.fixed_base_msm = FixedBaseMSM(
+                self.srs.g1_points(0, self.srs_size), fixed_base_window_bits
+            )
 
     def commit(self, polynomial):
-        work_chunks = []  # List of (scalar, srs_element) tuples
-        for i, scalar in enumerate(polynomial):
-            work_chunks.append((scalar, self.srs[0][i]))
-
-        cpu_count = os.cpu_count()
-        chunk_size = len(polynomial) // cpu_count
-        if chunk_size * cpu_count < len(polynomial):
-            chunk_size += 1
-        if len(polynomial) > cpu_count:
-            prepared_workloads = [
-                work_chunks[i : i + chunk_size]
-                for i in range(0, len(polynomial), chunk_size)
-            ]
-
-            with Pool(cpu_count) as p:
-                results = p.map(msm, prepared_workloads)
-            start = results[0]
-            for i in range(1, len(results)):
-                start = add(start, results[i])
-        else:
-            start = msm(work_chunks)
-        return normalize(start)
+        return self.commit_many([polynomial])[0]
+
+    def commit_many(self, polynomials):
+        """Commitments to several polynomials as one batch
+
+        Short polynomials share the precomputed multiples of the first SRS
+        points, long ones are sent to the workers together, and all results
+        are normalized with a single inversion.
+        """
+        results = [None] * len(polynomials)
+        long_indices = []
+        for i, polynomial in enumerate(polynomials):
+            assert len(polynomial) <= self.srs_size
+            count(SCALAR_MULTIPLICATIONS, len(polynomial))
+            if self.fixed_base_msm is not None:
+                results[i] = self.fixed_base_msm.msm(polynomial)
+            elif len(polynomial) <= SHORT_MSM_MAXIMUM_SIZE:
+                results[i] = load_short_msm(self.srs_file).msm(polynomial)
+            elif (
+                self.commitment_service.is_parallel()
+                and len(polynomial) >= MINIMUM_PARALLEL_SIZE
+            ):
+                long_indices.append(i)
+            else:
+                results[i] = pippenger_msm(
+                    polynomial, self.srs.g1_points(0, len(polynomial))
+                )
+        if long_indices:
+            long_results = self.commitment_service.commit_many(
+                [polynomials[i] for i in long_indices]
+            )
+            for i, result in zip(long_indices, long_results):
+                results[i] = result
+        # The point at infinity normalizes to (0, 0), as with py_ecc
+        return [
+            (optimized_bn128_FQ(0), optimized_bn128_FQ(0))
+            if point is None
+            else (optimized_bn128_FQ(point[0]), optimized_bn128_FQ(point[1]))
+            for point in batch_to_affine(results)
+        ]
 
     def open(self, polynomial, x):
-        running_power = Fr(1)
-        result = Fr(0)
-        for element in polynomial:
-            result += element * running_power
-            running_power *= x
-        current_remainder = polynomial[0] - result
-        quotient_polynomial = []
-        q_s = Fr(0)
-        for i in range(1, len(polynomial)):
-            multiplicand = -current_remainder / x
-            q_s += multiplicand
-            quotient_polynomial.append(multiplicand)
-            current_remainder = polynomial[i] - multiplicand
-        assert current_remainder == Fr(0)
+        quotient_polynomial = as_field_vector(polynomial).copy()
+        result = quotient_polynomial.divide_by_linear(x)
         return (x, result, self.commit(quotient_polynomial))
 
-    def verify(self, commitment, opening):
-        if len(commitment) == 2:
-            commitment = (commitment[0], commitment[1], optimized_bn128_FQ(1))
+    def reduce_opening(self, commitment, opening):
+        commitment = convert_to_working_point(commitment)
         (x, result, quotient_commitment) = opening
-        if len(quotient_commitment) == 2:
-            quotient_commitment = (
-                quotient_commitment[0],
-                quotient_commitment[1],
-                optimized_bn128_FQ(1),
+        quotient_commitment = convert_to_working_point(quotient_commitment)
+        # e(C - y * G1, G2) == e(W, (tau - x) * G2) moved to a fixed G2 side
+        left = add(
+            add(commitment, multiply(G1, curve_order - result.value)),
+            multiply(quotient_commitment, x.value),
+        )
+        return KZGPairingClaim(left, quotient_commitment)
+
+    def check_pairing_claims(self, claims, batching_scalars=None):
+        """Check all claims with one two-pairing product
+
+        The product is a single Miller loop over the lines of the fixed G2
+        points followed by one final exponentiation.
+
+        Several claims are combined with random scalars, so a false claim
+        makes the combined check fail except with negligible probability.
+        """
+        if len(claims) == 0:
+            return True
+        if len(claims) == 1 and batching_scalars is None:
+            (left, right) = claims[0]
+        else:
+            if batching_scalars is None:
+                batching_scalars = [
+                    randbits(BATCHING_SCALAR_BITS) for _ in range(len(claims))
+                ]
+            left = to_py_ecc_point(
+                pippenger_msm(
+                    batching_scalars,
+                    [from_py_ecc_point(claim.left) for claim in claims],
+                )
+            )
+            right = to_py_ecc_point(
+                pippenger_msm(
+                    batching_scalars,
+                    [from_py_ecc_point(claim.right) for claim in claims],
+                )
             )
-        left_side_g1 = add(commitment, multiply(G1, curve_order - result.value))
-        left_side_g2 = G2
-        right_side_g1 = quotient_commitment
-        right_side_g2 = add(self.srs[1], multiply(G2, curve_order - x.value))
-        return pairing(left_side_g2, left_side_g1) == pairing(
-            right_side_g2, right_side_g1
+        (prepared_g2, prepared_negated_tau_g2) = load_prepared_g2(self.srs_file)
+        return check_pairing_product(
+            [(prepared_g2, left), (prepared_negated_tau_g2, right)]
         )
 
+    def verify(self, commitment, opening):
+        return self.check_pairing_claims([self.reduce_opening(commitment, opening)])
+
 
 class TestKZGMethods(unittest.TestCase):
     def test_sub(self):
@@ -160,6 +248,52 @@ class TestKZGMethods(unittest.TestCase):
         proof = kzg.open(coeffs, Fr(1))
         self.assertTrue(kzg.verify(commitment, proof))
 
+    def test_commit_matches_naive_msm(self):
+        coeffs = [Fr.from_bytes(os.urandom(32)) for _ in range(20)]
+        kzg = KZG(fixed_base_window_bits=6)
+        expected = Z1
+        for i, scalar in enumerate(coeffs):
+            point = kzg.srs[i]
+            expected = add(expected, multiply(point, scalar.value))
+        expected = normalize(expected)
+        self.assertEqual(kzg.commit(coeffs), expected)
+        kzg.fixed_base_msm = None
+        self.assertEqual(kzg.commit(coeffs), expected)
+        self.assertEqual(KZG(worker_count=1).commit(coeffs), expected)
+
+    def test_commit_many(self):
+        kzg = KZG()
+        polynomials = [
+            [Fr.from_bytes(os.urandom(32)) for _ in range(size)]
+            for size in [100, 3, 64, 1]
+        ]
+        polynomials.append([Fr(0)] * 5)
+        expected = [
+            normalize(
+                to_py_ecc_point(
+                    pippenger_msm(polynomial, kzg.srs.g1_points(0, len(polynomial)))
+                )
+            )
+            for polynomial in polynomials
+        ]
+        self.assertEqual(kzg.commit_many(polynomials), expected)
+        self.assertEqual(KZG(worker_count=2).commit_many(polynomials), expected)
+
+    def test_batched_pairing_claims(self):
+        kzg = KZG()
+        claims = []
+        for i in range(3):
+            coeffs = [Fr.from_bytes(os.urandom(32)) for _ in range(8)]
+            opening = kzg.open(coeffs, Fr(i + 5))
+            claims.append(kzg.reduce_opening(kzg.commit(coeffs), opening))
+        self.assertTrue(kzg.check_pairing_claims(claims))
+        (x, result, quotient_commitment) = opening
+        wrong_claim = kzg.reduce_opening(
+            kzg.commit(coeffs), (x, result + Fr(1), quotient_commitment)
+        )
+        self.assertFalse(kzg.check_pairing_claims([wrong_claim]))
+        self.assertFalse(kzg.check_pairing_claims(claims + [wrong_claim]))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,369 @@
+from py_ecc.optimized_bn128.optimized_curve import (
+    G1,
+    Z1,
+    multiply,
+    add,
+    normalize,
+    curve_order,
+    field_modulus,
+)
+from py_ecc.fields import optimized_bn128_FQ
+import random
+import unittest
+
+# Points are handled as plain integers in Jacobian coordinates (X, Y, Z) with
+# x = X / Z^2, y = Y / Z^3. Bases are affine (x, y) pairs so that bucket
+# accumulation can use mixed additions.
+
+P = field_modulus
+SCALAR_BITS = curve_order.bit_length()
+INFINITY = (1, 1, 0)
+# Up to this many bases, ShortMSM beats the bucket method: it needs no bucket
+# reduction per window, which dominates when there are few points
+SHORT_MSM_MAXIMUM_SIZE = 64
+SHORT_MSM_WINDOW_BITS = 4
+
+
+def jacobian_double(point):
+    (x, y, z) = point
+    if z == 0 or y == 0:
+        return INFINITY
+    a = x * x % P
+    b = y * y % P
+    c = b * b % P
+    d = 2 * ((x + b) * (x + b) - a - c) % P
+    e = 3 * a % P
+    f = e * e % P
+    new_x = (f - 2 * d) % P
+    new_y = (e * (d - new_x) - 8 * c) % P
+    new_z = 2 * y * z % P
+    return (new_x, new_y, new_z)
+
+
+def jacobian_add_affine(point, affine):
+    (x1, y1, z1) = point
+    (x2, y2) = affine
+    if z1 == 0:
+        return (x2, y2, 1)
+    z1z1 = z1 * z1 % P
+    u2 = x2 * z1z1 % P
+    s2 = y2 * z1 * z1z1 % P
+    h = (u2 - x1) % P
+    r = 2 * (s2 - y1) % P
+    if h == 0:
+        if r == 0:
+            return jacobian_double(point)
+        return INFINITY
+    hh = h * h % P
+    i = 4 * hh % P
+    j = h * i % P
+    v = x1 * i % P
+    new_x = (r * r - j - 2 * v) % P
+    new_y = (r * (v - new_x) - 2 * y1 * j) % P
+    new_z = ((z1 + h) * (z1 + h) - z1z1 - hh) % P
+    return (new_x, new_y, new_z)
+
+
+def jacobian_add(p1, p2):
+    (x1, y1, z1) = p1
+    (x2, y2, z2) = p2
+    if z1 == 0:
+        return p2
+    if z2 == 0:
+        return p1
+    z1z1 = z1 * z1 % P
+    z2z2 = z2 * z2 % P
+    u1 = x1 * z2z2 % P
+    u2 = x2 * z1z1 % P
+    s1 = y1 * z2 * z2z2 % P
+    s2 = y2 * z1 * z1z1 % P
+    h = (u2 - u1) % P
+    r = 2 * (s2 - s1) % P
+    if h == 0:
+        if r == 0:
+            return jacobian_double(p1)
+        return INFINITY
+    i = 4 * h * h % P
+    j = h * i % P
+    v = u1 * i % P
+    new_x = (r * r - j - 2 * v) % P
+    new_y = (r * (v - new_x) - 2 * s1 * j) % P
+    new_z = ((z1 + z2) * (z1 + z2) - z1z1 - z2z2) * h % P
+    return (new_x, new_y, new_z)
+
+
+def batch_to_affine(points):
+    """Convert Jacobian points to affine with a single field inversion"""
+    products = [1]
+    for point in points:
+        products.append(products[-1] * (point[2] if point[2] != 0 else 1) % P)
+    running_inverse = pow(products[-1], P - 2, P)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        (x, y, z) = points[i]
+        if z == 0:
+            continue
+        z_inverse = running_inverse * products[i] % P
+        running_inverse = running_inverse * z % P
+        z_inverse_squared = z_inverse * z_inverse % P
+        result[i] = (x * z_inverse_squared % P, y * z_inverse_squared * z_inverse % P)
+    return result
+
+
+def from_py_ecc_point(point):
+    """Affine integer pair from a py_ecc point (projective or already affine)"""
+    if len(point) == 3:
+        if point[2] == optimized_bn128_FQ(0):
+            return None
+        point = normalize(point)
+    return (int(point[0]), int(point[1]))
+
+
+def to_py_ecc_point(point):
+    """Homogeneous projective py_ecc point from a Jacobian integer triple"""
+    (x, y, z) = point
+    if z == 0:
+        return Z1
+    return (
+        optimized_bn128_FQ(x * z),
+        optimized_bn128_FQ(y),
+        optimized_bn128_FQ(z * z * z),
+    )
+
+
+def reduce_buckets(buckets):
+    """Sum of index * bucket over all buckets via the running-sum trick"""
+    running_sum = INFINITY
+    window_sum = INFINITY
+    for i in range(len(buckets) - 1, 0, -1):
+        if buckets[i] is not None:
+            running_sum = jacobian_add(running_sum, buckets[i])
+        window_sum = jacobian_add(window_sum, running_sum)
+    return window_sum
+
+
+def accumulate_into_buckets(buckets, digit, affine):
+    bucket = buckets[digit]
+    if bucket is None:
+        buckets[digit] = (affine[0], affine[1], 1)
+    else:
+        buckets[digit] = jacobian_add_affine(bucket, affine)
+
+
+def optimal_window_bits(point_count, fixed_base=False):
+    """Window size minimising the number of group additions"""
+    best_bits = 1
+    best_cost = None
+    for bits in range(1, 17):
+        window_count = (SCALAR_BITS + bits - 1) // bits
+        if fixed_base:
+            cost = window_count * point_count + 2 * (1 << bits)
+        else:
+            cost = window_count * (point_count + 2 * (1 << bits)) + SCALAR_BITS
+        if best_cost is None or cost < best_cost:
+            best_bits = bits
+            best_cost = cost
+    return best_bits
+
+
+def pippenger_msm(scalars, points, window_bits=None):
+    """Σ scalars[i] * points[i] with the bucket method
+
+    scalars are integers or field elements, points are affine integer pairs
+    (None for the point at infinity). Returns a Jacobian integer triple.
+    """
+    assert len(scalars) == len(points)
+    pairs = []
+    for scalar, point in zip(scalars, points):
+        scalar = int(scalar if type(scalar) == int else scalar.value) % curve_order
+        if scalar != 0 and point is not None:
+            pairs.append((scalar, point))
+    if len(pairs) == 0:
+        return INFINITY
+    if window_bits is None:
+        window_bits = optimal_window_bits(len(pairs))
+    mask = (1 << window_bits) - 1
+    window_count = (SCALAR_BITS + window_bits - 1) // window_bits
+    result = INFINITY
+    for window in range(window_count - 1, -1, -1):
+        for _ in range(window_bits):
+            result = jacobian_double(result)
+        shift = window * window_bits
+        buckets = [None] * (1 << window_bits)
+        for scalar, point in pairs:
+            digit = (scalar >> shift) & mask
+            if digit != 0:
+                accumulate_into_buckets(buckets, digit, point)
+        result = jacobian_add(result, reduce_buckets(buckets))
+    return result
+
+
+class FixedBaseMSM:
+    """MSM over a fixed list of bases with per-window multiples precomputed
+
+    For every base the points 2^(window_bits * j) * base are stored in affine
+    form, so a multi-scalar multiplication becomes a single pass of mixed
+    additions into one set of buckets with no doublings at all.
+    """
+
+    def __init__(self, points, window_bits=None):
+        if window_bits is None:
+            window_bits = optimal_window_bits(len(points), fixed_base=True)
+        self.window_bits = window_bits
+        self.window_count = (SCALAR_BITS + window_bits - 1) // window_bits
+        multiples = []
+        for point in points:
+            if point is None:
+                multiples.extend([INFINITY] * self.window_count)
+                continue
+            current = (point[0], point[1], 1)
+            for _ in range(self.window_count):
+                multiples.append(current)
+                for _ in range(window_bits):
+                    current = jacobian_double(current)
+        affine_multiples = batch_to_affine(multiples)
+        self.tables = [
+            affine_multiples[i : i + self.window_count]
+            for i in range(0, len(affine_multiples), self.window_count)
+        ]
+
+    def __len__(self):
+        return len(self.tables)
+
+    def msm(self, scalars, offset=0):
+        """Σ scalars[i] * bases[offset + i], as a Jacobian integer triple"""
+        assert offset + len(scalars) <= len(self.tables)
+        window_bits = self.window_bits
+        mask = (1 << window_bits) - 1
+        buckets = [None] * (1 << window_bits)
+        for scalar, table in zip(scalars, self.tables[offset:]):
+            scalar = int(scalar if type(scalar) == int else scalar.value) % curve_order
+            window = 0
+            while scalar != 0:
+                digit = scalar & mask
+                if digit != 0 and table[window] is not None:
+                    accumulate_into_buckets(buckets, digit, table[window])
+                scalar >>= window_bits
+                window += 1
+        return reduce_buckets(buckets)
+
+
+class ShortMSM:
+    """MSM over a prefix of fixed bases by interleaved windowed double-and-add
+
+    For every base the multiples 1 .. 2^window_bits - 1 are stored in affine
+    form. All bases share one chain of doublings and every non-zero digit is a
+    single mixed addition, so short vectors do not pay for bucket reduction.
+    """
+
+    def __init__(self, points, window_bits=SHORT_MSM_WINDOW_BITS):
+        self.window_bits = window_bits
+        table_size = (1 << window_bits) - 1
+        multiples = []
+        for point in points:
+            if point is None:
+                multiples.extend([INFINITY] * table_size)
+                continue
+            current = (point[0], point[1], 1)
+            for _ in range(table_size):
+                multiples.append(current)
+                current = jacobian_add_affine(current, point)
+        affine_multiples = batch_to_affine(multiples)
+        self.tables = [
+            affine_multiples[i : i + table_size]
+            for i in range(0, len(affine_multiples), table_size)
+        ]
+
+    def __len__(self):
+        return len(self.tables)
+
+    def msm(self, scalars):
+        """Σ scalars[i] * bases[i], as a Jacobian integer triple"""
+        assert len(scalars) <= len(self.tables)
+        window_bits = self.window_bits
+        mask = (1 << window_bits) - 1
+        pairs = []
+        for scalar, table in zip(scalars, self.tables):
+            scalar = int(scalar if type(scalar) == int else scalar.value) % curve_order
+            if scalar != 0:
+                pairs.append((scalar, table))
+        if len(pairs) == 0:
+            return INFINITY
+        top_bits = max(scalar.bit_length() for scalar, _ in pairs)
+        result = INFINITY
+        for window in range((top_bits - 1) // window_bits, -1, -1):
+            for _ in range(window_bits):
+                result = jacobian_double(result)
+            shift = window * window_bits
+            for scalar, table in pairs:
+                digit = (scalar >> shift) & mask
+                if digit != 0 and table[digit - 1] is not None:
+                    result = jacobian_add_affine(result, table[digit - 1])
+        return result
+
+
+class MSMTest(unittest.TestCase):
+    def setUp(self):
+        self.points = [
+            from_py_ecc_point(multiply(G1, random.randrange(1, curve_order)))
+            for _ in range(12)
+        ]
+        self.scalars = [random.randrange(curve_order) for _ in range(12)]
+        self.scalars[3] = 0
+        self.scalars[5] = 1
+        expected = Z1
+        for scalar, point in zip(self.scalars, self.points):
+            expected = add(
+                expected,
+                multiply(
+                    (
+                        optimized_bn128_FQ(point[0]),
+                        optimized_bn128_FQ(point[1]),
+                        optimized_bn128_FQ(1),
+                    ),
+                    scalar,
+                ),
+            )
+        self.expected = normalize(expected)
+
+    def test_pippenger(self):
+        for window_bits in [None, 1, 3, 7]:
+            result = pippenger_msm(self.scalars, self.points, window_bits)
+            self.assertEqual(normalize(to_py_ecc_point(result)), self.expected)
+
+    def test_fixed_base(self):
+        fixed_base = FixedBaseMSM(self.points, 5)
+        result = fixed_base.msm(self.scalars)
+        self.assertEqual(normalize(to_py_ecc_point(result)), self.expected)
+        partial = fixed_base.msm(self.scalars[4:], 4)
+        direct = pippenger_msm(self.scalars[4:], self.points[4:])
+        self.assertEqual(
+            normalize(to_py_ecc_point(partial)), normalize(to_py_ecc_point(direct))
+        )
+
+    def test_short(self):
+        short = ShortMSM(self.points[:10] + [None] + self.points[10:])
+        scalars = self.scalars[:10] + [5] + self.scalars[10:]
+        result = short.msm(scalars)
+        self.assertEqual(normalize(to_py_ecc_point(result)), self.expected)
+        self.assertEqual(short.msm([0, 0]), INFINITY)
+        self.assertEqual(
+            normalize(to_py_ecc_point(short.msm(self.scalars[:3]))),
+            normalize(to_py_ecc_point(pippenger_msm(self.scalars[:3], self.points[:3]))),
+        )
+
+    def test_edge_cases(self):
+        self.assertEqual(pippenger_msm([], []), INFINITY)
+        self.assertEqual(pippenger_msm([0, 0], self.points[:2]), INFINITY)
+        point = self.points[0]
+        negated = (point[0], (-point[1]) % P)
+        self.assertEqual(pippenger_msm([1, 1], [point, negated])[2], 0)
+        doubled = pippenger_msm([1, 1], [point, point])
+        self.assertEqual(
+            normalize(to_py_ecc_point(doubled)),
+            normalize(to_py_ecc_point(jacobian_double((point[0], point[1], 1)))),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,280 @@
+from ff import alt_bn128_r, mpz
+from field_vector import batch_inverse_values
+from functools import lru_cache
+import random
+import unittest
+
+# Everything here works on lists of integers reduced modulo alt_bn128_r,
+# coefficients stored from the lowest degree up.
+
+MODULUS = mpz(alt_bn128_r)
+# alt_bn128_r - 1 = 2^28 * odd, and 5 generates the multiplicative group
+TWO_ADICITY = 28
+MULTIPLICATIVE_GENERATOR = 5
+
+# Below these sizes the quadratic algorithms are faster in Python
+SCHOOLBOOK_MULTIPLICATION_THRESHOLD = 32
+SCHOOLBOOK_DIVISION_THRESHOLD = 64
+DIRECT_EVALUATION_THRESHOLD = 16
+
+
+@lru_cache(maxsize=None)
+def root_of_unity(log_size):
+    assert log_size <= TWO_ADICITY
+    return pow(
+        mpz(MULTIPLICATIVE_GENERATOR), (MODULUS - 1) >> log_size, MODULUS
+    )
+
+
+@lru_cache(maxsize=None)
+def twiddle_table(log_size, inverse=False):
+    """Powers ω^0..ω^(n/2 - 1) of the 2^log_size-th root of unity (or its inverse)"""
+    root = root_of_unity(log_size)
+    if inverse:
+        root = pow(root, MODULUS - 2, MODULUS)
+    table = [mpz(1)]
+    for _ in range((1 << log_size) // 2 - 1):
+        table.append(table[-1] * root % MODULUS)
+    return table
+
+
+def ntt(values, inverse=False):
+    """Evaluations on the 2^k-th roots of unity (or coefficients from them)"""
+    n = len(values)
+    log_size = n.bit_length() - 1
+    assert n == 1 << log_size
+    result = [mpz(value) % MODULUS for value in values]
+    # Bit-reversal permutation
+    j = 0
+    for i in range(1, n):
+        bit = n >> 1
+        while j & bit:
+            j ^= bit
+            bit >>= 1
+        j |= bit
+        if i < j:
+            result[i], result[j] = result[j], result[i]
+    table = twiddle_table(log_size, inverse)
+    length = 2
+    while length <= n:
+        half = length // 2
+        step = n // length
+        twiddles = table[::step][:half]
+        for start in range(0, n, length):
+            for j in range(half):
+                u = result[start + j]
+                v = result[start + j + half] * twiddles[j] % MODULUS
+                result[start + j] = (u + v) % MODULUS
+                result[start + j + half] = (u - v) % MODULUS
+        length <<= 1
+    if inverse:
+        n_inverse = pow(mpz(n), MODULUS - 2, MODULUS)
+        result = [value * n_inverse % MODULUS for value in result]
+    return result
+
+
+def trim(polynomial):
+    while len(polynomial) > 1 and polynomial[-1] == 0:
+        polynomial.pop()
+    return polynomial
+
+
+def multiply_polynomials(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return []
+    result_length = len(a) + len(b) - 1
+    if min(len(a), len(b)) <= SCHOOLBOOK_MULTIPLICATION_THRESHOLD:
+        result = [mpz(0)] * result_length
+        for i, x in enumerate(a):
+            if x == 0:
+                continue
+            for j, y in enumerate(b):
+                result[i + j] += x * y
+        return [value % MODULUS for value in result]
+    size = 1 << (result_length - 1).bit_length()
+    a_evaluations = ntt(list(a) + [0] * (size - len(a)))
+    b_evaluations = ntt(list(b) + [0] * (size - len(b)))
+    product = ntt(
+        [x * y % MODULUS for x, y in zip(a_evaluations, b_evaluations)], inverse=True
+    )
+    return product[:result_length]
+
+
+def inverse_series(polynomial, length):
+    """1 / polynomial mod x^length via Newton iteration"""
+    assert polynomial[0] % MODULUS != 0
+    inverse = [pow(mpz(polynomial[0]), MODULUS - 2, MODULUS)]
+    precision = 1
+    while precision < length:
+        precision = min(2 * precision, length)
+        correction = multiply_polynomials(polynomial[:precision], inverse)[:precision]
+        correction = [(-value) % MODULUS for value in correction]
+        correction[0] = (correction[0] + 2) % MODULUS
+        inverse = multiply_polynomials(inverse, correction)[:precision]
+    return inverse
+
+
+def divide_polynomials(dividend, divisor):
+    """(quotient, remainder) of dividend / divisor"""
+    dividend = trim([mpz(value) % MODULUS for value in dividend])
+    divisor = trim([mpz(value) % MODULUS for value in divisor])
+    assert divisor[-1] != 0
+    if len(dividend) < len(divisor):
+        return ([mpz(0)], dividend)
+    quotient_length = len(dividend) - len(divisor) + 1
+    if len(divisor) <= SCHOOLBOOK_DIVISION_THRESHOLD or quotient_length <= 4:
+        remainder = list(dividend)
+        leading_inverse = pow(divisor[-1], MODULUS - 2, MODULUS)
+        quotient = [mpz(0)] * quotient_length
+        for i in range(quotient_length - 1, -1, -1):
+            coefficient = remainder[i + len(divisor) - 1] * leading_inverse % MODULUS
+            quotient[i] = coefficient
+            if coefficient != 0:
+                for j, value in enumerate(divisor):
+                    remainder[i + j] = (remainder[i + j] - coefficient * value) % MODULUS
+        return (quotient, trim(remainder[: len(divisor) - 1] or [mpz(0)]))
+    reversed_quotient = multiply_polynomials(
+        dividend[::-1][:quotient_length],
+        inverse_series(divisor[::-1], quotient_length),
+    )[:quotient_length]
+    quotient = reversed_quotient[::-1]
+    product = multiply_polynomials(divisor, quotient)
+    remainder = [
+        (dividend[i] - product[i]) % MODULUS for i in range(len(divisor) - 1)
+    ]
+    return (quotient, trim(remainder or [mpz(0)]))
+
+
+class SubproductTree:
+    """Products of (x - point) over every node of a balanced binary tree"""
+
+    def __init__(self, points):
+        self.points = [mpz(point) % MODULUS for point in points]
+        assert len(self.points) > 0
+        self.root = self.build(0, len(self.points))
+
+    def build(self, start, end):
+        if end - start == 1:
+            return ([(-self.points[start]) % MODULUS, mpz(1)], start, end, None, None)
+        middle = (start + end) // 2
+        left = self.build(start, middle)
+        right = self.build(middle, end)
+        return (multiply_polynomials(left[0], right[0]), start, end, left, right)
+
+    def vanishing_polynomial(self):
+        return self.root[0]
+
+
+def evaluate_values(polynomial, point):
+    result = mpz(0)
+    for coefficient in reversed(polynomial):
+        result = (result * point + coefficient) % MODULUS
+    return result
+
+
+def evaluate_down_tree(polynomial, node, points, result):
+    (_, start, end, left, right) = node
+    if end - start <= DIRECT_EVALUATION_THRESHOLD or left is None:
+        for i in range(start, end):
+            result[i] = evaluate_values(polynomial, points[i])
+        return
+    for child in [left, right]:
+        (_, remainder) = divide_polynomials(polynomial, child[0])
+        evaluate_down_tree(remainder, child, points, result)
+
+
+def multipoint_evaluate(polynomial, points, tree=None):
+    if len(points) == 0:
+        return []
+    if tree is None:
+        tree = SubproductTree(points)
+    polynomial = [mpz(value) % MODULUS for value in polynomial] or [mpz(0)]
+    result = [mpz(0)] * len(tree.points)
+    (_, remainder) = divide_polynomials(polynomial, tree.vanishing_polynomial())
+    evaluate_down_tree(remainder, tree.root, tree.points, result)
+    return result
+
+
+def combine_up_tree(node, weights):
+    (_, start, end, left, right) = node
+    if left is None:
+        return [weights[start]]
+    left_combination = combine_up_tree(left, weights)
+    right_combination = combine_up_tree(right, weights)
+    left_product = multiply_polynomials(left_combination, right[0])
+    right_product = multiply_polynomials(right_combination, left[0])
+    length = max(len(left_product), len(right_product))
+    left_product += [mpz(0)] * (length - len(left_product))
+    right_product += [mpz(0)] * (length - len(right_product))
+    return [(x + y) % MODULUS for x, y in zip(left_product, right_product)]
+
+
+def interpolate(points, values):
+    """Coefficients of the polynomial of degree < n through (points[i], values[i])"""
+    assert len(points) == len(values) and len(points) > 0
+    tree = SubproductTree(points)
+    vanishing_polynomial = tree.vanishing_polynomial()
+    derivative = [
+        i * coefficient % MODULUS
+        for i, coefficient in enumerate(vanishing_polynomial)
+    ][1:]
+    denominators = multipoint_evaluate(derivative, points, tree)
+    assert all(denominator != 0 for denominator in denominators), "repeated points"
+    weights = [
+        mpz(value) % MODULUS * inverse % MODULUS
+        for value, inverse in zip(values, batch_inverse_values(denominators))
+    ]
+    result = combine_up_tree(tree.root, weights)
+    return result + [mpz(0)] * (len(points) - len(result))
+
+
+class NTTTest(unittest.TestCase):
+    def random_values(self, length):
+        return [mpz(random.randrange(alt_bn128_r)) for _ in range(length)]
+
+    def test_roots_of_unity(self):
+        for log_size in [1, 5, TWO_ADICITY]:
+            root = root_of_unity(log_size)
+            self.assertEqual(pow(root, 1 << log_size, MODULUS), 1)
+            self.assertEqual(pow(root, 1 << (log_size - 1), MODULUS), MODULUS - 1)
+
+    def test_ntt_round_trip(self):
+        values = self.random_values(64)
+        evaluations = ntt(values)
+        root = root_of_unity(6)
+        self.assertEqual(evaluations[3], evaluate_values(values, pow(root, 3, MODULUS)))
+        self.assertEqual(ntt(evaluations, inverse=True), values)
+
+    def test_multiplication_and_division(self):
+        a = self.random_values(150)
+        b = self.random_values(90)
+        product = multiply_polynomials(a, b)
+        point = mpz(random.randrange(alt_bn128_r))
+        self.assertEqual(
+            evaluate_values(product, point),
+            evaluate_values(a, point) * evaluate_values(b, point) % MODULUS,
+        )
+        remainder = self.random_values(60)
+        dividend = [
+            (x + y) % MODULUS for x, y in zip(product, remainder + [0] * len(product))
+        ]
+        self.assertEqual(divide_polynomials(dividend, b), (a, remainder))
+        small_divisor = self.random_values(3)
+        (quotient, small_remainder) = divide_polynomials(a, small_divisor)
+        check = multiply_polynomials(quotient, small_divisor)
+        check = [(x + y) % MODULUS for x, y in zip(check, small_remainder + [0] * 200)]
+        self.assertEqual(check, a)
+
+    def test_multipoint_evaluation_and_interpolation(self):
+        polynomial = self.random_values(100)
+        points = self.random_values(100)
+        evaluations = multipoint_evaluate(polynomial, points)
+        self.assertEqual(
+            evaluations, [evaluate_values(polynomial, point) for point in points]
+        )
+        self.assertEqual(interpolate(points, evaluations), polynomial)
+        self.assertEqual(interpolate([mpz(i) for i in range(3)], [1, 1, 1]), [1, 0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+from py_ecc.optimized_bn128.optimized_curve import (
+    G1,
+    G2,
+    b,
+    add,
+    double,
+    neg,
+    multiply,
+    normalize,
+    is_on_curve,
+    twist,
+    curve_order,
+)
+from py_ecc.optimized_bn128.optimized_pairing import (
+    pseudo_binary_encoding,
+    field_modulus,
+    final_exponentiate,
+    miller_loop,
+    cast_point_to_fq12,
+)
+from py_ecc.fields import optimized_bn128_FQ12 as FQ12
+from profiling import count, PAIRINGS, FINAL_EXPONENTIATIONS
+import random
+import unittest
+
+# The line through two points of the twisted G2 orbit, evaluated at a G1
+# point (x : y : z), is A * x + B * y + C * z over a denominator D * z. With
+# G2 fixed, A, B, C and D are constants of FQ12, so the Miller loop only
+# needs the line constants. With affine G1 points z = 1, so the whole
+# denominator of the loop does not depend on the G1 point at all.
+
+
+def line_coefficients(p1, p2):
+    """(A, B, C, D) of the line through p1 and p2, following py_ecc's linefunc"""
+    (x1, y1, z1) = p1
+    (x2, y2, z2) = p2
+    zero = x1.zero()
+    numerator = y2 * z1 - y1 * z2
+    denominator = x2 * z1 - x1 * z2
+    if denominator == zero:
+        if numerator != zero:
+            # Vertical line: x * z1 - x1 * z
+            return (z1, zero, -x1, z1)
+        # Tangent line
+        numerator = 3 * x1 * x1
+        denominator = 2 * y1 * z1
+    # numerator * (x * z1 - x1 * z) - denominator * (y * z1 - y1 * z)
+    return (
+        numerator * z1,
+        -denominator * z1,
+        denominator * y1 - numerator * x1,
+        denominator * z1,
+    )
+
+
+class PreparedG2:
+    """Line constants of the Miller loop for one fixed G2 point"""
+
+    def __init__(self, point):
+        q = twist(point)
+        r = q
+        negated_q = neg(q)
+        # For every loop iteration: the doubling line and, if the pseudo
+        # binary digit is not zero, the addition line
+        self.steps = []
+        denominator = FQ12.one()
+        for digit in pseudo_binary_encoding[63::-1]:
+            (a, b_, c, d) = line_coefficients(r, r)
+            denominator = denominator * denominator * d
+            r = double(r)
+            addition_line = None
+            if digit != 0:
+                addend = q if digit == 1 else negated_q
+                (a2, b2, c2, d2) = line_coefficients(r, addend)
+                denominator = denominator * d2
+                addition_line = (a2, b2, c2)
+                r = add(r, addend)
+            self.steps.append(((a, b_, c), addition_line))
+        q1 = tuple(coordinate**field_modulus for coordinate in q)
+        negated_q2 = (
+            q1[0] ** field_modulus,
+            -(q1[1] ** field_modulus),
+            q1[2] ** field_modulus,
+        )
+        (a1, b1, c1, d1) = line_coefficients(r, q1)
+        r = add(r, q1)
+        (a2, b2, c2, d2) = line_coefficients(r, negated_q2)
+        self.final_lines = [(a1, b1, c1), (a2, b2, c2)]
+        self.denominator_inverse = (denominator * d1 * d2).inv()
+
+
+def evaluate_line(line, x, y):
+    (a, b_, c) = line
+    return a * x + b_ * y + c
+
+
+def multi_miller_loop(pairs):
+    """Π miller_loop(Q_i, P_i) for (PreparedG2, G1 point) pairs, sharing squarings
+
+    G1 points are py_ecc projective points. Pairs with the point at infinity
+    contribute a factor of one, like in py_ecc's pairing.
+    """
+    affine_pairs = []
+    for prepared, point in pairs:
+        if point[2] == point[2].zero():
+            continue
+        if not is_on_curve(point, b):
+            raise ValueError("Invalid input - point P is not on the correct curves")
+        (x, y) = normalize(point)
+        affine_pairs.append((prepared, x.n, y.n))
+    count(PAIRINGS, len(affine_pairs))
+    result = FQ12.one()
+    if len(affine_pairs) == 0:
+        return result
+    for step in range(len(affine_pairs[0][0].steps)):
+        result = result * result
+        for prepared, x, y in affine_pairs:
+            (doubling_line, addition_line) = prepared.steps[step]
+            result = result * evaluate_line(doubling_line, x, y)
+            if addition_line is not None:
+                result = result * evaluate_line(addition_line, x, y)
+    for prepared, x, y in affine_pairs:
+        for line in prepared.final_lines:
+            result = result * evaluate_line(line, x, y)
+        result = result * prepared.denominator_inverse
+    return result
+
+
+def check_pairing_product(pairs):
+    """Whether Π e(P_i, Q_i) == 1, with a single final exponentiation"""
+    count(FINAL_EXPONENTIATIONS)
+    return final_exponentiate(multi_miller_loop(pairs)) == FQ12.one()
+
+
+class PairingTest(unittest.TestCase):
+    def test_matches_py_ecc_miller_loop(self):
+        q = multiply(G2, random.randrange(1, curve_order))
+        p = multiply(G1, random.randrange(1, curve_order))
+        expected = miller_loop(twist(q), cast_point_to_fq12(p), False)
+        self.assertEqual(multi_miller_loop([(PreparedG2(q), p)]), expected)
+
+    def test_pairing_product(self):
+        prepared_g2 = PreparedG2(G2)
+        tau = random.randrange(1, curve_order)
+        prepared_negated_tau_g2 = PreparedG2(neg(multiply(G2, tau)))
+        # e(tau * s * G1, G2) * e(s * G1, -tau * G2) == 1
+        s = random.randrange(1, curve_order)
+        left = multiply(G1, tau * s % curve_order)
+        right = multiply(G1, s)
+        self.assertTrue(
+            check_pairing_product(
+                [(prepared_g2, left), (prepared_negated_tau_g2, right)]
+            )
+        )
+        self.assertFalse(
+            check_pairing_product(
+                [(prepared_g2, double(left)), (prepared_negated_tau_g2, right)]
+            )
+        )
+        infinity = multiply(G1, curve_order)
+        self.assertTrue(check_pairing_product([(prepared_g2, infinity)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+from relations import RelationChallenges, RoundKernel
+from field_vector import FieldVector, MODULUS
+from ff import Fr
+from multiprocessing import Pipe, Process
+import atexit
+import os
+import unittest
+
+# Shards with fewer rows than this are gathered back into the parent process,
+# the remaining rounds are cheaper than a round trip to the workers
+MINIMUM_SHARD_SIZE = 64
+
+
+def run_sumcheck_worker(connection):
+    """Main loop of a worker process owning one contiguous shard of all columns
+
+    The shard stays in the worker for the whole proof: every round only sends
+    the partial univariates up and the round challenge down, and the shard is
+    folded in place where it lives.
+    """
+    columns = None
+    kernel = None
+    while True:
+        (command, argument) = connection.recv()
+        if command == "load":
+            (columns, beta, gamma, alpha) = argument
+            kernel = RoundKernel(RelationChallenges(Fr(beta), Fr(gamma)), Fr(alpha))
+        elif command == "round":
+            result = [0] * kernel.extended_length
+            logup_result = [0] * kernel.extended_length
+            kernel.accumulate(columns, 0, len(columns[0]) // 2, result, logup_result)
+            connection.send((result, logup_result))
+        elif command == "fold":
+            for column in columns:
+                FieldVector.from_values(column).fold_in_place(argument)
+        elif command == "gather":
+            connection.send(columns)
+            columns = None
+        elif command == "stop":
+            return
+
+
+class SumcheckWorkers:
+    """Long-lived worker processes that each prove the rounds of one shard"""
+
+    def __init__(self, worker_count=None):
+        self.worker_count = worker_count if worker_count else os.cpu_count()
+        self.connections = []
+        self.processes = []
+        self.active_shards = 0
+
+    def start(self):
+        if len(self.processes) == 0 and self.is_parallel():
+            for _ in range(self.worker_count):
+                (parent_connection, worker_connection) = Pipe()
+                process = Process(
+                    target=run_sumcheck_worker, args=(worker_connection,), daemon=True
+                )
+                process.start()
+                self.connections.append(parent_connection)
+                self.processes.append(process)
+        return self
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
+
+    def is_parallel(self):
+        return self.worker_count > 1
+
+    def shard_count(self, round_size):
+        """Largest power of two of shards that keeps shards big enough"""
+        count = 1
+        while (
+            count * 2 <= self.worker_count
+            and round_size // (count * 2) >= 2 * MINIMUM_SHARD_SIZE
+        ):
+            count *= 2
+        return count
+
+    def load(self, columns, relation_challenges, alpha, shard_count):
+        self.start()
+        shard_size = len(columns[0]) // shard_count
+        challenges = (
+            int(relation_challenges.beta.value),
+            int(relation_challenges.gamma.value),
+            int(alpha.value),
+        )
+        for i in range(shard_count):
+            shard = [
+                column[i * shard_size : (i + 1) * shard_size] for column in columns
+            ]
+            self.connections[i].send(("load", (shard,) + challenges))
+        self.active_shards = shard_count
+
+    def prove_round(self):
+        """Round univariates summed over all shards"""
+        connections = self.connections[: self.active_shards]
+        for connection in connections:
+            connection.send(("round", None))
+        result = None
+        logup_result = None
+        for connection in connections:
+            (partial_result, partial_logup_result) = connection.recv()
+            if result is None:
+                (result, logup_result) = (partial_result, partial_logup_result)
+                continue
+            result = [(a + b) % MODULUS for a, b in zip(result, partial_result)]
+            logup_result = [
+                (a + b) % MODULUS for a, b in zip(logup_result, partial_logup_result)
+            ]
+        return (result, logup_result)
+
+    def fold(self, challenge):
+        for connection in self.connections[: self.active_shards]:
+            connection.send(("fold", int(challenge.value)))
+
+    def gather(self):
+        """Concatenate the shards back into full columns"""
+        columns = None
+        for connection in self.connections[: self.active_shards]:
+            connection.send(("gather", None))
+        for connection in self.connections[: self.active_shards]:
+            shard = connection.recv()
+            if columns is None:
+                columns = shard
+            else:
+                for column, shard_column in zip(columns, shard):
+                    column.extend(shard_column)
+        self.active_shards = 0
+        return columns
+
+
+sumcheck_workers = dict()
+
+
+def get_sumcheck_workers(worker_count=None):
+    """The workers shared by every sumcheck prover in this process"""
+    if worker_count not in sumcheck_workers:
+        sumcheck_workers[worker_count] = SumcheckWorkers(worker_count)
+    return sumcheck_workers[worker_count]
+
+
+def close_all_sumcheck_workers():
+    for workers in sumcheck_workers.values():
+        workers.close()
+    sumcheck_workers.clear()
+
+
+atexit.register(close_all_sumcheck_workers)
+
+
+class SumcheckWorkersTest(unittest.TestCase):
+    def prove_sumcheck(self, worker_count):
+        from instance import Instance
+        from sumcheck import SumcheckProver, SumcheckChallenges
+        from testing_circuits import xor_example_of_size
+        from transcript import ProverTranscript
+        import random
+
+        random.seed(9)
+        instance = Instance(xor_example_of_size(9))
+        relation_challenges = RelationChallenges(Fr(10), Fr(11))
+        sumcheck_challenges = SumcheckChallenges(zeta=Fr(2))
+        instance.generate_permutation_polynomial(
+            relation_challenges.beta, relation_challenges.gamma
+        )
+        instance.generate_logup_inverse_polynomial(
+            relation_challenges.beta, relation_challenges.gamma
+        )
+        instance.generate_zeta_power_polynomial(sumcheck_challenges.zeta)
+        transcript = ProverTranscript()
+        transcript.send_to_verifier(Fr(1))
+        sumcheck_prover = SumcheckProver(
+            instance,
+            transcript,
+            sumcheck_challenges,
+            relation_challenges,
+            worker_count,
+        )
+        sumcheck_prover.prove()
+        return transcript.export_proof()
+
+    def test_matches_serial_transcript(self):
+        workers = SumcheckWorkers(4)
+        self.assertEqual(workers.shard_count(256), 2)
+        self.assertEqual(workers.shard_count(1024), 4)
+        self.assertEqual(workers.shard_count(128), 1)
+        try:
+            self.assertEqual(self.prove_sumcheck(2), self.prove_sumcheck(1))
+        finally:
+            close_all_sumcheck_workers()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,22 @@
 import random
 from ff import Fr
+from field_vector import (
+    FieldVector,
+    to_value,
+    batch_inverse_values,
+    batch_divide_values,
+)
+from multiprocessing import Pool
+import ntt
+import atexit
 import copy
+import os
 import unittest
 
+# Vectors at least this long are inverted in chunks on several processes.
+# Every chunk pays for one field inversion of its own.
+MINIMUM_PARALLEL_BATCH_INVERSE_SIZE = 1 << 16
+
 
 def batch_polynomials(polynomials, batching_scalar, starting_scalar=Fr(1)):
     if len(polynomials) == 0:
@@ -10,6 +24,13 @@ def batch_polynomials(polynomials, batching_scalar, starting_scalar=Fr(1)):
     polynomial_length = len(polynomials[0])
     for i in range(1, len(polynomials)):
         assert polynomial_length == len(polynomials[i])
+    if all(isinstance(polynomial, FieldVector) for polynomial in polynomials):
+        batched_polynomial = polynomials[0].scale(starting_scalar)
+        current_power = starting_scalar * batching_scalar
+        for i in range(1, len(polynomials)):
+            batched_polynomial.add_scaled(polynomials[i], current_power)
+            current_power *= batching_scalar
+        return batched_polynomial
     batched_polynomial = [
         Fr(polynomials[0][i]) * starting_scalar for i in range(polynomial_length)
     ]
@@ -22,29 +43,107 @@ def batch_polynomials(polynomials, batching_scalar, starting_scalar=Fr(1)):
     return batched_polynomial
 
 
-def batch_inverse(polynomial):
-    products = [Fr(1)]
+def divide_values_in_chunk(task):
+    (numerators, denominators) = task
+    if numerators is None:
+        return batch_inverse_values(denominators)
+    return batch_divide_values(numerators, denominators)
+
+
+division_pools = dict()
+
+
+def get_division_pool(worker_count):
+    """The pool shared by every chunked division with this many workers"""
+    if worker_count not in division_pools:
+        division_pools[worker_count] = Pool(worker_count)
+    return division_pools[worker_count]
+
+
+def close_all_division_pools():
+    for pool in division_pools.values():
+        pool.terminate()
+        pool.join()
+    division_pools.clear()
+
+
+atexit.register(close_all_division_pools)
+
+
+def batch_divide_in_chunks(numerators, denominators, worker_count=None):
+    """batch_divide_values, split across processes for very long vectors"""
+    worker_count = worker_count if worker_count else os.cpu_count()
+    if worker_count <= 1 or len(denominators) < MINIMUM_PARALLEL_BATCH_INVERSE_SIZE:
+        return divide_values_in_chunk((numerators, denominators))
+    chunk_size = -(-len(denominators) // worker_count)
+    tasks = [
+        (
+            numerators[start : start + chunk_size] if numerators is not None else None,
+            denominators[start : start + chunk_size],
+        )
+        for start in range(0, len(denominators), chunk_size)
+    ]
+    result = []
+    for chunk in get_division_pool(worker_count).map(divide_values_in_chunk, tasks):
+        result.extend(chunk)
+    return result
+
+
+def batch_inverse(polynomial, worker_count=None):
+    """Inverse of every element, zeros map to zero"""
+    values = [to_value(element) for element in polynomial]
+    return FieldVector.from_values(batch_divide_in_chunks(None, values, worker_count))
 
-    for x in polynomial:
-        products.append(products[-1] * x)
 
-    running_inverse = products[-1].invert()
-    inverses = []
-    for i in range(len(products) - 2, -1, -1):
-        inverses.insert(0, running_inverse * products[i])
-        running_inverse *= polynomial[i]
-    return inverses
+def batch_divide(numerators, denominators, worker_count=None):
+    """numerators[i] / denominators[i], zero where the denominator is zero"""
+    return FieldVector.from_values(
+        batch_divide_in_chunks(
+            [to_value(element) for element in numerators],
+            [to_value(element) for element in denominators],
+            worker_count,
+        )
+    )
 
 
 def vanishing_polynomial_on_domain(domain: list[Fr]):
-    vanishing_poly = [Fr(1)]
-    for i in range(0, len(domain)):
-        new_vanishing_poly = [Fr(0) for j in range(i + 2)]
-        for j in range(1, i + 2):
-            new_vanishing_poly[j] += vanishing_poly[j - 1]
-            new_vanishing_poly[j - 1] -= vanishing_poly[j - 1] * domain[i]
-        vanishing_poly = new_vanishing_poly
-    return vanishing_poly
+    if len(domain) == 0:
+        return [Fr(1)]
+    return [
+        Fr(x)
+        for x in ntt.SubproductTree(
+            [to_value(point) for point in domain]
+        ).vanishing_polynomial()
+    ]
+
+
+def multiply_polynomials(a: list[Fr], b: list[Fr]):
+    return [
+        Fr(x)
+        for x in ntt.multiply_polynomials(
+            [to_value(x) for x in a], [to_value(x) for x in b]
+        )
+    ]
+
+
+def interpolate_polynomial(domain: list[Fr], evaluations: list[Fr]):
+    return [
+        Fr(x)
+        for x in ntt.interpolate(
+            [to_value(point) for point in domain],
+            [to_value(evaluation) for evaluation in evaluations],
+        )
+    ]
+
+
+def evaluate_polynomial_on_domain(polynomial_in_monomial_form, domain: list[Fr]):
+    return [
+        Fr(x)
+        for x in ntt.multipoint_evaluate(
+            [to_value(x) for x in polynomial_in_monomial_form],
+            [to_value(point) for point in domain],
+        )
+    ]
 
 
 def divide_polynomial_by_known_root(polynomial: list[Fr], root: Fr):
@@ -65,21 +164,15 @@ def divide_polynomial_by_known_root(polynomial: list[Fr], root: Fr):
 
 
 def convert_from_lagrange_to_monomial_form(polynomial_in_evaluation_form: list[Fr]):
-    h_x = vanishing_polynomial_on_domain(
-        [Fr(i) for i in range(len(polynomial_in_evaluation_form))]
+    return interpolate_polynomial(
+        [Fr(i) for i in range(len(polynomial_in_evaluation_form))],
+        polynomial_in_evaluation_form,
     )
-    final_polynomial = [Fr(0) for _ in range(len(polynomial_in_evaluation_form))]
-    for i, coeff in enumerate(polynomial_in_evaluation_form):
-        partial_h_x = divide_polynomial_by_known_root(h_x, Fr(i))
-        p_h_x_at_i = evaluate_polynomial(partial_h_x, Fr(i))
-        multiplicand = coeff / p_h_x_at_i
-        for j in range(len(final_polynomial)):
-            final_polynomial[j] += partial_h_x[j] * multiplicand
-
-    return final_polynomial
 
 
 def evaluate_polynomial(polynomial_in_monomial_form, evaluation_point):
+    if isinstance(polynomial_in_monomial_form, FieldVector):
+        return polynomial_in_monomial_form.evaluate(evaluation_point)
     start = Fr(0)
     for i in range(len(polynomial_in_monomial_form) - 1, -1, -1):
         start *= evaluation_point
@@ -88,6 +181,8 @@ def evaluate_polynomial(polynomial_in_monomial_form, evaluation_point):
 
 
 def partially_evaluate_multilinear_polynomial(polynomial, evaluation_point):
+    if isinstance(polynomial, FieldVector):
+        return polynomial.fold(evaluation_point)
     new_polynomial = []
     for i in range(0, len(polynomial), 2):
         difference = polynomial[i + 1] - polynomial[i]
@@ -140,6 +235,38 @@ class PolynomialTest(unittest.TestCase):
         for i in range(10):
             self.assertEqual(evaluate_polynomial(monomial, Fr(i)), coeffs[i])
 
+    def test_batch_inverse_and_divide(self):
+        elements = [Fr.from_bytes(random.randbytes(32)) for _ in range(20)] + [Fr(0)]
+        numerators = [Fr.from_bytes(random.randbytes(32)) for _ in range(21)]
+        expected = [element.invert() for element in elements]
+        self.assertEqual(batch_inverse(elements), expected)
+        self.assertEqual(
+            batch_divide(numerators, elements),
+            [a * b for a, b in zip(numerators, expected)],
+        )
+        chunked = batch_divide_in_chunks(
+            [to_value(element) for element in numerators] * 4000,
+            [to_value(element) for element in elements] * 4000,
+            worker_count=2,
+        )
+        self.assertEqual(
+            chunked, batch_divide(numerators, elements).values * 4000
+        )
+
+    def test_fast_arithmetic_wrappers(self):
+        a = [Fr.from_bytes(random.randbytes(32)) for i in range(40)]
+        b = [Fr.from_bytes(random.randbytes(32)) for i in range(40)]
+        domain = [Fr.from_bytes(random.randbytes(32)) for i in range(40)]
+        product = multiply_polynomials(a, b)
+        evaluations = evaluate_polynomial_on_domain(product, domain)
+        for point, evaluation in zip(domain, evaluations):
+            self.assertEqual(
+                evaluation, evaluate_polynomial(a, point) * evaluate_polynomial(b, point)
+            )
+        self.assertEqual(
+            interpolate_polynomial(domain, evaluate_polynomial_on_domain(a, domain)), a
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,194 @@
+from contextlib import contextmanager, nullcontext
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import unittest
+
+# Set to a file name to append one JSON line per proof or verification to it,
+# or to "-" to write them to stderr. Unset, every hook is a no-op.
+PROFILE_ENVIRONMENT_VARIABLE = "RONK_PROFILE"
+
+FIELD_MULTIPLICATIONS = "field_multiplications"
+FIELD_INVERSIONS = "field_inversions"
+SCALAR_MULTIPLICATIONS = "scalar_multiplications"
+PAIRINGS = "pairings"
+FINAL_EXPONENTIATIONS = "final_exponentiations"
+RELATION_ROWS = "relation_rows"
+VECTOR_ALLOCATIONS = "vector_allocations"
+
+
+PAGE_SIZE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def get_rss_kb(pid="self"):
+    """Current resident memory of a process, 0 if it is gone"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE_KB
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def get_workers_rss_kb():
+    """Current resident memory of all live child processes, such as the
+    commitment and sumcheck workers"""
+    return sum(get_rss_kb(child.pid) for child in multiprocessing.active_children())
+
+
+def get_process_max_rss_kb():
+    # High-water mark over the whole life of this process, kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.rss_kb = 0
+        self.rss_growth_kb = 0
+        self.workers_rss_kb = 0
+        self.process_max_rss_kb = 0
+        self.counters = dict()
+        self.children = []
+
+    def total_counters(self):
+        """Counters of this span added to the ones of all nested spans"""
+        totals = dict(self.counters)
+        for child in self.children:
+            for name, amount in child.total_counters().items():
+                totals[name] = totals.get(name, 0) + amount
+        return totals
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "rss_kb": self.rss_kb,
+            "rss_growth_kb": self.rss_growth_kb,
+            "workers_rss_kb": self.workers_rss_kb,
+            "process_max_rss_kb": self.process_max_rss_kb,
+            "counters": self.total_counters(),
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Profiler:
+    """Nested timing spans with operation counters and memory samples
+
+    The outermost span is handed to the sink once it closes. Counters are
+    added to the innermost open span and reported with every enclosing one.
+    Memory is sampled when a span opens and closes: the resident memory of this
+    process and of its live workers, not the peak reached in between. Only
+    process_max_rss_kb is a peak, over the whole life of the process.
+    """
+
+    def __init__(self, destination=None):
+        self.destination = destination
+        self.enabled = destination is not None
+        self.stack = []
+        self.sink = None
+
+    @contextmanager
+    def profile(self, name):
+        span = Span(name)
+        if self.stack:
+            self.stack[-1].children.append(span)
+        self.stack.append(span)
+        start_rss_kb = get_rss_kb()
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - start
+            span.rss_kb = get_rss_kb()
+            span.rss_growth_kb = span.rss_kb - start_rss_kb
+            span.workers_rss_kb = get_workers_rss_kb()
+            span.process_max_rss_kb = get_process_max_rss_kb()
+            self.stack.pop()
+            if not self.stack:
+                self.emit(span)
+
+    def span(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self.profile(name)
+
+    def count(self, name, amount=1):
+        if self.enabled and self.stack:
+            counters = self.stack[-1].counters
+            counters[name] = counters.get(name, 0) + amount
+
+    def emit(self, span):
+        if self.sink is not None:
+            self.sink(span)
+            return
+        line = json.dumps(span.to_dict())
+        if self.destination == "-":
+            print(line, file=sys.stderr, flush=True)
+        else:
+            with open(self.destination, "a") as f:
+                f.write(line + "\n")
+
+
+profiler = Profiler(os.environ.get(PROFILE_ENVIRONMENT_VARIABLE))
+
+
+def span(name):
+    return profiler.span(name)
+
+
+def count(name, amount=1):
+    if profiler.enabled:
+        profiler.count(name, amount)
+
+
+@contextmanager
+def capture_spans():
+    """Enable profiling and collect finished outermost spans instead of emitting"""
+    (enabled, sink) = (profiler.enabled, profiler.sink)
+    spans = []
+    profiler.enabled = True
+    profiler.sink = spans.append
+    try:
+        yield spans
+    finally:
+        (profiler.enabled, profiler.sink) = (enabled, sink)
+
+
+class ProfilingTest(unittest.TestCase):
+    def test_nested_spans(self):
+        with capture_spans() as spans:
+            with span("outer"):
+                count(FIELD_MULTIPLICATIONS, 3)
+                with span("inner"):
+                    count(FIELD_MULTIPLICATIONS, 2)
+                    count(PAIRINGS)
+        self.assertEqual(len(spans), 1)
+        report = json.loads(json.dumps(spans[0].to_dict()))
+        self.assertEqual(report["name"], "outer")
+        self.assertEqual(
+            report["counters"], {FIELD_MULTIPLICATIONS: 5, PAIRINGS: 1}
+        )
+        (inner,) = report["children"]
+        self.assertEqual(inner["counters"], {FIELD_MULTIPLICATIONS: 2, PAIRINGS: 1})
+        self.assertGreaterEqual(report["seconds"], inner["seconds"])
+        self.assertGreater(report["rss_kb"], 0)
+        self.assertGreater(report["process_max_rss_kb"], 0)
+
+    def test_workers_memory(self):
+        with multiprocessing.Pool(1) as pool:
+            pool.apply(len, ((),))
+            self.assertGreater(get_workers_rss_kb(), 0)
+
+    def test_disabled_is_a_no_op(self):
+        disabled = Profiler()
+        with disabled.span("ignored"):
+            disabled.count(PAIRINGS)
+        self.assertEqual(disabled.stack, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,42 +3,77 @@ from instance import (
     NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS,
     NUMBER_OF_INITIAL_WITNESS_POLYNOMIALS,
 )
+from instance_file import InstanceFile
 from circuit import CircuitBuilder
 from polynomial import evaluate_polynomial
 from relations import RelationChallenges
 from transcript import ProverTranscript, VerifierTranscript, map_tuple_from_int_to_Fq
-from ff import Fr, Fq
+from ff import Fr, Fq, FF_BYTE_LENGTH
 from kzg import KZG
 from gemini import GeminiProver, GeminiVerifier
 import unittest
 from uint import Uint8
 from sumcheck import SumcheckProver, SumcheckVerifier, SumcheckChallenges
 from shplonk import ShplonkProver, ShplonkVerifier
+from proving_key import ProvingKey
+from profiling import span
 
 
 class Prover:
 
     def __init__(
-        self, cb: CircuitBuilder, disable_lookup_multiplicity_computation=False
+        self,
+        cb: CircuitBuilder,
+        disable_lookup_multiplicity_computation=False,
+        worker_count=None,
+        proving_key: ProvingKey = None,
+        instance: Instance = None,
     ):
-        self.instance = Instance(cb, disable_lookup_multiplicity_computation)
-        self.kzg = KZG()
+        if instance is None:
+            instance = Instance(cb, disable_lookup_multiplicity_computation, proving_key)
+        self.instance = instance
+        self.proving_key = proving_key
+        self.worker_count = worker_count
+        self.kzg = KZG(worker_count=worker_count)
         self.transcript = ProverTranscript()
 
+    @staticmethod
+    def from_instance_file(filename, worker_count=None):
+        """A prover for the instance stored in a file, loaded whole into memory"""
+        with InstanceFile(filename) as instance_file:
+            instance = Instance.from_file(instance_file)
+        return Prover(
+            None,
+            worker_count=worker_count,
+            instance=instance,
+        )
+
+    def generate_proving_key(self):
+        if self.proving_key is None:
+            self.proving_key = ProvingKey.from_instance(self.instance, self.kzg)
+        return self.proving_key
+
+    def commit_to_fixed_polynomial(self, i):
+        if self.proving_key is not None:
+            return self.proving_key.commitments[i]
+        return self.kzg.commit(self.instance.all_polynomials[i])
+
     def generate_verification_key(self):
         self.transcript = ProverTranscript()
         self.transcript.send_to_verifier(self.instance.instance_size)
         for i in range(NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS):
             self.transcript.send_to_verifier(
-                map_tuple_from_int_to_Fq(
-                    self.kzg.commit(self.instance.all_polynomials[i])
-                )
+                map_tuple_from_int_to_Fq(self.commit_to_fixed_polynomial(i))
             )
         vk = self.transcript.export_proof()
         self.transcript = ProverTranscript()
         return vk
 
     def prove(self, before_sumcheck_update=lambda x: None):
+        with span("prove"):
+            self.prove_phases(before_sumcheck_update)
+
+    def prove_phases(self, before_sumcheck_update):
         # VK data
 
         # Round 0
@@ -46,39 +81,44 @@ class Prover:
         # Send verification key part
 
         self.transcript.send_to_verifier(self.instance.instance_size)
-        for i in range(NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS):
-            self.transcript.send_to_verifier(
-                map_tuple_from_int_to_Fq(
-                    self.kzg.commit(self.instance.all_polynomials[i])
+        with span("commit_fixed"):
+            for i in range(NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS):
+                self.transcript.send_to_verifier(
+                    map_tuple_from_int_to_Fq(self.commit_to_fixed_polynomial(i))
                 )
-            )
 
         # Round 1
 
-        for i in range(
-            NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS,
-            NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS
-            + NUMBER_OF_INITIAL_WITNESS_POLYNOMIALS,
-        ):
-            self.transcript.send_to_verifier(
-                map_tuple_from_int_to_Fq(
-                    self.kzg.commit(self.instance.all_polynomials[i])
+        with span("commit_witness"):
+            for i in range(
+                NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS,
+                NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS
+                + NUMBER_OF_INITIAL_WITNESS_POLYNOMIALS,
+            ):
+                self.transcript.send_to_verifier(
+                    map_tuple_from_int_to_Fq(
+                        self.kzg.commit(self.instance.all_polynomials[i])
+                    )
                 )
-            )
 
         beta_challenge = self.transcript.get_challenge()
         self.beta_challenge = beta_challenge
         gamma_challenge = self.transcript.get_challenge()
         self.gamma_challenge = gamma_challenge
 
-        self.instance.generate_permutation_polynomial(beta_challenge, gamma_challenge)
-        self.instance.generate_logup_inverse_polynomial(beta_challenge, gamma_challenge)
+        with span("permutation_and_logup"):
+            self.instance.generate_permutation_polynomial(
+                beta_challenge, gamma_challenge
+            )
+            self.instance.generate_logup_inverse_polynomial(
+                beta_challenge, gamma_challenge
+            )
 
-        self.transcript.send_to_verifier(
-            map_tuple_from_int_to_Fq(
-                self.kzg.commit(self.instance.all_polynomials.permutation)
+            self.transcript.send_to_verifier(
+                map_tuple_from_int_to_Fq(
+                    self.kzg.commit(self.instance.all_polynomials.permutation)
+                )
             )
-        )
 
         zeta_challenge = self.transcript.get_challenge()
         self.zeta_challenge = zeta_challenge
@@ -90,11 +130,14 @@ class Prover:
         sumcheck_challenges = SumcheckChallenges(zeta_challenge)
 
         relation_challenges = RelationChallenges(beta_challenge, gamma_challenge)
-        sumcheck_prover = SumcheckProver(
-            self.instance, self.transcript, sumcheck_challenges, relation_challenges
-        )
-
-        evaluation_point = sumcheck_prover.prove()
+        with span("sumcheck"):
+            evaluation_point = SumcheckProver(
+                self.instance,
+                self.transcript,
+                sumcheck_challenges,
+                relation_challenges,
+                self.worker_count,
+            ).prove()
 
         gemini_prover = GeminiProver(
             list(
@@ -115,12 +158,15 @@ class Prover:
             ],
             self.transcript,
             evaluation_point,
+            self.kzg,
         )
 
-        opening_claims = gemini_prover.prove()
+        with span("gemini"):
+            opening_claims = gemini_prover.prove()
 
-        shplonk_prover = ShplonkProver(opening_claims, self.transcript)
-        shplonk_prover.prove()
+        with span("shplonk"):
+            shplonk_prover = ShplonkProver(opening_claims, self.transcript, self.kzg)
+            shplonk_prover.prove()
 
     def export_proof(self):
         return self.transcript.export_proof()
@@ -129,8 +175,22 @@ class Prover:
 class Verifier:
     def __init__(self, proof_data: bytes):
         self.transcript = VerifierTranscript(proof_data)
+        self.kzg = KZG()
 
     def verify(self, verification_key=bytes([])):
+        with span("verify"):
+            pairing_claim = self.reduce(verification_key)
+            if pairing_claim is None:
+                return False
+            with span("pairing"):
+                return self.kzg.check_pairing_claims([pairing_claim])
+
+    def reduce(self, verification_key=bytes([])):
+        """Run every check except the final pairing
+
+        Returns the KZG pairing claim the proof stands on, or None if the proof
+        has already failed.
+        """
 
         # Round 0
         self.instance_size = self.transcript.get_int_from_prover()
@@ -143,11 +203,11 @@ class Verifier:
             vk_transcript = VerifierTranscript(verification_key)
             vk_instance_size = vk_transcript.get_int_from_prover()
             if vk_instance_size != self.instance_size:
-                return False
+                return None
             for i in range(NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS):
                 if vk_commitments[i] != vk_transcript.get_point_from_prover():
                     print("Verification Key Discrepancy")
-                    return False
+                    return None
 
         initial_witness_commitments = []
         for i in range(
@@ -175,12 +235,13 @@ class Verifier:
             relation_challenges,
         )
 
-        (sumcheck_verified, evaluation_point, polynomial_evaluations) = (
-            sumcheck_verifier.verify()
-        )
+        with span("sumcheck"):
+            (sumcheck_verified, evaluation_point, polynomial_evaluations) = (
+                sumcheck_verifier.verify()
+            )
         if not sumcheck_verified:
             print("Sumcheck failed")
-            return False
+            return None
         gemini_verifier = GeminiVerifier(
             vk_commitments + initial_witness_commitments + [permutation_commitment],
             [
@@ -209,17 +270,62 @@ class Verifier:
             ),
         )
 
-        (gemini_verified, verifier_opening_claims) = gemini_verifier.verify()
+        with span("gemini"):
+            (gemini_verified, verifier_opening_claims) = gemini_verifier.verify()
 
         if not gemini_verified:
             print("Gemini failed")
-            return False
+            return None
 
-        shplonk_verifier = ShplonkVerifier(verifier_opening_claims, self.transcript)
+        shplonk_verifier = ShplonkVerifier(
+            verifier_opening_claims, self.transcript, self.kzg
+        )
 
-        result = shplonk_verifier.verify()
+        with span("shplonk"):
+            return shplonk_verifier.reduce()
 
-        return result
+
+class BatchVerifier:
+    """Verify many proofs against one verification key
+
+    The final KZG checks of all proofs are combined into a single pairing
+    product. If it fails, the batch is bisected to find the bad proofs.
+    """
+
+    def __init__(self, verification_key=bytes([])):
+        self.verification_key = verification_key
+        self.kzg = KZG()
+        self.proofs = []
+
+    def add(self, proof_data: bytes):
+        self.proofs.append(proof_data)
+        return len(self.proofs) - 1
+
+    def verify(self):
+        results = [False for _ in self.proofs]
+        pairing_claims = []
+        for i, proof_data in enumerate(self.proofs):
+            try:
+                pairing_claim = Verifier(proof_data).reduce(self.verification_key)
+            except (AssertionError, ValueError):
+                pairing_claim = None
+            if pairing_claim is not None:
+                pairing_claims.append((i, pairing_claim))
+        self.check_by_bisection(pairing_claims, results)
+        return results
+
+    def check_by_bisection(self, indexed_claims, results):
+        if len(indexed_claims) == 0:
+            return
+        if self.kzg.check_pairing_claims([claim for (_, claim) in indexed_claims]):
+            for i, _ in indexed_claims:
+                results[i] = True
+            return
+        if len(indexed_claims) == 1:
+            return
+        middle = len(indexed_claims) // 2
+        self.check_by_bisection(indexed_claims[:middle], results)
+        self.check_by_bisection(indexed_claims[middle:], results)
 
 
 class TestProver(unittest.TestCase):
@@ -235,6 +341,55 @@ class TestProver(unittest.TestCase):
         verfier = Verifier(proof)
         self.assertTrue(verfier.verify(verification_key=verification_key))
 
+        # Replace the final opening proof with another curve point
+        forged_proof = proof[: -2 * FF_BYTE_LENGTH] + Fq(1).to_bytes() + Fq(2).to_bytes()
+        truncated_proof = proof[:-1]
+        batch_verifier = BatchVerifier(verification_key)
+        for proof_data in [proof, forged_proof, proof, truncated_proof, proof]:
+            batch_verifier.add(proof_data)
+        self.assertEqual(batch_verifier.verify(), [True, False, True, False, True])
+
+    def test_proof_with_proving_key(self):
+        def xor_circuit(x, y):
+            cb = CircuitBuilder()
+            Uint8(cb, x) ^ Uint8(cb, y)
+            return cb
+
+        prover = Prover(xor_circuit(0xFF, 0xF))
+        verification_key = prover.generate_verification_key()
+        proving_key = ProvingKey.from_bytes(prover.generate_proving_key().to_bytes())
+
+        # Same shape, different witness
+        prover = Prover(xor_circuit(0x12, 0x34), proving_key=proving_key)
+        self.assertEqual(prover.generate_verification_key(), verification_key)
+        prover.prove()
+        proof = prover.export_proof()
+        self.assertTrue(Verifier(proof).verify(verification_key=verification_key))
+        reference_prover = Prover(xor_circuit(0x12, 0x34))
+        reference_prover.prove()
+        self.assertEqual(proof, reference_prover.export_proof())
+
+        cb = xor_circuit(0x12, 0x34)
+        Uint8(cb, 1) ^ Uint8(cb, 2)
+        with self.assertRaises(ValueError):
+            Prover(cb, proving_key=proving_key)
+
+    def test_proof_from_instance_file(self):
+        import os
+        import tempfile
+
+        from testing_circuits import standard_xor_example
+
+        directory = tempfile.mkdtemp()
+        prover = Prover(standard_xor_example())
+        prover.instance.save(os.path.join(directory, "instance.bin"))
+        prover.prove()
+        proof = prover.export_proof()
+
+        file_prover = Prover.from_instance_file(os.path.join(directory, "instance.bin"))
+        file_prover.prove()
+        self.assertEqual(file_prover.export_proof(), proof)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,183 @@
+from field_vector import FieldVector
+from proof_polynomials import AllPolynomials, NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS
+from ff import Fr, FF_BYTE_LENGTH
+from hashlib import blake2b
+import struct
+import unittest
+
+PROVING_KEY_MAGIC = b"RONK_PK\x01"
+SHAPE_HASH_SIZE = 32
+# Magic, instance size, shape hash
+HEADER_SIZE = len(PROVING_KEY_MAGIC) + 4 + SHAPE_HASH_SIZE
+COMMITMENT_SIZE = 2 * FF_BYTE_LENGTH
+FIXED_POLYNOMIAL_NAMES = AllPolynomials._fields[:NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS]
+
+
+def element_value(element):
+    return int(element.value) if type(element) == Fr else int(element)
+
+
+def compute_circuit_shape_hash(circuit_builder):
+    """Digest of everything that determines the fixed polynomials
+
+    That is the selectors, which gate wires share a variable and the lookup
+    tables. Witness values are not included, so circuits that differ only in
+    their witness get the same digest.
+    """
+    hasher = blake2b(digest_size=SHAPE_HASH_SIZE)
+    hasher.update(struct.pack("<Q", circuit_builder.get_num_gates()))
+    for row in circuit_builder.rows:
+        for selector in row:
+            hasher.update(Fr(element_value(selector)).to_bytes())
+    real_variable_indices = circuit_builder.get_real_variable_indices()
+    for witness_indices in circuit_builder.witness_indices:
+        hasher.update(
+            struct.pack(
+                "<QQQ", *[real_variable_indices[index] for index in witness_indices]
+            )
+        )
+    for table_index in sorted(circuit_builder.lookup_tables.keys()):
+        table = sorted(
+            tuple(element_value(element) for element in entry)
+            for entry in circuit_builder.lookup_tables[table_index]
+        )
+        hasher.update(struct.pack("<QQ", table_index, len(table)))
+        for entry in table:
+            for element in entry:
+                hasher.update(Fr(element).to_bytes())
+    return hasher.digest()
+
+
+def encode_commitment(commitment):
+    return b"".join(
+        coordinate.to_bytes(FF_BYTE_LENGTH, "little") for coordinate in commitment
+    )
+
+
+def decode_commitment(data):
+    return (
+        int.from_bytes(data[:FF_BYTE_LENGTH], "little"),
+        int.from_bytes(data[FF_BYTE_LENGTH:], "little"),
+    )
+
+
+class ProvingKey:
+    """Fixed polynomials of a circuit shape together with their commitments
+
+    Built once per circuit shape; proving another witness for the same shape
+    then reuses the lagrange, id, sigma, selector and table polynomials and
+    their commitments instead of recomputing them.
+    """
+
+    def __init__(self, instance_size, shape_hash, polynomials, commitments):
+        assert len(polynomials) == NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS
+        assert len(commitments) == NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS
+        self.instance_size = instance_size
+        self.shape_hash = shape_hash
+        self.polynomials = polynomials
+        # Affine commitments as pairs of integers
+        self.commitments = commitments
+
+    @staticmethod
+    def from_instance(instance, kzg):
+        polynomials = [
+            instance.all_polynomials[i].copy()
+            for i in range(NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS)
+        ]
+        commitments = [
+            tuple(int(coordinate) for coordinate in kzg.commit(polynomial))
+            for polynomial in polynomials
+        ]
+        return ProvingKey(
+            instance.instance_size,
+            compute_circuit_shape_hash(instance.builder),
+            polynomials,
+            commitments,
+        )
+
+    def check_circuit(self, circuit_builder):
+        if compute_circuit_shape_hash(circuit_builder) != self.shape_hash:
+            raise ValueError("Proving key was built for a different circuit")
+
+    def to_bytes(self):
+        return b"".join(
+            [PROVING_KEY_MAGIC, struct.pack("<I", self.instance_size), self.shape_hash]
+            + [encode_commitment(commitment) for commitment in self.commitments]
+            + [polynomial.to_bytes() for polynomial in self.polynomials]
+        )
+
+    @staticmethod
+    def from_bytes(data):
+        polynomial_size = None
+        if data[: len(PROVING_KEY_MAGIC)] == PROVING_KEY_MAGIC:
+            (instance_size,) = struct.unpack_from("<I", data, len(PROVING_KEY_MAGIC))
+            polynomial_size = instance_size * FF_BYTE_LENGTH
+        commitments_size = NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS * COMMITMENT_SIZE
+        if polynomial_size is None or len(data) != (
+            HEADER_SIZE
+            + commitments_size
+            + NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS * polynomial_size
+        ):
+            raise ValueError("Malformed proving key")
+        shape_hash = data[HEADER_SIZE - SHAPE_HASH_SIZE : HEADER_SIZE]
+        commitments = [
+            decode_commitment(data[offset : offset + COMMITMENT_SIZE])
+            for offset in range(
+                HEADER_SIZE, HEADER_SIZE + commitments_size, COMMITMENT_SIZE
+            )
+        ]
+        polynomials_offset = HEADER_SIZE + commitments_size
+        polynomials = [
+            FieldVector.from_bytes(
+                data[
+                    polynomials_offset
+                    + i * polynomial_size : polynomials_offset
+                    + (i + 1) * polynomial_size
+                ]
+            )
+            for i in range(NUMBER_OF_VERIFICATION_KEY_POLYNOMIALS)
+        ]
+        return ProvingKey(instance_size, shape_hash, polynomials, commitments)
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
+
+    @staticmethod
+    def load(filename):
+        with open(filename, "rb") as f:
+            return ProvingKey.from_bytes(f.read())
+
+
+class ProvingKeyTest(unittest.TestCase):
+    def test_serialization(self):
+        from instance import Instance
+        from testing_circuits import standard_xor_example
+        from kzg import KZG
+
+        instance = Instance(standard_xor_example())
+        proving_key = ProvingKey.from_instance(instance, KZG())
+        data = proving_key.to_bytes()
+        restored = ProvingKey.from_bytes(data)
+        self.assertEqual(restored.to_bytes(), data)
+        self.assertEqual(restored.commitments, proving_key.commitments)
+        for name, polynomial in zip(FIXED_POLYNOMIAL_NAMES, restored.polynomials):
+            self.assertEqual(polynomial, getattr(instance.all_polynomials, name))
+        with self.assertRaises(ValueError):
+            ProvingKey.from_bytes(data[:-1])
+
+    def test_shape_hash(self):
+        from testing_circuits import standard_xor_example, impossible_xor_example
+
+        self.assertEqual(
+            compute_circuit_shape_hash(standard_xor_example()),
+            compute_circuit_shape_hash(standard_xor_example()),
+        )
+        self.assertNotEqual(
+            compute_circuit_shape_hash(standard_xor_example()),
+            compute_circuit_shape_hash(impossible_xor_example()),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+from field_vector import MODULUS
+import unittest
+
+# Expressions over the columns of a row and the relation challenges. Every
+# node is interned by its operation and operands, so a subexpression written
+# twice, in one relation or in several, is one node and is computed once by
+# the compiled evaluator. Nodes that do not depend on any column are computed
+# once per set of challenges instead of once per row.
+
+COLUMN = "column"
+CHALLENGE = "challenge"
+CONSTANT = "constant"
+ADD = "add"
+SUB = "sub"
+MUL = "mul"
+
+interned_expressions = dict()
+
+
+class Expression:
+    __slots__ = ("operation", "operands", "degree", "index")
+
+    def __add__(self, other):
+        return make_expression(ADD, (self, as_expression(other)))
+
+    def __radd__(self, other):
+        return make_expression(ADD, (as_expression(other), self))
+
+    def __sub__(self, other):
+        return make_expression(SUB, (self, as_expression(other)))
+
+    def __rsub__(self, other):
+        return make_expression(SUB, (as_expression(other), self))
+
+    def __mul__(self, other):
+        return make_expression(MUL, (self, as_expression(other)))
+
+    def __rmul__(self, other):
+        return make_expression(MUL, (as_expression(other), self))
+
+    def __repr__(self):
+        if self.operation in (COLUMN, CHALLENGE, CONSTANT):
+            return str(self.operands[0])
+        symbol = {ADD: "+", SUB: "-", MUL: "*"}[self.operation]
+        return "(" + f" {symbol} ".join(map(repr, self.operands)) + ")"
+
+
+def make_expression(operation, operands):
+    if operation in (ADD, MUL):
+        # Commutative, so a * b and b * a are the same node
+        operands = tuple(sorted(operands, key=lambda operand: operand.index))
+    key = (operation, tuple(operand.index for operand in operands))
+    if key in interned_expressions:
+        return interned_expressions[key]
+    expression = Expression()
+    expression.operation = operation
+    expression.operands = operands
+    if operation == MUL:
+        expression.degree = sum(operand.degree for operand in operands)
+    else:
+        expression.degree = max(operand.degree for operand in operands)
+    expression.index = len(interned_expressions)
+    interned_expressions[key] = expression
+    return expression
+
+
+def make_leaf(operation, value, degree):
+    key = (operation, value)
+    if key in interned_expressions:
+        return interned_expressions[key]
+    expression = Expression()
+    expression.operation = operation
+    expression.operands = (value,)
+    expression.degree = degree
+    expression.index = len(interned_expressions)
+    interned_expressions[key] = expression
+    return expression
+
+
+def column(name):
+    return make_leaf(COLUMN, name, 1)
+
+
+def challenge(name):
+    return make_leaf(CHALLENGE, name, 0)
+
+
+def constant(value):
+    return make_leaf(CONSTANT, int(value) % MODULUS, 0)
+
+
+def as_expression(value):
+    if isinstance(value, Expression):
+        return value
+    return constant(value)
+
+
+def topological_order(outputs):
+    order = []
+    visited = set()
+    stack = [(output, False) for output in reversed(outputs)]
+    while stack:
+        (expression, operands_done) = stack.pop()
+        if operands_done:
+            order.append(expression)
+            continue
+        if expression.index in visited:
+            continue
+        visited.add(expression.index)
+        stack.append((expression, True))
+        if expression.operation in (ADD, SUB, MUL):
+            for operand in reversed(expression.operands):
+                stack.append((operand, False))
+    return order
+
+
+class CompiledExpressions:
+    """Evaluators for a tuple of expressions, sharing every common node
+
+    column_names fixes the order of the columns in a row, challenge_names the
+    order of the challenge values passed to bind.
+    """
+
+    def __init__(self, outputs, column_names, challenge_names=()):
+        self.outputs = tuple(outputs)
+        self.column_names = tuple(column_names)
+        self.challenge_names = tuple(challenge_names)
+        order = topological_order(self.outputs)
+        names = dict()
+        hoisted_lines = []
+        row_lines = []
+        used_columns = []
+        # Multiplications done for every row, for operation counts
+        self.row_multiplications = 0
+        for expression in order:
+            name = f"t{expression.index}"
+            names[expression.index] = name
+            if expression.operation == COLUMN:
+                column_name = expression.operands[0]
+                if column_name not in self.column_names:
+                    raise ValueError(f"Unknown column {column_name}")
+                used_columns.append(column_name)
+                row_lines.append(
+                    f"{name} = row[{self.column_names.index(column_name)}]"
+                )
+                continue
+            if expression.operation == CHALLENGE:
+                challenge_name = expression.operands[0]
+                if challenge_name not in self.challenge_names:
+                    raise ValueError(f"Unknown challenge {challenge_name}")
+                value = f"challenges[{self.challenge_names.index(challenge_name)}]"
+            elif expression.operation == CONSTANT:
+                value = str(expression.operands[0])
+            else:
+                (left, right) = [names[operand.index] for operand in expression.operands]
+                if expression.operation == ADD:
+                    value = f"{left} + {right}"
+                elif expression.operation == SUB:
+                    value = f"{left} - {right}"
+                else:
+                    value = f"{left} * {right} % MODULUS"
+            if expression.degree == 0:
+                hoisted_lines.append(f"{name} = {value}")
+            else:
+                row_lines.append(f"{name} = {value}")
+                if expression.operation == MUL:
+                    self.row_multiplications += 1
+        self.used_columns = used_columns
+        results = ", ".join(
+            f"{names[output.index]} % MODULUS" for output in self.outputs
+        )
+        self.source = "\n".join(
+            ["def bind(challenges):"]
+            + [f"    {line}" for line in hoisted_lines]
+            + ["    def evaluate_row(row):"]
+            + [f"        {line}" for line in row_lines]
+            + [f"        return ({results},)"]
+            + ["    return evaluate_row"]
+        )
+        namespace = {"MODULUS": MODULUS}
+        exec(compile(self.source, "<relation spec>", "exec"), namespace)
+        self.bind_function = namespace["bind"]
+
+    def degrees(self):
+        return [output.degree for output in self.outputs]
+
+    def bind(self, challenge_values):
+        """A function mapping a row of integers to the tuple of output values"""
+        assert len(challenge_values) == len(self.challenge_names)
+        return self.bind_function([int(value) for value in challenge_values])
+
+    def evaluate_columns(self, columns, challenge_values, start=0, end=None):
+        """Every output on rows start..end-1 of columns given as value lists"""
+        evaluate_row = self.bind(challenge_values)
+        if end is None:
+            end = len(columns[self.column_names.index(self.used_columns[0])])
+        row = [0] * len(self.column_names)
+        indices = [self.column_names.index(name) for name in set(self.used_columns)]
+        results = [[] for _ in self.outputs]
+        for i in range(start, end):
+            for index in indices:
+                row[index] = columns[index][i]
+            for result, value in zip(results, evaluate_row(row)):
+                result.append(value)
+        return results
+
+
+class RelationDSLTest(unittest.TestCase):
+    def test_common_subexpressions_are_shared(self):
+        (x, y) = (column("x"), column("y"))
+        gamma = challenge("gamma")
+        first = (x + y * gamma) * (x + y * gamma) + gamma * gamma
+        second = (gamma * y + x) * 3 - 1
+        self.assertIs(first.operands[0].operands[0], second.operands[0].operands[0])
+        compiled = CompiledExpressions([first, second], ["x", "y"], ["gamma"])
+        self.assertEqual(compiled.degrees(), [2, 1])
+        # x + y * gamma appears once, gamma * gamma is out of the row function
+        self.assertEqual(compiled.source.count(" * "), 4)
+        (hoisted, row) = compiled.source.split("def evaluate_row")
+        self.assertEqual(hoisted.count(" * "), 1)
+        self.assertEqual(compiled.row_multiplications, 3)
+
+        evaluate_row = compiled.bind([5])
+        self.assertEqual(evaluate_row([2, 3]), (17 * 17 + 25, (17 * 3 - 1)))
+        self.assertEqual(evaluate_row([0, 0])[1], MODULUS - 1)
+        self.assertEqual(
+            compiled.evaluate_columns([[2, 0], [3, 0]], [5]),
+            [[17 * 17 + 25, 25], [17 * 3 - 1, MODULUS - 1]],
+        )
+
+    def test_unknown_names_are_rejected(self):
+        with self.assertRaises(ValueError):
+            CompiledExpressions([column("x") * challenge("beta")], ["x"], [])
+        with self.assertRaises(ValueError):
+            CompiledExpressions([column("z")], ["x"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
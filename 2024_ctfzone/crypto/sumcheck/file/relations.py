@@ -1,210 +1,374 @@
-from ff import Fr
+from ff import Fr, FF
+from field_vector import MODULUS, FieldVector
 from proof_polynomials import AllPolynomials
+from relation_dsl import CompiledExpressions, column, challenge
 from collections import namedtuple
+import random
+import unittest
 
 RelationChallenges = namedtuple(
     "AllPolynomials", ["beta", "gamma"], defaults=[Fr(-2), Fr(-1)]
 )
+RELATION_CHALLENGE_NAMES = RelationChallenges._fields
 
+# The relation spec. Everything below is an expression over one row of the
+# instance, so the sumcheck prover, the verifier and the instance generator
+# all evaluate the same definitions.
 
-class ArithmeticRelation:
-    def __init__(self, challenges):
-        pass
+ROW = AllPolynomials(*[column(name) for name in AllPolynomials._fields])
+BETA = challenge("beta")
+GAMMA = challenge("gamma")
+BETA_SQR = BETA * BETA
+BETA_CUBE = BETA_SQR * BETA
 
-    def get_power(self):
-        return 4
+PERMUTATION_NUMERATOR = (
+    (ROW.id_l + ROW.w_l * BETA + GAMMA)
+    * (ROW.id_r + ROW.w_r * BETA + GAMMA)
+    * (ROW.id_o + ROW.w_o * BETA + GAMMA)
+)
+PERMUTATION_DENOMINATOR = (
+    (ROW.sigma_l + ROW.w_l * BETA + GAMMA)
+    * (ROW.sigma_r + ROW.w_r * BETA + GAMMA)
+    * (ROW.sigma_o + ROW.w_o * BETA + GAMMA)
+)
+# A looked up row in the order of the table columns
+LOOKUP_WIRE_TERMS = (
+    ROW.q_m,
+    ROW.w_l + ROW.q_l * ROW.w_l_shift,
+    ROW.w_r + ROW.q_r * ROW.w_r_shift,
+    ROW.w_o + ROW.q_o * ROW.w_o_shift,
+)
+LOOKUP_WIRE_COMBINATION = (
+    GAMMA
+    + LOOKUP_WIRE_TERMS[0]
+    + LOOKUP_WIRE_TERMS[1] * BETA
+    + LOOKUP_WIRE_TERMS[2] * BETA_SQR
+    + LOOKUP_WIRE_TERMS[3] * BETA_CUBE
+)
+LOOKUP_TABLE_COMBINATION = (
+    GAMMA
+    + ROW.table_0
+    + ROW.table_1 * BETA
+    + ROW.table_2 * BETA_SQR
+    + ROW.table_3 * BETA_CUBE
+)
 
-    def evaluate(self, all_polynomials: AllPolynomials):
-        result = []
-        for i in range(len(all_polynomials.q_arith)):
-            result.append(
-                all_polynomials.q_arith[i]
-                * (
-                    all_polynomials.q_m[i]
-                    * all_polynomials.w_l[i]
-                    * all_polynomials.w_r[i]
-                    + all_polynomials.q_l[i] * all_polynomials.w_l[i]
-                    + all_polynomials.q_r[i] * all_polynomials.w_r[i]
-                    + all_polynomials.q_o[i] * all_polynomials.w_o[i]
-                    + all_polynomials.q_c[i]
-                )
-            )
-        return result
 
+def compile_relation_spec(outputs, extra_challenge_names=()):
+    return CompiledExpressions(
+        outputs,
+        AllPolynomials._fields,
+        RELATION_CHALLENGE_NAMES + tuple(extra_challenge_names),
+    )
 
-class PermutationConsequentRelationNoPublicInputs:
 
-    def __init__(self, challenges: RelationChallenges):
-        self.challenges = challenges
-        pass
+def get_challenge_values(challenges: RelationChallenges):
+    return tuple(int(element.value) for element in challenges)
 
-    def get_power(self):
-        return 5
-
-    def compute_numerator(self, all_polynomials: AllPolynomials, i: int):
-        (beta, gamma) = self.challenges.beta, self.challenges.gamma
-        return (
-            (all_polynomials.id_l[i] + all_polynomials.w_l[i] * beta + gamma)
-            * (all_polynomials.id_r[i] + all_polynomials.w_r[i] * beta + gamma)
-            * (all_polynomials.id_o[i] + all_polynomials.w_o[i] * beta + gamma)
-        )
 
-    def compute_denominator(self, all_polynomials: AllPolynomials, i: int):
-        (beta, gamma) = self.challenges.beta, self.challenges.gamma
-        return (
-            (all_polynomials.sigma_l[i] + all_polynomials.w_l[i] * beta + gamma)
-            * (all_polynomials.sigma_r[i] + all_polynomials.w_r[i] * beta + gamma)
-            * (all_polynomials.sigma_o[i] + all_polynomials.w_o[i] * beta + gamma)
-        )
+def get_column_values(polynomial):
+    if isinstance(polynomial, FieldVector):
+        return polynomial.values
+    return [
+        element.value if isinstance(element, FF) else element for element in polynomial
+    ]
 
-    def evaluate(self, all_polynomials: AllPolynomials):
-        result = []
-        for i in range(len(all_polynomials.permutation)):
-            result.append(
-                (
-                    (all_polynomials.lagrange_first[i] + all_polynomials.permutation[i])
-                    * self.compute_numerator(all_polynomials, i)
-                )
-                - (
-                    (
-                        all_polynomials.permutation_shift[i]
-                        + all_polynomials.lagrange_last[i]
-                    )
-                    * self.compute_denominator(all_polynomials, i)
-                )
-            )
-        return result
 
+def evaluate_on_columns(compiled, all_polynomials, challenges):
+    """Every output of compiled on every row of all_polynomials, as value lists"""
+    return compiled.evaluate_columns(
+        [get_column_values(polynomial) for polynomial in all_polynomials],
+        get_challenge_values(challenges),
+    )
 
-class PermutationRelationLastElement:
 
-    def __init__(self, challenges: RelationChallenges):
-        self.challenges = challenges
-        pass
+PERMUTATION_GRAND_PRODUCT_TERMS = compile_relation_spec(
+    [PERMUTATION_NUMERATOR, PERMUTATION_DENOMINATOR]
+)
+LOOKUP_WIRE_ROW = compile_relation_spec(LOOKUP_WIRE_TERMS)
+LOOKUP_INVERSE_DENOMINATOR = compile_relation_spec(
+    [LOOKUP_WIRE_COMBINATION * LOOKUP_TABLE_COMBINATION]
+)
 
-    def get_power(self):
-        return 5
 
-    def evaluate(self, all_polynomials: AllPolynomials):
-        result = []
-        for i in range(len(all_polynomials.permutation)):
-            result.append(
-                all_polynomials.lagrange_last[i] * all_polynomials.permutation_shift[i]
-            )
-        return result
+class Relation:
+    """A relation given by one expression of the spec
 
+    power is the degree the protocol budgets for the relation. It may exceed
+    the degree of the expression, but never be below it.
+    """
+
+    expression = None
+    power = None
+    compiled = None
 
-class LookupMainRelation:
     def __init__(self, challenges: RelationChallenges):
         self.challenges = challenges
-        self.beta = challenges.beta
-        self.gamma = challenges.gamma
-        self.beta_sqr = challenges.beta * challenges.beta
-        self.beta_cube = challenges.beta * self.beta_sqr
-        pass
+        self.evaluate_row_values = self.compiled.bind(get_challenge_values(challenges))
 
     def get_power(self):
-        return 3
+        return self.power
 
     def evaluate(self, all_polynomials: AllPolynomials):
-        (gamma, beta, beta_sqr, beta_cube) = (
-            self.gamma,
-            self.beta,
-            self.beta_sqr,
-            self.beta_cube,
+        (values,) = evaluate_on_columns(self.compiled, all_polynomials, self.challenges)
+        return [Fr(value) for value in values]
+
+    def evaluate_row(self, row: AllPolynomials):
+        """Value of the relation at one row of plain integers"""
+        return self.evaluate_row_values(row)[0]
+
+
+def compile_relation(relation_class):
+    relation_class.compiled = compile_relation_spec([relation_class.expression])
+    if relation_class.expression.degree > relation_class.power:
+        raise ValueError(
+            f"{relation_class.__name__} has degree {relation_class.expression.degree}"
+            f" above its power {relation_class.power}"
         )
-        result = []
-        for i in range(len(all_polynomials.log_inverse)):
-            result.append(
-                (
-                    (
-                        gamma
-                        + all_polynomials.q_m[i]
-                        + (
-                            all_polynomials.w_l[i]
-                            + all_polynomials.q_l[i] * all_polynomials.w_l_shift[i]
-                        )
-                        * beta
-                        + (
-                            all_polynomials.w_r[i]
-                            + all_polynomials.q_r[i] * all_polynomials.w_r_shift[i]
-                        )
-                        * beta_sqr
-                        + (
-                            all_polynomials.w_o[i]
-                            + all_polynomials.q_o[i] * all_polynomials.w_o_shift[i]
-                        )
-                        * beta_cube
-                    )
-                    * all_polynomials.log_inverse[i]
-                    * all_polynomials.table_multiplicity[i]
-                )
-                - (
-                    (
-                        gamma
-                        + all_polynomials.table_0[i]
-                        + all_polynomials.table_1[i] * beta
-                        + all_polynomials.table_2[i] * beta_sqr
-                        + all_polynomials.table_3[i] * beta_cube
-                    )
-                    * all_polynomials.log_inverse[i]
-                    * all_polynomials.q_lookup[i]
-                )
-            )
-        return result
+    return relation_class
 
 
-class LookupInverseCorrectness:
-    def __init__(self, challenges: RelationChallenges):
-        self.challenges = challenges
-        self.beta = challenges.beta
-        self.gamma = challenges.gamma
-        self.beta_sqr = challenges.beta * challenges.beta
-        self.beta_cube = challenges.beta * self.beta_sqr
-        pass
+@compile_relation
+class ArithmeticRelation(Relation):
+    power = 4
+    expression = ROW.q_arith * (
+        ROW.q_m * ROW.w_l * ROW.w_r
+        + ROW.q_l * ROW.w_l
+        + ROW.q_r * ROW.w_r
+        + ROW.q_o * ROW.w_o
+        + ROW.q_c
+    )
 
-    def get_power(self):
-        return 3
 
-    def evaluate(self, all_polynomials: AllPolynomials):
-        (gamma, beta, beta_sqr, beta_cube) = (
-            self.gamma,
-            self.beta,
-            self.beta_sqr,
-            self.beta_cube,
+@compile_relation
+class PermutationConsequentRelationNoPublicInputs(Relation):
+    power = 5
+    expression = (ROW.lagrange_first + ROW.permutation) * PERMUTATION_NUMERATOR - (
+        ROW.permutation_shift + ROW.lagrange_last
+    ) * PERMUTATION_DENOMINATOR
+
+
+@compile_relation
+class PermutationRelationLastElement(Relation):
+    power = 5
+    expression = ROW.lagrange_last * ROW.permutation_shift
+
+
+@compile_relation
+class LookupMainRelation(Relation):
+    power = 4
+    expression = ROW.log_inverse * (
+        LOOKUP_WIRE_COMBINATION * ROW.table_multiplicity
+        - LOOKUP_TABLE_COMBINATION * ROW.q_lookup
+    )
+
+
+@compile_relation
+class LookupInverseCorrectness(Relation):
+    power = 4
+    expression = LOOKUP_WIRE_COMBINATION * ROW.log_inverse * LOOKUP_TABLE_COMBINATION - 1
+
+
+FULL_DOMAIN_RELATIONS = [LookupMainRelation]
+PER_ROW_RELATIONS = [
+    ArithmeticRelation,
+    PermutationConsequentRelationNoPublicInputs,
+    PermutationRelationLastElement,
+]
+SEPARATE_RELATION = LookupInverseCorrectness
+
+
+def create_relations(challenges: RelationChallenges):
+    """(full domain relations, per row relations, separate logup relation)"""
+    full_domain_relations = [
+        relation_class(challenges) for relation_class in FULL_DOMAIN_RELATIONS
+    ]
+    per_row_relations = [
+        relation_class(challenges) for relation_class in PER_ROW_RELATIONS
+    ]
+    separate_relation = SEPARATE_RELATION(challenges)
+    return (full_domain_relations, per_row_relations, separate_relation)
+
+
+def get_extended_length(per_row_relations):
+    max_power = 0
+    for relation in per_row_relations:
+        max_power = max(max_power, relation.get_power())
+    return max_power + 2  # 1 for power -> coeff  + 1 for zeta
+
+
+# Points of the round univariates: 1 for power -> coeff + 1 for zeta
+EXTENDED_LENGTH = max(relation.power for relation in PER_ROW_RELATIONS) + 2
+
+
+def compile_round_program():
+    """(batched relations, batched logup relation) of a row for challenge alpha
+
+    Full domain relations and then per row relations are weighted with
+    consecutive powers of alpha, and the per row ones and the logup relation
+    are multiplied by the zeta power of the row.
+    """
+    alpha = challenge("alpha")
+    weighted = []
+    weight = None
+    for relation_class in FULL_DOMAIN_RELATIONS + PER_ROW_RELATIONS:
+        weighted.append(
+            relation_class.expression
+            if weight is None
+            else weight * relation_class.expression
+        )
+        weight = alpha if weight is None else weight * alpha
+    full_domain_sum = weighted[0]
+    for expression in weighted[1 : len(FULL_DOMAIN_RELATIONS)]:
+        full_domain_sum = full_domain_sum + expression
+    per_row_sum = weighted[len(FULL_DOMAIN_RELATIONS)]
+    for expression in weighted[len(FULL_DOMAIN_RELATIONS) + 1 :]:
+        per_row_sum = per_row_sum + expression
+    round_program = compile_relation_spec(
+        [
+            full_domain_sum + per_row_sum * ROW.zeta_powers,
+            SEPARATE_RELATION.expression * ROW.zeta_powers,
+        ],
+        ["alpha"],
+    )
+    if max(round_program.degrees()) >= EXTENDED_LENGTH:
+        raise ValueError("Relations do not fit in the round univariates")
+    return round_program
+
+
+ROUND_PROGRAM = compile_round_program()
+
+
+def evaluate_round_program(all_polynomials, challenges, alpha):
+    """Batched relation and logup relation values of every row"""
+    return ROUND_PROGRAM.evaluate_columns(
+        [get_column_values(polynomial) for polynomial in all_polynomials],
+        get_challenge_values(challenges) + (int(alpha.value),),
+    )
+
+
+class RoundKernel:
+    """All sumcheck relations batched with powers of alpha, evaluated edge by edge"""
+
+    def __init__(self, challenges: RelationChallenges, alpha: Fr):
+        self.extended_length = EXTENDED_LENGTH
+        self.evaluate_row = ROUND_PROGRAM.bind(
+            get_challenge_values(challenges) + (int(alpha.value),)
+        )
+
+    def accumulate(self, columns, start, end, result, logup_result):
+        """Add the contribution of edges start..end-1 to the round univariates
+
+        columns are lists of integers in AllPolynomials order. Every edge is
+        extended point by point and all relations are evaluated on that single
+        row, so no intermediate polynomials are built.
+        """
+        length = self.extended_length
+        evaluate_row = self.evaluate_row
+        for edge in range(2 * start, 2 * end, 2):
+            values = [column[edge] for column in columns]
+            differences = [
+                column[edge + 1] - value for column, value in zip(columns, values)
+            ]
+            for point in range(length):
+                if point != 0:
+                    values = [
+                        (value + difference) % MODULUS
+                        for value, difference in zip(values, differences)
+                    ]
+                (batched, logup) = evaluate_row(values)
+                result[point] = (result[point] + batched) % MODULUS
+                logup_result[point] = (logup_result[point] + logup) % MODULUS
+
+
+class RelationsTest(unittest.TestCase):
+    def test_spec_matches_reference_formulas(self):
+        challenges = RelationChallenges(
+            Fr.from_bytes(random.randbytes(32)), Fr.from_bytes(random.randbytes(32))
+        )
+        (beta, gamma) = (challenges.beta.value, challenges.gamma.value)
+        (beta_sqr, beta_cube) = (beta * beta, beta * beta * beta)
+        row = AllPolynomials(
+            *[Fr.from_bytes(random.randbytes(32)).value for _ in AllPolynomials._fields]
+        )
+        numerator = (
+            (row.id_l + row.w_l * beta + gamma)
+            * (row.id_r + row.w_r * beta + gamma)
+            * (row.id_o + row.w_o * beta + gamma)
+        )
+        denominator = (
+            (row.sigma_l + row.w_l * beta + gamma)
+            * (row.sigma_r + row.w_r * beta + gamma)
+            * (row.sigma_o + row.w_o * beta + gamma)
         )
-        result = []
-        for i in range(len(all_polynomials.log_inverse)):
-            result.append(
-                (
-                    (
-                        gamma
-                        + all_polynomials.q_m[i]
-                        + (
-                            all_polynomials.w_l[i]
-                            + all_polynomials.q_l[i] * all_polynomials.w_l_shift[i]
-                        )
-                        * beta
-                        + (
-                            all_polynomials.w_r[i]
-                            + all_polynomials.q_r[i] * all_polynomials.w_r_shift[i]
-                        )
-                        * beta_sqr
-                        + (
-                            all_polynomials.w_o[i]
-                            + all_polynomials.q_o[i] * all_polynomials.w_o_shift[i]
-                        )
-                        * beta_cube
-                    )
-                    * all_polynomials.log_inverse[i]
-                    * (
-                        gamma
-                        + all_polynomials.table_0[i]
-                        + all_polynomials.table_1[i] * beta
-                        + all_polynomials.table_2[i] * beta_sqr
-                        + all_polynomials.table_3[i] * beta_cube
-                    )
-                    - Fr(1)
-                )
+        wire_combination = (
+            gamma
+            + row.q_m
+            + (row.w_l + row.q_l * row.w_l_shift) * beta
+            + (row.w_r + row.q_r * row.w_r_shift) * beta_sqr
+            + (row.w_o + row.q_o * row.w_o_shift) * beta_cube
+        )
+        table_combination = (
+            gamma
+            + row.table_0
+            + row.table_1 * beta
+            + row.table_2 * beta_sqr
+            + row.table_3 * beta_cube
+        )
+        expected = {
+            ArithmeticRelation: row.q_arith
+            * (
+                row.q_m * row.w_l * row.w_r
+                + row.q_l * row.w_l
+                + row.q_r * row.w_r
+                + row.q_o * row.w_o
+                + row.q_c
+            ),
+            PermutationConsequentRelationNoPublicInputs: (
+                (row.lagrange_first + row.permutation) * numerator
+                - (row.permutation_shift + row.lagrange_last) * denominator
+            ),
+            PermutationRelationLastElement: row.lagrange_last * row.permutation_shift,
+            LookupMainRelation: row.log_inverse
+            * (
+                wire_combination * row.table_multiplicity
+                - table_combination * row.q_lookup
+            ),
+            LookupInverseCorrectness: wire_combination
+            * row.log_inverse
+            * table_combination
+            - 1,
+        }
+        for relation_class, value in expected.items():
+            self.assertEqual(
+                relation_class(challenges).evaluate_row(row), value % MODULUS
             )
-        return result
+        alpha = Fr.from_bytes(random.randbytes(32))
+        (batched, logup) = RoundKernel(challenges, alpha).evaluate_row(list(row))
+        per_row_sum = sum(
+            expected[relation_class] * alpha.pow(i + 1).value
+            for i, relation_class in enumerate(PER_ROW_RELATIONS)
+        )
+        self.assertEqual(
+            batched,
+            (expected[LookupMainRelation] + per_row_sum * row.zeta_powers) % MODULUS,
+        )
+        self.assertEqual(
+            logup, expected[LookupInverseCorrectness] * row.zeta_powers % MODULUS
+        )
+
+    def test_degrees(self):
+        self.assertEqual(
+            [
+                relation_class.expression.degree
+                for relation_class in FULL_DOMAIN_RELATIONS
+                + PER_ROW_RELATIONS
+                + [SEPARATE_RELATION]
+            ],
+            [4, 4, 4, 2, 4],
+        )
+        self.assertEqual(ROUND_PROGRAM.degrees(), [5, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
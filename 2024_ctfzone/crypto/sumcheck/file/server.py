@@ -1,7 +1,13 @@
 from prover import Verifier
-import socketserver
+from kzg import KZG
 from flag import flag
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import json
 import logging
+import os
+import signal
+import time
 
 HOST = "0.0.0.0"
 PORT = 1337
@@ -13,79 +19,240 @@ prompt = ">"
 standard_xor_vk = b""
 impossible_xor_vk = b""
 PROOF_SIZE = 7140
+
+# Verifications waiting for or running on a worker, across all connections
+MAX_PENDING_VERIFICATIONS = 2000
+# Seconds a client may stay silent before the connection is dropped
+READ_TIMEOUT = 300
+# Seconds a connection waits for its verification result, and a worker spends
+# on one verification
+VERIFICATION_TIMEOUT = 120
+STATISTICS_LOG_INTERVAL = 60
+
 with open("standard_xor.vk", "r") as f:
     standard_xor_vk = bytes.fromhex(f.read())
 
 with open("impossible_xor.vk", "r") as f:
     impossible_xor_vk = bytes.fromhex(f.read())
 
+STANDARD_XOR = "standard_xor"
+IMPOSSIBLE_XOR = "impossible_xor"
 
-class CheckHandler(socketserver.BaseRequestHandler):
-    """
-    The RequestHandler class for our server.
 
-    It is instantiated once per connection to the server, and must
-    override the handle() method to implement communication to the
-    client.
-    """
+def warm_up_worker():
+    # Map and validate the SRS before the first proof arrives
+    KZG()
 
-    def handle(self):
 
-        self.request.sendall((hello_string + prompt).encode())
-        while True:
-            try:
-                data = b""
-                while len(data) < (PROOF_SIZE * 2):
-                    data += self.request.recv(128)
-                proof_data = bytes.fromhex(data.strip().decode())
-                if len(proof_data) < PROOF_SIZE:
-                    self.request.sendall(
-                        ("PROOF is too short, try again\n" + prompt).encode()
-                    )
+def verification_timed_out(signum, frame):
+    raise TimeoutError("Verification took too long")
+
+
+def verify_proof(circuit, proof_data):
+    """Runs in a worker process, stopped after VERIFICATION_TIMEOUT seconds"""
+    signal.signal(signal.SIGALRM, verification_timed_out)
+    signal.alarm(VERIFICATION_TIMEOUT)
+    try:
+        if circuit == STANDARD_XOR:
+            return Verifier(proof_data).verify(standard_xor_vk)
+        return Verifier(proof_data).verify(impossible_xor_vk)
+    finally:
+        signal.alarm(0)
+
+
+class ServerStatistics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connections = 0
+        self.active_connections = 0
+        self.proofs_received = 0
+        self.proofs_verified = 0
+        self.proofs_accepted = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.busy_rejections = 0
+        self.timeouts = 0
+        self.verification_seconds = 0.0
+
+    def snapshot(self):
+        uptime = time.monotonic() - self.started
+        return {
+            "uptime": uptime,
+            "connections": self.connections,
+            "active_connections": self.active_connections,
+            "proofs_received": self.proofs_received,
+            "proofs_verified": self.proofs_verified,
+            "proofs_accepted": self.proofs_accepted,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "busy_rejections": self.busy_rejections,
+            "timeouts": self.timeouts,
+            "proofs_per_second": self.proofs_verified / uptime if uptime > 0 else 0,
+            "average_verification_seconds": (
+                self.verification_seconds / self.proofs_verified
+                if self.proofs_verified > 0
+                else 0
+            ),
+        }
+
+
+class CheckServer:
+    def __init__(self, executor, max_pending=MAX_PENDING_VERIFICATIONS):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.statistics = ServerStatistics()
+
+    async def read_proof_hex(self, reader):
+        # Whitespace left over from the previous proof (e.g. a newline) is
+        # skipped, then exactly PROOF_SIZE * 2 hex characters are read
+        data = b""
+        while len(data) < PROOF_SIZE * 2:
+            data += await asyncio.wait_for(
+                reader.readexactly(PROOF_SIZE * 2 - len(data)), READ_TIMEOUT
+            )
+            data = data.lstrip()
+        return data
+
+    def submit_verification(self, circuit, proof_data):
+        """Hand a proof to the workers, or return None when the server is full
+
+        The proof counts as pending from here until a worker is done with it,
+        even if its connection stopped waiting for the result.
+        """
+        statistics = self.statistics
+        if statistics.queue_depth >= self.max_pending:
+            statistics.busy_rejections += 1
+            return None
+        future = self.executor.submit(verify_proof, circuit, proof_data)
+        statistics.queue_depth += 1
+        statistics.max_queue_depth = max(
+            statistics.max_queue_depth, statistics.queue_depth
+        )
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self.verification_done)
+        )
+        return future
+
+    def verification_done(self):
+        self.statistics.queue_depth -= 1
+
+    async def run_verification(self, future):
+        statistics = self.statistics
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(future), VERIFICATION_TIMEOUT
+            )
+        finally:
+            # Drops the proof if no worker picked it up yet. A verification
+            # already running is stopped by its worker's alarm.
+            future.cancel()
+        statistics.proofs_verified += 1
+        statistics.verification_seconds += time.monotonic() - start
+        if result:
+            statistics.proofs_accepted += 1
+        return result
+
+    async def check_proof(self, writer, proof_data):
+        if proof_data[: len(standard_xor_vk)] == standard_xor_vk:
+            circuit = STANDARD_XOR
+            writer.write(b"Checking standard xor proof:\n")
+        elif proof_data[: len(impossible_xor_vk)] == impossible_xor_vk:
+            circuit = IMPOSSIBLE_XOR
+            writer.write(b"Checking impossible xor proof:\n")
+        else:
+            writer.write(b"No idea what this circuit is (unknown verification key)\n")
+            return
+        future = self.submit_verification(circuit, proof_data)
+        if future is None:
+            writer.write(b"Server is busy, try again later\n")
+            return
+        try:
+            await writer.drain()
+        except BaseException:
+            future.cancel()
+            raise
+        result = await self.run_verification(future)
+        if circuit == STANDARD_XOR:
+            if result:
+                writer.write(b"Success! But you don't get the flag\n")
+            else:
+                writer.write(b"Verification failed. Surprising\n")
+        else:
+            if result:
+                writer.write(f"Success! {flag}\n".encode())
+            else:
+                writer.write(b"Verification failed\n")
+
+    async def handle(self, reader, writer):
+        self.statistics.connections += 1
+        self.statistics.active_connections += 1
+        try:
+            writer.write((hello_string + prompt).encode())
+            while True:
+                try:
+                    data = await self.read_proof_hex(reader)
+                    proof_data = bytes.fromhex(data.strip().decode())
+                    if len(proof_data) < PROOF_SIZE:
+                        writer.write(
+                            ("PROOF is too short, try again\n" + prompt).encode()
+                        )
+                        continue
+                    self.statistics.proofs_received += 1
+                    await self.check_proof(writer, proof_data)
+                    writer.write(prompt.encode())
+                    await writer.drain()
                     continue
-                if proof_data[: len(standard_xor_vk)] == standard_xor_vk:
-                    self.request.sendall(b"Checking standard xor proof:\n")
-                    verifier = Verifier(proof_data)
-                    result = verifier.verify(standard_xor_vk)
-                    if result:
-                        self.request.sendall(b"Success! But you don't get the flag\n")
-                    else:
-                        self.request.sendall(b"Verification failed. Surprising\n")
-                elif proof_data[: len(impossible_xor_vk)] == impossible_xor_vk:
-                    self.request.sendall(b"Checking impossible xor proof:\n")
-                    verifier = Verifier(proof_data)
-                    result = verifier.verify(impossible_xor_vk)
-                    if result:
-                        self.request.sendall(f"Success! {flag}\n".encode())
-                    else:
-                        self.request.sendall(b"Verification failed\n")
-                else:
-                    self.request.sendall(
-                        b"No idea what this circuit is (unknown verification key)\n"
+
+                except ValueError:
+                    logging.error("Conversion problem or bad data")
+                    writer.write(
+                        ("Malformed data (did you send hex?)\n" + prompt).encode()
                     )
-                self.request.sendall(prompt.encode())
-                continue
-
-            except ValueError:
-                logging.error("Conversion problem or bad data")
-                self.request.sendall(
-                    ("Malformed data (did you send hex?)\n" + prompt).encode()
-                )
-                continue
-            except ConnectionResetError:
-                logging.error("Connection reset by client")
-                return
-            except UnicodeDecodeError:
-                logging.error("Client sent weird data")
-                return
-            except AttributeError:
-                logging.error("Malformed command")
-                self.request.sendall(("Malformed command\n" + prompt).encode())
-                continue
-
-            except Exception as e:
-                self.request.sendall((f"Encountered exception {e}").encode())
-                return
+                    continue
+                except asyncio.IncompleteReadError:
+                    return
+                except (ConnectionResetError, BrokenPipeError):
+                    logging.error("Connection reset by client")
+                    return
+                except UnicodeDecodeError:
+                    logging.error("Client sent weird data")
+                    return
+                except asyncio.TimeoutError:
+                    self.statistics.timeouts += 1
+                    logging.error("Client timed out")
+                    writer.write(b"Timed out\n")
+                    return
+
+                except Exception as e:
+                    writer.write((f"Encountered exception {e}").encode())
+                    return
+        finally:
+            self.statistics.active_connections -= 1
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
+    async def log_statistics(self):
+        while True:
+            await asyncio.sleep(STATISTICS_LOG_INTERVAL)
+            logging.info("Statistics: " + json.dumps(self.statistics.snapshot()))
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(
+            self.handle, host, port, backlog=MAX_PENDING_VERIFICATIONS, reuse_address=True
+        )
+        logging.info(f"Started listenning on {host}:{port}")
+        statistics_task = asyncio.create_task(self.log_statistics())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            statistics_task.cancel()
 
 
 if __name__ == "__main__":
@@ -96,12 +263,9 @@ if __name__ == "__main__":
         filename="server.log",
         filemode="w",
     )
-    server = socketserver.ThreadingTCPServer(
-        (HOST, PORT), CheckHandler, bind_and_activate=False
-    )
-    server.request_queue_size = 2000
-    server.allow_reuse_address = True
-    server.server_bind()
-    server.server_activate()
-    logging.info(f"Started listenning on {HOST}:{PORT}")
-    server.serve_forever()
+    worker_count = os.cpu_count()
+    with ProcessPoolExecutor(worker_count, initializer=warm_up_worker) as executor:
+        # Start every worker now instead of on the first proofs
+        for future in [executor.submit(time.sleep, 0) for _ in range(worker_count)]:
+            future.result()
+        asyncio.run(CheckServer(executor).serve(HOST, PORT))
@@ -3,8 +3,10 @@ from transcript import ProverTranscript, VerifierTranscript, map_tuple_from_int_
 from dataclasses import dataclass
 from py_ecc.optimized_bn128.optimized_curve import multiply, normalize, add, neg, Z1, G1
 from py_ecc.fields import optimized_bn128_FQ
-from polynomial import compute_quotient, batch_inverse, evaluate_polynomial
+from polynomial import batch_divide, compute_quotient, evaluate_polynomial
+from field_vector import FieldVector, as_field_vector, to_value
 from kzg import KZG, convert_to_working_point
+from profiling import span, count, SCALAR_MULTIPLICATIONS
 
 
 @dataclass
@@ -21,57 +23,76 @@ class VerifierOpeningClaim:
     y: Fr
 
 
+def batching_challenge_powers(batching_challenge, count):
+    powers = [Fr(1)]
+    for _ in range(1, count):
+        powers.append(powers[-1] * batching_challenge)
+    return powers
+
+
+def group_claims(claims, key):
+    """Indices of the claims grouped by key(claim), in order of appearance"""
+    groups = dict()
+    for i, claim in enumerate(claims):
+        groups.setdefault(key(claim), []).append(i)
+    return list(groups.values())
+
+
 def compute_batched_quotient(claims: list[ProverOpeningClaim], batching_challenge):
-    maximum_size = 0
-    for claim in claims:
-        maximum_size = max(maximum_size, len(claim.polynomial))
-    result = compute_quotient(claims[0].polynomial, claims[0].x, claims[0].y)
-    if len(result) < maximum_size:
-        result.extend([Fr(0) for _ in range(maximum_size - len(result))])
-    current_power = batching_challenge
-    for i in range(1, len(claims)):
-        sub_quotient = compute_quotient(claims[i].polynomial, claims[i].x, claims[i].y)
-        for j in range(len(sub_quotient)):
-            result[j] += sub_quotient[j] * current_power
-        current_power *= batching_challenge
+    """Σ batching_challenge^i * (p_i(X) - y_i) / (X - x_i)
+
+    The claims at one point are combined first and divided once.
+    """
+    maximum_size = max(len(claim.polynomial) for claim in claims)
+    powers = batching_challenge_powers(batching_challenge, len(claims))
+    result = FieldVector.zeros(maximum_size)
+    for indices in group_claims(claims, lambda claim: to_value(claim.x)):
+        numerator = FieldVector.zeros(
+            max(len(claims[i].polynomial) for i in indices)
+        )
+        for i in indices:
+            numerator.add_scaled(as_field_vector(claims[i].polynomial), powers[i])
+            numerator[0] -= claims[i].y * powers[i]
+        remainder = numerator.divide_by_linear(claims[indices[0]].x)
+        assert remainder == Fr(0)
+        result += numerator
     return result
 
 
 def compute_partially_evaluated_batched_quotient(
     claims: list[ProverOpeningClaim], batching_challenge, opening_challenge
 ):
-    maximum_size = 0
-    for claim in claims:
-        maximum_size = max(maximum_size, len(claim.polynomial))
-    inverse_preparation = [opening_challenge - claim.x for claim in claims]
-    inverted = batch_inverse(inverse_preparation)
-    result = [claims[0].polynomial[i] for i in range(len(claims[0].polynomial))]
-    result[0] -= claims[0].y
-    for i in range(len(result)):
-        result[i] *= inverted[0]
-    if len(result) < maximum_size:
-        result.extend([Fr(0) for _ in range(maximum_size - len(result))])
-    current_power = batching_challenge
-    for i in range(1, len(claims)):
-        multiplicand = current_power * inverted[i]
-        for j in range(len(claims[i].polynomial)):
-            if j != 0:
-                result[j] += claims[i].polynomial[j] * multiplicand
-            else:
-                result[j] += (claims[i].polynomial[j] - claims[i].y) * multiplicand
-        current_power *= batching_challenge
+    """Σ batching_challenge^i * (p_i(X) - y_i) / (opening_challenge - x_i)
+
+    Claims on the same polynomial are added to the result once.
+    """
+    maximum_size = max(len(claim.polynomial) for claim in claims)
+    # batching_challenge^i / (opening_challenge - x_i) for every claim
+    multiplicands = batch_divide(
+        batching_challenge_powers(batching_challenge, len(claims)),
+        [opening_challenge - claim.x for claim in claims],
+    )
+    result = FieldVector.zeros(maximum_size)
+    for indices in group_claims(claims, lambda claim: id(claim.polynomial)):
+        multiplicand = Fr(0)
+        for i in indices:
+            multiplicand += multiplicands[i]
+            result[0] -= claims[i].y * multiplicands[i]
+        result.add_scaled(as_field_vector(claims[indices[0]].polynomial), multiplicand)
     return result
 
 
 def compute_partially_evaluated_batched_quotient_commitment(
     claims: list[VerifierOpeningClaim], batching_challenge, opening_challenge
 ):
-    inverse_preparation = [opening_challenge - claim.x for claim in claims]
-    inverted = batch_inverse(inverse_preparation)
+    multiplicands = batch_divide(
+        batching_challenge_powers(batching_challenge, len(claims)),
+        [opening_challenge - claim.x for claim in claims],
+    )
+    count(SCALAR_MULTIPLICATIONS, 2 * len(claims))
     result = Z1
-    current_power = Fr(1)
     for i, claim in enumerate(claims):
-        multiplicand = inverted[i] * current_power
+        multiplicand = multiplicands[i]
         result = add(
             result,
             multiply(
@@ -82,49 +103,59 @@ def compute_partially_evaluated_batched_quotient_commitment(
                 multiplicand.value,
             ),
         )
-        current_power *= batching_challenge
     return result
 
 
 class ShplonkProver:
     def __init__(
-        self, opening_claims: list[ProverOpeningClaim], transcript: ProverTranscript
+        self,
+        opening_claims: list[ProverOpeningClaim],
+        transcript: ProverTranscript,
+        kzg: KZG = None,
     ):
         self.opening_claims = opening_claims
         self.transcript = transcript
-        self.kzg = KZG()
+        self.kzg = kzg if kzg is not None else KZG()
 
     def prove(self):
         shplonk_batching_challenge = self.transcript.get_challenge()
 
-        batched_quotient = compute_batched_quotient(
-            self.opening_claims, shplonk_batching_challenge
-        )
-        batched_quotient_commitment = self.kzg.commit(batched_quotient)
+        with span("batched_quotient"):
+            batched_quotient = compute_batched_quotient(
+                self.opening_claims, shplonk_batching_challenge
+            )
+            batched_quotient_commitment = self.kzg.commit(batched_quotient)
         self.transcript.send_to_verifier(
             map_tuple_from_int_to_Fq(batched_quotient_commitment)
         )
         shplonk_opening_challenge = self.transcript.get_challenge()
-        partially_evaluated_quotient = compute_partially_evaluated_batched_quotient(
-            self.opening_claims, shplonk_batching_challenge, shplonk_opening_challenge
-        )
-        difference = partially_evaluated_quotient
-        for i, element in enumerate(batched_quotient):
-            difference[i] -= element
-        assert evaluate_polynomial(difference, shplonk_opening_challenge) == Fr(0)
-        kzg_opening = self.kzg.open(difference, shplonk_opening_challenge)
+        with span("partially_evaluated_quotient"):
+            partially_evaluated_quotient = (
+                compute_partially_evaluated_batched_quotient(
+                    self.opening_claims,
+                    shplonk_batching_challenge,
+                    shplonk_opening_challenge,
+                )
+            )
+            difference = partially_evaluated_quotient
+            difference -= batched_quotient
+            kzg_opening = self.kzg.open(difference, shplonk_opening_challenge)
+            assert kzg_opening[1] == Fr(0)
         self.transcript.send_to_verifier(map_tuple_from_int_to_Fq(kzg_opening[2]))
 
 
 class ShplonkVerifier:
     def __init__(
-        self, opening_claims: list[VerifierOpeningClaim], transcript: VerifierTranscript
+        self,
+        opening_claims: list[VerifierOpeningClaim],
+        transcript: VerifierTranscript,
+        kzg: KZG = None,
     ):
         self.opening_claims = opening_claims
         self.transcript = transcript
-        self.kzg = KZG()
+        self.kzg = kzg if kzg is not None else KZG()
 
-    def verify(self):
+    def reduce(self):
         shplonk_batching_challenge = self.transcript.get_challenge()
         quotient_commitment = convert_to_working_point(
             self.transcript.get_point_from_prover()
@@ -141,17 +172,61 @@ class ShplonkVerifier:
             partially_opened_quotient_commitment, neg(quotient_commitment)
         )
         opening_proof = self.transcript.get_point_from_prover()
-        return self.kzg.verify(
+        return self.kzg.reduce_opening(
             final_commitment,
             [shplonk_opening_challenge, Fr(0), convert_to_working_point(opening_proof)],
         )
 
+    def verify(self):
+        return self.kzg.check_pairing_claims([self.reduce()])
+
 
 import unittest
 import random
 
 
 class ShplonkTests(unittest.TestCase):
+    def test_grouped_quotients_match_per_claim_division(self):
+        polynomials = [
+            FieldVector([Fr.from_bytes(random.randbytes(32)) for i in range(size)])
+            for size in [8, 8, 4]
+        ]
+        point = Fr.from_bytes(random.randbytes(32))
+        other_point = Fr.from_bytes(random.randbytes(32))
+        # Two polynomials at one point, and the first one at two points
+        claims = [
+            ProverOpeningClaim(polynomial, x, evaluate_polynomial(polynomial, x))
+            for polynomial, x in [
+                (polynomials[0], point),
+                (polynomials[1], point),
+                (polynomials[0], -point),
+                (polynomials[2], other_point),
+            ]
+        ]
+        batching_challenge = Fr.from_bytes(random.randbytes(32))
+        opening_challenge = Fr.from_bytes(random.randbytes(32))
+        expected_quotient = [Fr(0)] * 8
+        expected_partial = [Fr(0)] * 8
+        power = Fr(1)
+        for claim in claims:
+            quotient = compute_quotient(claim.polynomial.to_list(), claim.x, claim.y)
+            for i, element in enumerate(quotient):
+                expected_quotient[i] += element * power
+            multiplicand = power / (opening_challenge - claim.x)
+            for i, element in enumerate(claim.polynomial):
+                expected_partial[i] += element * multiplicand
+            expected_partial[0] -= claim.y * multiplicand
+            power *= batching_challenge
+        self.assertEqual(
+            compute_batched_quotient(claims, batching_challenge), expected_quotient
+        )
+        self.assertEqual(
+            compute_partially_evaluated_batched_quotient(
+                claims, batching_challenge, opening_challenge
+            ),
+            expected_partial,
+        )
+
     def test_proof_correctness(self):
         prover_transcript = ProverTranscript()
         prover_transcript.send_to_verifier(Fr(2))
@@ -10,11 +10,16 @@ from py_ecc.fields import optimized_bn128_FQ, optimized_bn128_FQ2
 from Crypto.Util.number import long_to_bytes, bytes_to_long
 import sys
 from multiprocessing import Pool
+from hashlib import blake2b
 
 from secrets import token_bytes
 
 import sys
 import os
+import mmap
+import logging
+import tempfile
+import unittest
 
 
 class SRSError(Exception):
@@ -24,6 +29,19 @@ class SRSError(Exception):
 
 FILE_MAGIC = b"BN254_RONK_SRS"
 FIELD_BYTE_SIZE = 32
+G1_POINTS_OFFSET = len(FILE_MAGIC) + 4 * FIELD_BYTE_SIZE + 4
+G1_POINT_SIZE = 2 * FIELD_BYTE_SIZE
+
+
+def read_g1_point(buffer, index):
+    """Affine integer coordinates of the index-th G1 point in a raw SRS file buffer"""
+    offset = G1_POINTS_OFFSET + index * G1_POINT_SIZE
+    if offset + G1_POINT_SIZE > len(buffer):
+        raise SRSError("Not enough bytes for the object being read")
+    return (
+        int.from_bytes(buffer[offset : offset + FIELD_BYTE_SIZE], "big"),
+        int.from_bytes(buffer[offset + FIELD_BYTE_SIZE : offset + G1_POINT_SIZE], "big"),
+    )
 
 
 def generate_part_of_srs(inputs):
@@ -93,36 +111,136 @@ def write_to_file(filename, srs_tuple):
             f.write(long_to_bytes(element[1].n, FIELD_BYTE_SIZE))
 
 
-def load_from_file(filename):
-    with open(filename, "rb") as f:
-        magic = f.read(len(FILE_MAGIC))
-        if magic != FILE_MAGIC:
-            raise SRSError("SRS file magic incorrect")
+VALIDATION_CACHE_MAGIC = b"BN254_RONK_SRS_VALIDATED"
 
-        def read_and_check_field():
-            obj_bytes = f.read(FIELD_BYTE_SIZE)
-            if len(obj_bytes) != FIELD_BYTE_SIZE:
-                raise SRSError("Not enough bytes for the object being read")
-            return bytes_to_long(obj_bytes)
 
-        g2 = (
-            optimized_bn128_FQ2([read_and_check_field(), read_and_check_field()]),
-            optimized_bn128_FQ2([read_and_check_field(), read_and_check_field()]),
+class SRS:
+    """An SRS file mapped into memory and decoded on demand
+
+    The pairing check tying the G1 powers to the G2 element is expensive, so
+    once it passes the blake2b hash of the file is written to a small cache
+    file next to it and later loads of the same file skip the check.
+    """
+
+    def __init__(self, filename, validate=True, validation_cache_file=None):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[: len(FILE_MAGIC)] != FILE_MAGIC:
+            raise SRSError("SRS file magic incorrect")
+        if len(self.buffer) < G1_POINTS_OFFSET:
+            raise SRSError("Not enough bytes for the object being read")
+        fields = [
+            bytes_to_long(self.buffer[offset : offset + FIELD_BYTE_SIZE])
+            for offset in range(
+                len(FILE_MAGIC), G1_POINTS_OFFSET - 4, FIELD_BYTE_SIZE
+            )
+        ]
+        self.g2 = (
+            optimized_bn128_FQ2(fields[0:2]),
+            optimized_bn128_FQ2(fields[2:4]),
             optimized_bn128_FQ2([1, 0]),
         )
-        srs_size_bytes = f.read(4)
-        if len(srs_size_bytes) != 4:
+        self.size = bytes_to_long(self.buffer[G1_POINTS_OFFSET - 4 : G1_POINTS_OFFSET])
+        if len(self.buffer) < G1_POINTS_OFFSET + self.size * G1_POINT_SIZE:
             raise SRSError("Not enough bytes for the object being read")
-        srs_size = bytes_to_long(srs_size_bytes)
-        srs_g1s = []
-        for i in range(srs_size):
-            x = read_and_check_field()
-            y = read_and_check_field()
-            srs_g1s.append(
-                (optimized_bn128_FQ(x), optimized_bn128_FQ(y), optimized_bn128_FQ(1))
+        self.decoded_points = []
+        if validation_cache_file is None:
+            validation_cache_file = filename + ".validated"
+        self.validation_cache_file = validation_cache_file
+        self.validated = False
+        if validate:
+            self.validate()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        """The index-th G1 point as a projective py_ecc point"""
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("SRS index out of range")
+        (x, y) = read_g1_point(self.buffer, index)
+        return (optimized_bn128_FQ(x), optimized_bn128_FQ(y), optimized_bn128_FQ(1))
+
+    def g1_points(self, start, end):
+        """Affine integer coordinates of points start..end-1"""
+        if end > self.size:
+            raise SRSError("Not enough points in the SRS")
+        while len(self.decoded_points) < end:
+            self.decoded_points.append(
+                read_g1_point(self.buffer, len(self.decoded_points))
             )
-        assert pairing(g2, srs_g1s[-2]) == pairing(G2, srs_g1s[-1])
-        return (srs_g1s, g2)
+        return self.decoded_points[start:end]
+
+    def file_hash(self):
+        return blake2b(self.buffer).digest()
+
+    def read_validation_cache(self):
+        try:
+            with open(self.validation_cache_file, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def validate(self):
+        if self.validated:
+            return
+        if self.size < 2:
+            raise SRSError("SRS is too small to validate")
+        expected_cache = VALIDATION_CACHE_MAGIC + self.file_hash()
+        if self.read_validation_cache() != expected_cache:
+            if pairing(self.g2, self[self.size - 2]) != pairing(G2, self[self.size - 1]):
+                raise SRSError("SRS pairing check failed")
+            try:
+                with open(self.validation_cache_file, "wb") as f:
+                    f.write(expected_cache)
+            except OSError:
+                logging.warning(
+                    f"Could not write SRS validation cache {self.validation_cache_file}"
+                )
+        self.validated = True
+
+    def close(self):
+        self.buffer.close()
+
+
+def load_from_file(filename):
+    srs = SRS(filename)
+    return ([srs[i] for i in range(len(srs))], srs.g2)
+
+
+class TestSRS(unittest.TestCase):
+    def test_matches_file_contents(self):
+        with open("./ronk_srs.bin", "rb") as f:
+            f.seek(G1_POINTS_OFFSET)
+            first_point = (bytes_to_long(f.read(32)), bytes_to_long(f.read(32)))
+        cache_file = os.path.join(tempfile.mkdtemp(), "ronk_srs.validated")
+        srs = SRS("./ronk_srs.bin", validation_cache_file=cache_file)
+        self.assertTrue(os.path.exists(cache_file))
+        self.assertEqual(srs.g1_points(0, 1)[0], first_point)
+        self.assertEqual(normalize(srs[0]), tuple(map(optimized_bn128_FQ, first_point)))
+        self.assertEqual(len(srs.g1_points(3, 7)), 4)
+        # Second load goes through the cache
+        self.assertTrue(SRS("./ronk_srs.bin", validation_cache_file=cache_file).validated)
+
+    def test_corrupted_srs_is_rejected(self):
+        directory = tempfile.mkdtemp()
+        corrupted_file = os.path.join(directory, "corrupted.bin")
+        with open("./ronk_srs.bin", "rb") as f:
+            data = bytearray(f.read())
+        # Swap the last two points
+        last = len(data) - G1_POINT_SIZE
+        data[last - G1_POINT_SIZE : last], data[last:] = (
+            data[last:],
+            data[last - G1_POINT_SIZE : last],
+        )
+        with open(corrupted_file, "wb") as f:
+            f.write(data)
+        with self.assertRaises(SRSError):
+            SRS(corrupted_file)
+        self.assertFalse(os.path.exists(corrupted_file + ".validated"))
 
 
 if __name__ == "__main__":
@@ -1,23 +1,23 @@
 from instance import AllPolynomials, Instance, NUMBER_OF_POLYNOMIALS
 from relations import (
-    ArithmeticRelation,
-    PermutationConsequentRelationNoPublicInputs,
-    PermutationRelationLastElement,
-    LookupMainRelation,
-    LookupInverseCorrectness,
     RelationChallenges,
+    RoundKernel,
+    create_relations,
+    get_extended_length,
+    evaluate_round_program,
+    ROUND_PROGRAM,
 )
+from parallel_sumcheck import get_sumcheck_workers, MINIMUM_SHARD_SIZE
+from profiling import count, FIELD_MULTIPLICATIONS, RELATION_ROWS
 from transcript import ProverTranscript, VerifierTranscript
-from copy import deepcopy
 import unittest
-from ff import Fr
+from ff import Fr, mpz
+from field_vector import FieldVector, as_field_vector
 from ff_ct import Fr_ct
 from collections import namedtuple
 from polynomial import (
-    partially_evaluate_multilinear_polynomial,
     convert_from_lagrange_to_monomial_form,
     evaluate_polynomial,
-    batch_polynomials,
 )
 
 SumcheckChallenges = namedtuple("SumcheckChallenges", ["zeta"], defaults=[Fr(-1)])
@@ -33,40 +33,6 @@ def evaluate_multilinear_zeta_power_polynomial(challenges, zeta):
     return result
 
 
-def take_cube_edges(round_polynomials: AllPolynomials, index: int):
-    edges = AllPolynomials(*([[] for _ in range(NUMBER_OF_POLYNOMIALS)]))
-    for round_polynomial, edge in zip(round_polynomials, edges):
-        edge.append(round_polynomial[index * 2])
-        edge.append(round_polynomial[index * 2 + 1])
-    return edges
-
-
-def extend_edges(edges: AllPolynomials, length: int):
-    extended_edges = AllPolynomials(*([[] for _ in range(NUMBER_OF_POLYNOMIALS)]))
-    for edge, extended_edge in zip(edges, extended_edges):
-        difference = edge[1] - edge[0]
-        for i in range(2):
-            extended_edge.append(edge[i])
-        for i in range(2, length):
-            extended_edge.append(extended_edge[i - 1] + difference)
-    return extended_edges
-
-
-def partially_evaluate_all_polynomials(
-    round_polynomials: AllPolynomials, challenge: Fr
-):
-    round_length = len(round_polynomials[0])
-    assert round_length >= 2 and round_length % 2 == 0
-    new_round_polynomials = AllPolynomials(
-        *([[] for _ in range(NUMBER_OF_POLYNOMIALS)])
-    )
-    for old_polynomial, new_polynomial in zip(round_polynomials, new_round_polynomials):
-        new_polynomial.extend(
-            partially_evaluate_multilinear_polynomial(old_polynomial, challenge)
-        )
-    return new_round_polynomials
-
-
 class SumcheckProver:
     def __init__(
         self,
@@ -74,79 +40,114 @@ class SumcheckProver:
         transcript: ProverTranscript,
         sumcheck_challenges: SumcheckChallenges,
         relation_challenges: RelationChallenges,
+        worker_count=None,
     ):
         self.transcript = transcript
         self.sumcheck_challenges = sumcheck_challenges
+        self.relation_challenges = relation_challenges
         self.instance = instance
-        self.currentPolynomials = deepcopy(instance.all_polynomials)
-        self.full_domain_relations = [LookupMainRelation(relation_challenges)]
-        self.per_row_relations = [
-            ArithmeticRelation(relation_challenges),
-            PermutationConsequentRelationNoPublicInputs(relation_challenges),
-            PermutationRelationLastElement(relation_challenges),
-        ]
-        self.separate_relation = LookupInverseCorrectness(relation_challenges)
-        max_power = 0
-        for relation in self.per_row_relations:
-            max_power = max(max_power, relation.get_power())
-        self.extended_length = max_power + 2  # 1 for power -> coeff  + 1 for zeta
+        self.worker_count = worker_count
+        self.currentPolynomials = AllPolynomials(
+            *[as_field_vector(polynomial) for polynomial in instance.all_polynomials]
+        )
+        # The first fold writes fresh vectors so the instance stays intact,
+        # every later one overwrites our own vectors in place
+        self.owns_polynomials = False
+        (
+            self.full_domain_relations,
+            self.per_row_relations,
+            self.separate_relation,
+        ) = create_relations(relation_challenges)
+        self.extended_length = get_extended_length(self.per_row_relations)
+        self.round_univariate = [mpz(0)] * self.extended_length
+        self.logup_round_univariate = [mpz(0)] * self.extended_length
+        self.kernel = None
         self.round_challenges = []
 
-    def prove_round(self):
-
-        round_size = len(self.currentPolynomials[0])
-        assert round_size > 1
-        result = [Fr(0) for _ in range(self.extended_length)]
-        per_row_relations_alpha_power = self.alpha.pow(len(self.full_domain_relations))
-        logup_result = [Fr(0) for _ in range(self.extended_length)]
-        for i in range(0, round_size // 2):
-            # Take edges
-            edges = take_cube_edges(self.currentPolynomials, i)
-            extended_edges = extend_edges(edges, self.extended_length)
-
-            # Evaluate relations
-            full_domain_relations_results = [
-                relation.evaluate(extended_edges)
-                for relation in self.full_domain_relations
-            ]
-
-            per_row_relations_results = [
-                relation.evaluate(extended_edges) for relation in self.per_row_relations
-            ]
-
-            batched_full_domain_relations_results = batch_polynomials(
-                full_domain_relations_results,
-                self.alpha,
+    def get_kernel(self):
+        if self.kernel is None:
+            self.kernel = RoundKernel(self.relation_challenges, self.alpha)
+        return self.kernel
+
+    def fold(self, challenge):
+        if self.owns_polynomials:
+            for polynomial in self.currentPolynomials:
+                polynomial.fold_in_place(challenge)
+        else:
+            self.currentPolynomials = AllPolynomials(
+                *[polynomial.fold(challenge) for polynomial in self.currentPolynomials]
             )
+            self.owns_polynomials = True
 
-            batched_per_row_relations_results = batch_polynomials(
-                per_row_relations_results, self.alpha, per_row_relations_alpha_power
-            )
-            for j in range(self.extended_length):
-                result[j] += batched_full_domain_relations_results[j] + (
-                    batched_per_row_relations_results[j] * extended_edges.zeta_powers[j]
-                )
-
-            # Separate logup relation
-            logup_at_edge = self.separate_relation.evaluate(extended_edges)
-            for j in range(self.extended_length):
-                logup_result[j] += logup_at_edge[j] * extended_edges.zeta_powers[j]
-
-        for element in result:
-            self.transcript.send_to_verifier(element)
+    def count_round(self, round_size):
+        rows = round_size // 2 * self.extended_length
+        count(RELATION_ROWS, rows)
+        count(FIELD_MULTIPLICATIONS, rows * ROUND_PROGRAM.row_multiplications)
+
+    def send_round_univariates(self, round_univariate, logup_round_univariate):
+        for element in round_univariate:
+            self.transcript.send_to_verifier(Fr(element))
         # Send logup relation results
-        for element in logup_result:
-            self.transcript.send_to_verifier(element)
+        for element in logup_round_univariate:
+            self.transcript.send_to_verifier(Fr(element))
         sumcheck_round_challenge = self.transcript.get_challenge()
         self.round_challenges.append(sumcheck_round_challenge)
-        self.currentPolynomials = partially_evaluate_all_polynomials(
-            self.currentPolynomials, sumcheck_round_challenge
+        return sumcheck_round_challenge
+
+    def prove_round(self):
+        columns = [polynomial.values for polynomial in self.currentPolynomials]
+        round_size = len(columns[0])
+        assert round_size > 1 and round_size % 2 == 0
+        self.count_round(round_size)
+        self.round_univariate[:] = [mpz(0)] * self.extended_length
+        self.logup_round_univariate[:] = [mpz(0)] * self.extended_length
+        self.get_kernel().accumulate(
+            columns,
+            0,
+            round_size // 2,
+            self.round_univariate,
+            self.logup_round_univariate,
+        )
+        self.fold(
+            self.send_round_univariates(
+                self.round_univariate, self.logup_round_univariate
+            )
         )
 
+    def prove_rounds_in_parallel(self):
+        """Prove the first rounds on shards of the hypercube held by workers
+
+        Partial univariates are summed modulo r, so the transcript is the same
+        as the one of the serial prover.
+        """
+        workers = get_sumcheck_workers(self.worker_count)
+        round_size = len(self.currentPolynomials[0])
+        if not workers.is_parallel():
+            return
+        shard_count = workers.shard_count(round_size)
+        if shard_count == 1:
+            return
+        workers.load(
+            [polynomial.values for polynomial in self.currentPolynomials],
+            self.relation_challenges,
+            self.alpha,
+            shard_count,
+        )
+        while round_size // shard_count >= MINIMUM_SHARD_SIZE:
+            self.count_round(round_size)
+            challenge = self.send_round_univariates(*workers.prove_round())
+            workers.fold(challenge)
+            count(FIELD_MULTIPLICATIONS, NUMBER_OF_POLYNOMIALS * round_size // 2)
+            round_size //= 2
+        self.currentPolynomials = AllPolynomials(
+            *[FieldVector.from_values(column) for column in workers.gather()]
+        )
+        self.owns_polynomials = True
+
     def prove(self):
         self.alpha = self.transcript.get_challenge()
-        instance_size = len(self.currentPolynomials[0])
-        for i in range(instance_size.bit_length() - 1):
+        self.prove_rounds_in_parallel()
+        while len(self.currentPolynomials[0]) > 1:
             self.prove_round()
 
         assert len(self.currentPolynomials[0]) == 1
@@ -165,21 +166,17 @@ class SumcheckVerifier:
     ):
         self.transcript = transcript
         self.sumcheck_challenges = challenges
+        self.relation_challenges = relation_challenges
 
-        self.full_domain_relations = [LookupMainRelation(relation_challenges)]
-        self.per_row_relations = [
-            ArithmeticRelation(relation_challenges),
-            PermutationConsequentRelationNoPublicInputs(relation_challenges),
-            PermutationRelationLastElement(relation_challenges),
-        ]
-        self.separate_relation = LookupInverseCorrectness(relation_challenges)
+        (
+            self.full_domain_relations,
+            self.per_row_relations,
+            self.separate_relation,
+        ) = create_relations(relation_challenges)
         self.target_sum = Fr(0)
         self.logup_correctness_target_sum = Fr(0)
         self.instance_size = instance_size
-        max_power = 0
-        for relation in self.per_row_relations:
-            max_power = max(max_power, relation.get_power())
-        self.extended_length = max_power + 2
+        self.extended_length = get_extended_length(self.per_row_relations)
         self.round_challenges = []
 
     def verify_round(self) -> bool:
@@ -226,7 +223,6 @@ class SumcheckVerifier:
     def verify(self):
         self.alpha = self.transcript.get_challenge()
 
-        per_row_relations_alpha_power = self.alpha.pow(len(self.full_domain_relations))
         for i in range(self.instance_size.bit_length() - 1):
             round_result = self.verify_round()
             if not round_result:
@@ -240,30 +236,11 @@ class SumcheckVerifier:
             )
         )
 
-        batched_full_domain_relations_result = batch_polynomials(
-            [
-                relation.evaluate(polynomial_evaluations)
-                for relation in self.full_domain_relations
-            ],
-            self.alpha,
-        )
-        batched_per_row_relations_result = batch_polynomials(
-            [
-                relation.evaluate(polynomial_evaluations)
-                for relation in self.per_row_relations
-            ],
-            self.alpha,
-            per_row_relations_alpha_power,
-        )
-        full_sum = (
-            batched_full_domain_relations_result[0]
-            + batched_per_row_relations_result[0]
-            * polynomial_evaluations.zeta_powers[0]
-        )
-        full_logup_sum = (
-            self.separate_relation.evaluate(polynomial_evaluations)[0]
-            * polynomial_evaluations.zeta_powers[0]
+        ((full_sum,), (full_logup_sum,)) = evaluate_round_program(
+            polynomial_evaluations, self.relation_challenges, self.alpha
         )
+        full_sum = Fr(full_sum)
+        full_logup_sum = Fr(full_logup_sum)
         return (
             full_sum == self.target_sum
             and full_logup_sum == self.logup_correctness_target_sum
@@ -277,6 +254,36 @@ class SumcheckVerifier:
 
 
 class SumcheckProverTest(unittest.TestCase):
+    def test_row_evaluation_matches_relations(self):
+        from relations import (
+            ArithmeticRelation,
+            PermutationConsequentRelationNoPublicInputs,
+            PermutationRelationLastElement,
+            LookupMainRelation,
+            LookupInverseCorrectness,
+        )
+        import random
+
+        relation_challenges = RelationChallenges(Fr(10), Fr(11))
+        polynomials = AllPolynomials(
+            *[
+                [Fr.from_bytes(random.randbytes(32)) for _ in range(3)]
+                for _ in range(NUMBER_OF_POLYNOMIALS)
+            ]
+        )
+        for relation_class in [
+            ArithmeticRelation,
+            PermutationConsequentRelationNoPublicInputs,
+            PermutationRelationLastElement,
+            LookupMainRelation,
+            LookupInverseCorrectness,
+        ]:
+            relation = relation_class(relation_challenges)
+            expected = relation.evaluate(polynomials)
+            for i in range(3):
+                row = AllPolynomials(*[polynomial[i].value for polynomial in polynomials])
+                self.assertEqual(Fr(relation.evaluate_row(row)), expected[i])
+
     def test_one_round(self):
         from circuit import CircuitBuilder
         from uint import Uint8
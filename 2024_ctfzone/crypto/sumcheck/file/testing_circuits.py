@@ -1,9 +1,13 @@
 from circuit import CircuitBuilder
 from ff import Fr
-from uint import Uint8
+from uint import Uint8, xor_lookup_table
+import random
 import unittest
 from prover import Prover, Verifier
 
+# Lookup gates created by one Uint8 xor
+XOR_GATE_COUNT = 2
+
 
 def standard_xor_example():
     cb = CircuitBuilder()
@@ -40,6 +44,20 @@ def impossible_xor_example():
     return cb
 
 
+def xor_example_of_size(log_size):
+    """Chain of random xors padded to exactly 2^log_size gates"""
+    size = 1 << log_size
+    assert size >= len(xor_lookup_table)
+    cb = CircuitBuilder()
+    value = Uint8(cb, 0)
+    value.fix_witness()
+    while cb.get_num_gates() + XOR_GATE_COUNT <= size:
+        value = value ^ Uint8(cb, random.randrange(256))
+    while cb.get_num_gates() < size:
+        value.fix_witness()
+    return cb
+
+
 class TestStandard(unittest.TestCase):
     def test_standard(self):
         cb = standard_xor_example()
@@ -47,6 +65,14 @@ class TestStandard(unittest.TestCase):
         prover.prove()
         self.assertTrue(Verifier(prover.export_proof()).verify())
 
+    def test_sized(self):
+        from instance import Instance
+
+        self.assertEqual(Instance(xor_example_of_size(9)).instance_size, 512)
+        prover = Prover(xor_example_of_size(8))
+        prover.prove()
+        self.assertTrue(Verifier(prover.export_proof()).verify())
+
     # def test_broken(self):
     #     cb = impossible_xor_example()
     #     prover = Prover(cb)
@@ -18,19 +18,34 @@ def map_tuple_from_Fq_into_int(elements):
     return tuple(map(int, [x if type(x) == int else x.value for x in elements]))
 
 
+def derive_challenge_bytes(hasher, round_challenge_index):
+    """Hash of everything absorbed so far followed by the challenge index
+
+    hasher is left untouched, so the running state can keep absorbing data.
+    """
+    hasher = hasher.copy()
+    hasher.update(long_to_bytes(round_challenge_index, 2))
+    return hasher.digest()
+
+
 class ProverTranscript:
 
     def __init__(self):
-        self.data_bytes = []
+        self.data_bytes = bytearray()
+        self.hasher = blake2b(salt=DOMAIN_SEPARATION_SALT)
         self.round_challenge_index = 0
 
+    def append_bytes(self, data):
+        self.data_bytes += data
+        self.hasher.update(data)
+
     def send_to_verifier(self, element):
         self.round_challenge_index = 0
         if type(element) == Fr or type(element) == Fq or type(element) == FF:
-            self.data_bytes.extend(element.to_bytes())
+            self.append_bytes(element.to_bytes())
         elif type(element) == int:
             assert element < (1 << 32)
-            self.data_bytes.extend(long_to_bytes(element, 4))
+            self.append_bytes(long_to_bytes(element, 4))
         elif type(element) == tuple:
             for sub_element in element:
                 self.send_to_verifier(sub_element)
@@ -40,8 +55,7 @@ class ProverTranscript:
     def get_challenge(self):
         if len(self.data_bytes) == 0:
             raise Exception("Not data to FS yet")
-        buffer = bytes(self.data_bytes) + long_to_bytes(self.round_challenge_index, 2)
-        result_bytes = blake2b(buffer, salt=DOMAIN_SEPARATION_SALT).digest()
+        result_bytes = derive_challenge_bytes(self.hasher, self.round_challenge_index)
         self.round_challenge_index += 1
         return Fr(bytes_to_long(result_bytes))
 
@@ -53,21 +67,22 @@ class VerifierTranscript:
     def __init__(self, proof_data: bytes):
         self.proof_data = proof_data
         self.offset = 0
+        self.hasher = blake2b(salt=DOMAIN_SEPARATION_SALT)
         self.round_challenge_index = 0
 
-    def get_Fr_from_prover(self):
-        assert len(self.proof_data) - self.offset >= FF_BYTE_LENGTH
-        chunk = self.proof_data[self.offset : self.offset + FF_BYTE_LENGTH]
-        self.offset += FF_BYTE_LENGTH
+    def read_bytes(self, length):
+        assert len(self.proof_data) - self.offset >= length
+        chunk = self.proof_data[self.offset : self.offset + length]
+        self.hasher.update(chunk)
+        self.offset += length
         self.round_challenge_index = 0
-        return Fr.from_bytes(chunk)
+        return chunk
+
+    def get_Fr_from_prover(self):
+        return Fr.from_bytes(self.read_bytes(FF_BYTE_LENGTH))
 
     def get_Fq_from_prover(self):
-        assert len(self.proof_data) - self.offset >= FF_BYTE_LENGTH
-        chunk = self.proof_data[self.offset : self.offset + FF_BYTE_LENGTH]
-        self.offset += FF_BYTE_LENGTH
-        self.round_challenge_index = 0
-        return Fq.from_bytes(chunk)
+        return Fq.from_bytes(self.read_bytes(FF_BYTE_LENGTH))
 
     def get_point_from_prover(self):
         point = (self.get_Fq_from_prover(), self.get_Fq_from_prover())
@@ -76,19 +91,12 @@ class VerifierTranscript:
         return point
 
     def get_int_from_prover(self):
-        assert len(self.proof_data) - self.offset >= 4
-        chunk = self.proof_data[self.offset : self.offset + 4]
-        self.offset += 4
-        self.round_challenge_index = 0
-        return bytes_to_long(chunk)
+        return bytes_to_long(self.read_bytes(4))
 
     def get_challenge(self):
         if self.offset == 0:
             raise Exception("Not data to FS yet")
-        buffer = self.proof_data[: self.offset] + long_to_bytes(
-            self.round_challenge_index, 2
-        )
-        result_bytes = blake2b(buffer, salt=DOMAIN_SEPARATION_SALT).digest()
+        result_bytes = derive_challenge_bytes(self.hasher, self.round_challenge_index)
         self.round_challenge_index += 1
         return Fr.from_bytes(result_bytes)
 
@@ -108,6 +116,22 @@ class TestTranscript(unittest.TestCase):
         challenge_0_1 = prover_transcript.get_challenge()
         self.assertNotEqual(challenge_0, challenge_0_1)
 
+    def test_matches_hashing_from_scratch(self):
+        prover_transcript = ProverTranscript()
+        prover_transcript.send_to_verifier(Fr(5))
+        prover_transcript.send_to_verifier(123456)
+        challenges = [prover_transcript.get_challenge() for _ in range(3)]
+        data = prover_transcript.export_proof()
+        for index, challenge in enumerate(challenges):
+            expected = blake2b(
+                data + long_to_bytes(index, 2), salt=DOMAIN_SEPARATION_SALT
+            ).digest()
+            self.assertEqual(challenge, Fr(bytes_to_long(expected)))
+        verifier_transcript = VerifierTranscript(data)
+        verifier_transcript.get_Fr_from_prover()
+        verifier_transcript.get_int_from_prover()
+        self.assertEqual(verifier_transcript.get_challenge(), challenges[0])
+
     def test_prover_verifier_transcript_equivalence(self):
 
         first_element = Fr.from_bytes(random.randbytes(FF_BYTE_LENGTH * 2))
@@ -6,13 +6,18 @@ class Ant:
         self.last_pos = Position(*pos)
         self.carrying = carrying
         self.last_carrying = carrying
+        # Set by Board.place_ant
+        self.board = None
+        self.owner = None
 
     def move(self, direction):
         if direction in DIRECTIONS:
             delta = DIRECTIONS[direction]
             self.last_pos = self.pos
             self.pos = Position(self.pos.x + delta[0], self.pos.y + delta[1])
+            if self.board is not None and self.pos != self.last_pos:
+                self.board.move_ant(self, self.last_pos)
 
     def update_carrying(self, carrying):
         self.last_carrying = self.carrying
-        self.carrying = carrying
\ No newline at end of file
+        self.carrying = carrying
@@ -3,22 +3,39 @@ from engine.cube import Cube
 class Board:
     def __init__(self, size):
         self.size = size
-        self.grid = [[None for _ in range(size)] for _ in range(size)]
+        # Ants by position, kept up to date as they move. A dict rather than a
+        # size x size list because an ant may step off the board on the round
+        # its player loses.
+        self.ant_cells = {}
+        self.cube_grid = {}
         self.cubes = []
 
     def add_sugar(self, pos, sugar):
         cube = Cube(pos, sugar)
         self.cubes.append(cube)
-        self.grid[pos[0]][pos[1]] = cube
+        self.cube_grid[cube.pos] = cube
 
     def get_cube_at(self, pos):
-        for cube in self.cubes:
-            if cube.pos == pos:
-                return cube
-        return 0
-
-    def update_grid(self, ants):
-        # Clear grid and re-place ants
-        self.grid = [[None for _ in range(self.size)] for _ in range(self.size)]
-        for ant in ants:
-            self.grid[ant.pos.x][ant.pos.y] = ant
\ No newline at end of file
+        return self.cube_grid.get(pos, 0)
+
+    def get_ants_at(self, pos):
+        return self.ant_cells.get(pos, ())
+
+    def place_ant(self, ant, owner):
+        ant.board = self
+        ant.owner = owner
+        self.ant_cells.setdefault(ant.pos, []).append(ant)
+
+    def remove_ant(self, ant):
+        self.unlink_ant(ant, ant.pos)
+        ant.board = None
+
+    def move_ant(self, ant, old_pos):
+        self.unlink_ant(ant, old_pos)
+        self.ant_cells.setdefault(ant.pos, []).append(ant)
+
+    def unlink_ant(self, ant, pos):
+        cell = self.ant_cells[pos]
+        cell.remove(ant)
+        if not cell:
+            del self.ant_cells[pos]
@@ -2,14 +2,18 @@ import random
 from engine.board import Board
 from engine.player import BotEasy, BotMedium, BotPlayer
 from engine.ant import Ant
+from engine.replay import ReplayEncoder
+from engine.state import GameStateView
 from engine.utils import Position, DIRECTIONS
 import time
-import copy
 import math
 
 MIN_SIZE = 8
 MAX_SIZE = 24
 
+# Horizontal moves are inverted for player 2
+MIRRORED_MOVES = {"left": "right", "right": "left", "up": "up", "down": "down", "stay": "stay"}
+
 class Game:
     def __init__(self, player_bot_code=None, arena=None, champion_code=None):
         self.size = random.randint(MIN_SIZE, MAX_SIZE)
@@ -20,7 +24,8 @@ class Game:
         self.sugar_collected = [0, 0]
         self.max_sugar = 0
         self.ant_cost = 0
-        self.round_states = []  # List to store game states for each round
+        self.replay = ReplayEncoder()  # Game states of every round, as deltas
+        self.state_views = [GameStateView(self.size, False), GameStateView(self.size, True)]
         self.initialize_game()
 
     def initialize_game(self):
@@ -28,8 +33,8 @@ class Game:
         first_ant_index = self.size // 2 - nb_ants // 2
 
         for i in range(first_ant_index, first_ant_index + nb_ants):
-            self.players[0].ants.append(Ant((0, i)))
-            self.players[1].ants.append(Ant((self.size - 1, self.size - 1 - i)))
+            self.add_ant(0, Ant((0, i)))
+            self.add_ant(1, Ant((self.size - 1, self.size - 1 - i)))
 
         # Randomly place sugar cubes
         num_sugar_cubes = self.size // 2 if self.size % 2 == 0 else self.size // 2 + 1
@@ -55,31 +60,33 @@ class Game:
         self.max_sugar = num_sugar_cubes * sugar_amount
         self.ant_cost = max(1, int(self.max_sugar * 0.1))
 
-        self.round_states.append(self.record_state())
+        self.record_state()
+
+    def add_ant(self, player_index, ant):
+        self.players[player_index].ants.append(ant)
+        self.board.place_ant(ant, player_index)
 
     def adjust_position(self, pos, is_player_two):
         return (self.size - 1 - pos.x, pos.y) if is_player_two else tuple(pos)
     
     def adjust_move(self, move, is_player_two):
-        if not is_player_two:
-            return move
-        # Invert horizontal moves for player 2
-        move_map = {"left": "right", "right": "left", "up": "up", "down": "down", "stay": "stay"}
-        return move_map[move]
-    
-    def handle_player(self, player):    
-        # Get moves from player
-        game_state = self.get_game_state(player)
-        move_response = player.make_move(copy.deepcopy(game_state))
+        return MIRRORED_MOVES[move] if is_player_two else move
 
-        if not move_response:
-            return False
-        
-        # Validate datatype
-        if type(move_response["player_data"]) != bytes:
-            player.error = "player_data should be bytes."
-            return False
-        for ant in move_response['your_ants']:
+    def validate_ants(self, player, ants):
+        # Check each field of all the ants at once, and only go through the ants
+        # one by one to find the error to report
+        try:
+            positions = [ant['pos'] for ant in ants]
+            carrying = [ant['carrying'] for ant in ants]
+            moves = [ant['move'] for ant in ants]
+            if (set(map(type, positions)) <= {tuple} and set(map(len, positions)) <= {2}
+                    and set(map(type, carrying)) <= {bool} and set(map(type, moves)) <= {str}
+                    and set(moves) <= DIRECTIONS.keys()):
+                return True
+        except (KeyError, TypeError):
+            pass
+
+        for ant in ants:
             if type(ant['pos']) != tuple:
                 player.error = "pos should be a tuple."
                 return False
@@ -95,6 +102,24 @@ class Game:
             if ant["move"] not in DIRECTIONS:
                 player.error = "move should be in ['stay', 'up', 'down', 'left', 'right']"
                 return False
+        return True
+
+    def handle_player(self, player):    
+        # Get moves from player. The game state is read-only, so the bot gets it
+        # without a copy.
+        game_state = self.get_game_state(player)
+        view = self.state_views[self.players.index(player)]
+        move_response = player.make_move(game_state)
+
+        if not move_response:
+            return False
+        
+        # Validate datatype
+        if type(move_response["player_data"]) != bytes:
+            player.error = "player_data should be bytes."
+            return False
+        if not self.validate_ants(player, move_response['your_ants']):
+            return False
 
         # Update player data
         player.player_data = move_response["player_data"]
@@ -103,7 +128,7 @@ class Game:
         is_player_two = player == self.players[1]
 
         # Check for new ants being bought
-        ant_amout_difference = len(move_response["your_ants"]) - len(game_state["your_ants"])
+        ant_amout_difference = len(move_response["your_ants"]) - len(view.your_ants)
         if ant_amout_difference < 0: # Player removed an ant
             return False
         elif ant_amout_difference > 0: # Player bought an ant
@@ -112,19 +137,23 @@ class Game:
                 # Check if new ants are on the base and a correctly configured
                 new_ants = [
                     ant1 for ant1 in move_response["your_ants"]
-                    if not any(ant1['pos'] == ant2['pos'] for ant2 in game_state["your_ants"])
+                    if ant1['pos'] not in view.your_positions
                 ]
                 for ant in new_ants:
                     if ant["pos"][0] != 0 or ant["move"] != "stay" or ant["carrying"] != False:
                         return False
                     x, y = ant["pos"]
-                    player.ants.append(Ant(self.adjust_position(Position(x, y), is_player_two)))
+                    self.add_ant(self.players.index(player), Ant(self.adjust_position(Position(x, y), is_player_two)))
             else:
                 return False # Player does not have enough sugar to pay for the ant
 
         # Apply moves
-        for ant_data, ant in zip(move_response["your_ants"], player.ants):
-            if ant_data['pos'] != self.adjust_position(ant.pos, is_player_two):
+        expected_positions = view.your_positions + tuple(
+            self.adjust_position(ant.pos, is_player_two)
+            for ant in player.ants[len(view.your_positions):]
+        )
+        for ant_data, ant, expected_position in zip(move_response["your_ants"], player.ants, expected_positions):
+            if ant_data['pos'] != expected_position:
                 player.error = "You tampered with your ants positions."
                 return False
             # Check for carrying changes
@@ -168,115 +197,76 @@ class Game:
         self.players[1].lost = not self.handle_player(self.players[1])
         time_player2.value += time.time() - start
 
-        # Check for illegal moves for player 1
-        if not self.players[0].lost:
-            brk = False
-            for ant in self.players[0].ants:
-                if brk:
-                    break
-                # Check for out of bounds and stepping on ennemy base
-                if ant.pos.x < 0 or ant.pos.x >= self.size - 1 or ant.pos.y < 0 or ant.pos.y >= self.size:
-                    self.players[0].lost = True
-                    break
-                # Check for two ants on the same cell
-                for ant2 in self.players[0].ants:
-                    if ant != ant2 and ant.pos == ant2.pos:
-                        self.players[0].lost = True
-                        brk = True
-                        break
-        # Check for illegal moves for player 2
-        if not self.players[1].lost:
-            brk = False
-            for ant in self.players[1].ants:
-                if brk:
-                    break
-                # Check for out of bounds and stepping on ennemy base
-                if ant.pos.x <= 0 or ant.pos.x > self.size - 1 or ant.pos.y < 0 or ant.pos.y >= self.size:
-                    self.players[1].lost = True
-                    break
-                # Check for two ants on the same cell
-                for ant2 in self.players[1].ants:
-                    if ant != ant2 and ant.pos == ant2.pos:
-                        self.players[1].lost = True
-                        brk = True
-                        break
+        # Check for illegal moves
+        for index, player in enumerate(self.players):
+            if not player.lost:
+                player.lost = self.has_illegal_positions(index)
 
         # If a player lost, end the game
         if self.players[0].lost or self.players[1].lost:
-            self.round_states.append(self.record_state())
+            self.record_state()
             return
         
         # Check for discovered cubes (if ant is on the cube or adjacent to it)
         for cube in self.board.cubes:
             if not cube.discovered:
-                for player in self.players:
-                    for ant in player.ants:
-                        if ant.pos == cube.pos or (abs(ant.pos.x - cube.pos.x) <= 1 and abs(ant.pos.y - cube.pos.y) <= 1):
-                            cube.discovered = True
-
-
-        # Check for ant collisions between players ants
-        remove_player1 = []
-        remove_player2 = []
-        for i in range(len(self.players[0].ants)):
-            for j in range(len(self.players[1].ants)):
-                if self.players[0].ants[i].pos == self.players[1].ants[j].pos:
+                cube.discovered = any(
+                    self.board.get_ants_at((cube.pos.x + dx, cube.pos.y + dy))
+                    for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                )
+
+        # Check for ant collisions between players ants. Each player has at most
+        # one ant per cell here, so a cell holds at most one ant of each player.
+        removed = []
+        for ant in self.players[0].ants:
+            for other in self.board.get_ants_at(ant.pos):
+                if other.owner == 1:
                     # If there is a collision, kill one of the ants with a 50% chance
-                    if random.random() < 0.5:
-                        remove_player1.append(i)
-                    else:
-                        remove_player2.append(j) 
+                    removed.append(ant if random.random() < 0.5 else other)
         # Remove ants that collided
-        for i in reversed(remove_player1):
-            self.players[0].ants.pop(i)
-        for i in reversed(remove_player2):
-            self.players[1].ants.pop(i)
-
-        
-        # Update the board
-        self.board.update_grid(self.players[0].ants + self.players[1].ants)
+        for ant in removed:
+            self.board.remove_ant(ant)
+            self.players[ant.owner].ants.remove(ant)
 
         # Record the game state for this round
-        self.round_states.append(self.record_state())
+        self.record_state()
 
         self.round += 1
 
 
+    def has_illegal_positions(self, player_index):
+        for ant in self.players[player_index].ants:
+            # Check for out of bounds and stepping on ennemy base
+            if player_index == 0:
+                out_of_bounds = ant.pos.x < 0 or ant.pos.x >= self.size - 1
+            else:
+                out_of_bounds = ant.pos.x <= 0 or ant.pos.x > self.size - 1
+            if out_of_bounds or ant.pos.y < 0 or ant.pos.y >= self.size:
+                return True
+            # Check for two ants on the same cell
+            for other in self.board.get_ants_at(ant.pos):
+                if other is not ant and other.owner == player_index:
+                    return True
+        return False
+
     def get_game_state(self, player):
-        # Determine the opponent
-        opponent = self.players[1] if player == self.players[0] else self.players[0]
+        player_index = self.players.index(player)
+        opponent_index = 1 - player_index
 
-        # Determine if this is player 2 (right-side player)
-        is_player_two = player == self.players[1]
-        
-        # Prepare the game state for the current player
+        # Bring the player's view of the board up to date
+        view = self.state_views[player_index]
+        view.update(player.ants, self.players[opponent_index].ants, self.board.cubes)
+
+        # Prepare the game state for the current player. The lists are new for
+        # every call, the records in them are read-only and shared.
         return {
-            "your_ants": [
-                {
-                    "pos": self.adjust_position(ant.pos, is_player_two),
-                    "last_pos": self.adjust_position(ant.last_pos, is_player_two),
-                    "carrying": ant.carrying,
-                    "last_carrying": ant.last_carrying
-                }
-                for ant in player.ants
-            ],
-            "opponent_ants": [
-                {
-                    "pos": self.adjust_position(ant.pos, is_player_two),
-                    "last_pos": self.adjust_position(ant.last_pos, is_player_two),
-                    "carrying": ant.carrying,
-                    "last_carrying": ant.last_carrying
-                }
-                for ant in opponent.ants
-            ],
-            "discovered_cubes": [
-                {"pos": self.adjust_position(cube.pos, is_player_two), "sugar": cube.sugar}
-                for cube in self.board.cubes if cube.discovered
-            ],
-            "total_sugar_available": sum(cube.sugar for cube in self.board.cubes),
+            "your_ants": list(view.your_ants),
+            "opponent_ants": list(view.opponent_ants),
+            "discovered_cubes": list(view.discovered_cubes),
+            "total_sugar_available": view.total_sugar,
             "grid_size": self.size,
-            "your_score": self.sugar_collected[self.players.index(player)],
-            "opponent_score": self.sugar_collected[self.players.index(opponent)],
+            "your_score": self.sugar_collected[player_index],
+            "opponent_score": self.sugar_collected[opponent_index],
             "ant_cost": self.ant_cost,
             "player_data": player.player_data
         }
@@ -284,22 +274,12 @@ class Game:
 
     def record_state(self):
         # Record the state of the board and scores for each round
-        return {
-            "round": self.round,
-            "player1": [
-                {"pos": ant.pos, "carrying": ant.carrying}
-                for ant in self.players[0].ants
-            ],
-            "player2": [
-                {"pos": ant.pos, "carrying": ant.carrying}
-                for ant in self.players[1].ants
-            ],
-            "cubes": [
-                {"pos": cube.pos, "sugar": cube.sugar, "discovered": cube.discovered}
-                for cube in self.board.cubes
-            ],
-            "score": list(self.sugar_collected)
-        }
+        self.replay.record(
+            self.round,
+            [self.players[0].ants, self.players[1].ants],
+            self.board.cubes,
+            self.sugar_collected
+        )
     
     def is_game_over(self):
         return self.round >= self.max_rounds or sum(self.sugar_collected) == self.max_sugar or self.players[0].lost or self.players[1].lost
@@ -315,4 +295,4 @@ class Game:
             elif self.sugar_collected[0] < self.sugar_collected[1]:
                 self.players[0].lost = True
 
-        return self.round_states, self.players, self.size
+        return self.replay, self.players, self.size
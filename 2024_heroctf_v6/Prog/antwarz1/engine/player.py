@@ -428,10 +428,71 @@ def restricted_import(name, globals=None, locals=None, fromlist=(), level=0):
 def forbidden_function(*arg, **karg):
     raise Exception(f"This function is not allowed.")
 
+def build_safe_builtins():
+    # Copy the built-ins to preserve original state
+    safe_builtins = {**builtins.__dict__}
+
+    # Override the __import__ function to prevent imports
+    safe_builtins['__import__'] = restricted_import
+
+    allowed_builtins = {
+        'len': len,
+        'range': range,
+        'min': min,
+        'max': max,
+        'sum': sum,
+        'abs': abs,
+        'all': all,
+        'any': any,
+        'enumerate': enumerate,
+        'sorted': sorted,
+        'reversed': reversed,
+        'zip': zip,
+        'map': map,
+        'filter': filter,
+        'int': int,
+        'float': float,
+        'str': str,
+        'bool': bool,
+        'list': list,
+        'dict': dict,
+        'set': set,
+        'tuple': tuple,
+        'str': str,
+            'format': str.format,
+            'startswith': str.startswith,
+            'endswith': str.endswith,
+            'lower': str.lower,
+            'upper': str.upper
+    }
+
+    forbidden_builtins = {
+        'print': forbidden_function,
+        'exit': forbidden_function
+    }
+
+    safe_builtins.update(allowed_builtins)
+    safe_builtins.update(forbidden_builtins)
+    return safe_builtins
+
+# Built once, copied for every round so a bot cannot alter them for later rounds
+SAFE_BUILTINS = build_safe_builtins()
+
+# The bot is compiled once. Every round runs it in fresh namespaces, so it keeps
+# no state between rounds other than its player_data.
+SANDBOX_SOURCE = """try:
+{user_code}
+ result = make_move(__game_state)
+except Exception as e:
+    import traceback
+    error = traceback.format_exc()
+"""
+
 class BotPlayer(Player):
     def __init__(self, user_code):
         self.user_code = user_code
         self.format_user_code()
+        self.compile_user_code()
 
         super().__init__()
 
@@ -439,69 +500,30 @@ class BotPlayer(Player):
         lines = self.user_code.split("\n")
         formatted_code = "\n".join([" " + line.replace("    ", " ").replace("\t", " ") for line in lines])
         self.user_code = formatted_code
+
+    def compile_user_code(self):
+        self.compiled_code = None
+        self.compile_error = ""
+        try:
+            self.compiled_code = compile(SANDBOX_SOURCE.format(user_code=self.user_code), "<string>", "exec")
+        except Exception as e:
+            self.compile_error = "".join(traceback.format_exception_only(type(e), e))
     
     def make_move(self, game_state):
-        # Copy the built-ins to preserve original state
-        safe_builtins = {**builtins.__dict__}
-        
-        # Override the __import__ function to prevent imports
-        safe_builtins['__import__'] = restricted_import
-
-        allowed_builtins = {
-            'len': len,
-            'range': range,
-            'min': min,
-            'max': max,
-            'sum': sum,
-            'abs': abs,
-            'all': all,
-            'any': any,
-            'enumerate': enumerate,
-            'sorted': sorted,
-            'reversed': reversed,
-            'zip': zip,
-            'map': map,
-            'filter': filter,
-            'int': int,
-            'float': float,
-            'str': str,
-            'bool': bool,
-            'list': list,
-            'dict': dict,
-            'set': set,
-            'tuple': tuple,
-            'str': str,
-                'format': str.format,
-                'startswith': str.startswith,
-                'endswith': str.endswith,
-                'lower': str.lower,
-                'upper': str.upper
-        }
-
-        forbidden_builtins = {
-            'print': forbidden_function,
-            'exit': forbidden_function
-        }
-
-        safe_builtins.update(allowed_builtins)
-        safe_builtins.update(forbidden_builtins)
+        if self.compiled_code is None:
+            self.error = self.compile_error
+            return False
 
         sandbox_globals = {
-            '__builtins__': safe_builtins,  # Use our restricted built-ins
+            '__builtins__': dict(SAFE_BUILTINS),  # Use our restricted built-ins
             '__name__': 'sandbox',           # Arbitrary name for the sandbox
             'Position': Position
         }
     
-        sandbox_locals = {}
+        sandbox_locals = {'__game_state': game_state}
 
         try:
-            exec(f'''try:
-{self.user_code}
- result = make_move({game_state!r})
-except Exception as e:
-    import traceback
-    error = traceback.format_exc()
-''', sandbox_globals, sandbox_locals)
+            exec(self.compiled_code, sandbox_globals, sandbox_locals)
 
             if "error" in sandbox_locals.keys():
                 self.error = sandbox_locals["error"]
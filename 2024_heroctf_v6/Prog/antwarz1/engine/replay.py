@@ -0,0 +1,159 @@
+import json
+
+# A replay is a keyframe with the full state of the first recorded round,
+# followed by one delta per recorded round holding only what changed:
+#
+#   "a1" / "a2": [id, x, y, carrying] of every ant of player 1 / 2 that moved,
+#                changed its carrying state or appeared
+#   "d1" / "d2": ids of the ants that were removed
+#   "c":         [index, sugar, discovered] of every cube that changed
+#   "s":         the score, if it changed
+#   "r":         the round number, if it is not the previous one plus one
+#
+# Ant ids are given in order of appearance. Ants are only ever appended to a
+# player's list, so sorting by id gives back the order of that list.
+
+REPLAY_VERSION = 1
+PLAYER_KEYS = ("player1", "player2")
+
+
+class ReplayEncoder:
+    """Records a game round by round, keeping every delta as compact JSON"""
+
+    def __init__(self):
+        self.keyframe = None
+        self.encoded_deltas = []
+        self.ant_ids = [{}, {}]
+        self.next_ant_id = 0
+        self.ants = [{}, {}]
+        self.cubes = []
+        self.score = None
+        self.round = None
+
+    def __len__(self):
+        return 0 if self.keyframe is None else len(self.encoded_deltas) + 1
+
+    def get_ant_id(self, player_index, ant):
+        ids = self.ant_ids[player_index]
+        if ant not in ids:
+            ids[ant] = self.next_ant_id
+            self.next_ant_id += 1
+        return ids[ant]
+
+    def record(self, round_number, players_ants, cubes, score):
+        """Add the state of one round, given the live ants and cubes"""
+        ants = [
+            {
+                self.get_ant_id(player_index, ant): (ant.pos.x, ant.pos.y, ant.carrying)
+                for ant in player_ants
+            }
+            for player_index, player_ants in enumerate(players_ants)
+        ]
+        cube_states = [(cube.sugar, cube.discovered) for cube in cubes]
+        score = list(score)
+
+        if self.keyframe is None:
+            self.keyframe = {
+                "round": round_number,
+                "player1": [[ant_id, *state] for ant_id, state in ants[0].items()],
+                "player2": [[ant_id, *state] for ant_id, state in ants[1].items()],
+                "cubes": [
+                    [cube.pos.x, cube.pos.y, cube.sugar, cube.discovered]
+                    for cube in cubes
+                ],
+                "score": score,
+            }
+        else:
+            delta = {}
+            if round_number != self.round + 1:
+                delta["r"] = round_number
+            for player_index in range(2):
+                previous = self.ants[player_index]
+                current = ants[player_index]
+                changed = [
+                    [ant_id, *state]
+                    for ant_id, state in current.items()
+                    if previous.get(ant_id) != state
+                ]
+                removed = [ant_id for ant_id in previous if ant_id not in current]
+                if changed:
+                    delta[f"a{player_index + 1}"] = changed
+                if removed:
+                    delta[f"d{player_index + 1}"] = removed
+                    self.forget_ants(player_index, removed)
+            changed_cubes = [
+                [index, *state]
+                for index, state in enumerate(cube_states)
+                if state != self.cubes[index]
+            ]
+            if changed_cubes:
+                delta["c"] = changed_cubes
+            if score != self.score:
+                delta["s"] = score
+            self.encoded_deltas.append(json.dumps(delta, separators=(",", ":")))
+
+        self.ants = ants
+        self.cubes = cube_states
+        self.score = score
+        self.round = round_number
+
+    def forget_ants(self, player_index, removed):
+        removed = set(removed)
+        ids = self.ant_ids[player_index]
+        for ant in [ant for ant, ant_id in ids.items() if ant_id in removed]:
+            del ids[ant]
+
+    def to_dict(self):
+        return {
+            "version": REPLAY_VERSION,
+            "keyframe": self.keyframe,
+            "deltas": [json.loads(delta) for delta in self.encoded_deltas],
+        }
+
+    def write_json(self, file):
+        """Write the replay as JSON, one delta at a time"""
+        file.write(f'{{"version": {REPLAY_VERSION}, "keyframe": ')
+        file.write(json.dumps(self.keyframe, separators=(",", ":")))
+        file.write(', "deltas": [')
+        for i, delta in enumerate(self.encoded_deltas):
+            if i != 0:
+                file.write(",\n")
+            file.write(delta)
+        file.write("]}")
+
+
+def decode_replay(replay):
+    """Yield the full state of every round, as Game.record_state used to"""
+    keyframe = replay["keyframe"]
+    round_number = keyframe["round"]
+    ants = [
+        {ant_id: (x, y, carrying) for ant_id, x, y, carrying in keyframe[key]}
+        for key in PLAYER_KEYS
+    ]
+    positions = [(x, y) for x, y, _, _ in keyframe["cubes"]]
+    cubes = [(sugar, discovered) for _, _, sugar, discovered in keyframe["cubes"]]
+    score = list(keyframe["score"])
+    for i in range(len(replay["deltas"]) + 1):
+        if i != 0:
+            delta = replay["deltas"][i - 1]
+            round_number = delta.get("r", round_number + 1)
+            for player_index in range(2):
+                for ant_id in delta.get(f"d{player_index + 1}", ()):
+                    del ants[player_index][ant_id]
+                for ant_id, x, y, carrying in delta.get(f"a{player_index + 1}", ()):
+                    ants[player_index][ant_id] = (x, y, carrying)
+            for index, sugar, discovered in delta.get("c", ()):
+                cubes[index] = (sugar, discovered)
+            score = list(delta.get("s", score))
+        state = {"round": round_number}
+        for player_index, key in enumerate(PLAYER_KEYS):
+            state[key] = [
+                {"pos": (x, y), "carrying": carrying}
+                for _, (x, y, carrying) in sorted(ants[player_index].items())
+            ]
+        state["cubes"] = [
+            {"pos": pos, "sugar": sugar, "discovered": discovered}
+            for pos, (sugar, discovered) in zip(positions, cubes)
+        ]
+        state["score"] = score
+        yield state
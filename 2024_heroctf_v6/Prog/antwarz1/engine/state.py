@@ -0,0 +1,60 @@
+from types import MappingProxyType
+
+class GameStateView:
+    """
+    The board as seen by one player, updated from round to round.
+
+    Ants and cubes are read-only mappings, so they can be handed to a bot
+    without being copied. The records of ants that did not change since the
+    previous round are reused, and the cubes are only rebuilt when one of them
+    changed.
+    """
+    def __init__(self, size, is_player_two):
+        self.size = size
+        self.is_player_two = is_player_two
+        # Per side (own ants, opponent ants): ant -> (ant state, record)
+        self.ant_records = [{}, {}]
+        self.your_ants = ()
+        self.opponent_ants = ()
+        # Columns of the player's own ants, used to check the bot's answer
+        self.your_positions = ()
+        self.cube_states = None
+        self.discovered_cubes = ()
+        self.total_sugar = 0
+
+    def adjust_position(self, pos):
+        return (self.size - 1 - pos.x, pos.y) if self.is_player_two else tuple(pos)
+
+    def update_ants(self, side, ants):
+        previous = self.ant_records[side]
+        current = {}
+        for ant in ants:
+            state = (ant.pos, ant.last_pos, ant.carrying, ant.last_carrying)
+            cached = previous.get(ant)
+            if cached is None or cached[0] != state:
+                cached = (state, MappingProxyType({
+                    "pos": self.adjust_position(ant.pos),
+                    "last_pos": self.adjust_position(ant.last_pos),
+                    "carrying": ant.carrying,
+                    "last_carrying": ant.last_carrying
+                }))
+            current[ant] = cached
+        self.ant_records[side] = current
+        return tuple(record for _, record in current.values())
+
+    def update_cubes(self, cubes):
+        cube_states = [(cube.discovered, cube.sugar) for cube in cubes]
+        if cube_states == self.cube_states:
+            return
+        self.cube_states = cube_states
+        self.discovered_cubes = tuple(
+            MappingProxyType({"pos": self.adjust_position(cube.pos), "sugar": cube.sugar})
+            for cube in cubes if cube.discovered
+        )
+        self.total_sugar = sum(sugar for _, sugar in cube_states)
+
+    def update(self, your_ants, opponent_ants, cubes):
+        self.your_ants = self.update_ants(0, your_ants)
+        self.opponent_ants = self.update_ants(1, opponent_ants)
+        self.your_positions = tuple(ant["pos"] for ant in self.your_ants)
+        self.update_cubes(cubes)
@@ -0,0 +1,98 @@
+from engine.game import Game, MAX_SIZE
+from math import ceil
+import multiprocessing
+import random
+import signal
+import os
+
+# Time budget of a game, in seconds per possible round
+TIMEOUT_SECONDS_PER_ROUND = 0.005
+# A game may take this many times its budget in wall-clock time, for bots that
+# block or sleep without using any CPU time
+WALL_CLOCK_FACTOR = 3
+# Longest wait for the next result. Games bound their own duration with timers,
+# this catches the ones that never let a timer go off.
+RESULT_TIMEOUT = ceil(MAX_SIZE ** 3 * TIMEOUT_SECONDS_PER_ROUND) * WALL_CLOCK_FACTOR + 30
+TIMEOUT_ERROR = "Your bot timed out. Make sure you don't have an infinite loop in your code. If not, your code is probably taking to long to execute."
+
+def timeout_handler(signum, frame):
+    raise Exception("TIMEOUT")
+
+class Timer:
+    """Seconds spent by one player, with the interface of multiprocessing.Value"""
+    def __init__(self):
+        self.value = 0.0
+
+def get_timeout(game):
+    return ceil(game.max_rounds * TIMEOUT_SECONDS_PER_ROUND)
+
+def check_if_won(players):
+    """Given to players objects, checks if player[0] won"""
+    if players[0].lost and not players[1].lost:
+        return 0
+    elif players[1].lost and not players[0].lost:
+        return 1
+    return -1
+
+def settle_timeout(players, time_player1, time_player2):
+    """On a timeout, the player that used the most time loses"""
+    if "TIMEOUT" in players[0].error or "TIMEOUT" in players[1].error:
+        if time_player1 > time_player2:
+            players[0].error = TIMEOUT_ERROR
+            players[0].lost = True
+            players[1].lost = False
+        elif time_player1 < time_player2:
+            players[1].error = TIMEOUT_ERROR
+            players[1].lost = True
+            players[0].lost = False
+
+def play_game(task):
+    """Play one game in a worker, limited to the game's time budget of CPU time
+    and to a multiple of it in wall-clock time"""
+    index, seed, code, arena, champion_code = task
+    random.seed(seed)
+    game = Game(player_bot_code=code, arena=arena, champion_code=champion_code)
+    t1, t2 = Timer(), Timer()
+
+    timeout = get_timeout(game)
+    signal.signal(signal.SIGPROF, timeout_handler)
+    signal.signal(signal.SIGALRM, timeout_handler)
+    signal.setitimer(signal.ITIMER_PROF, timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout * WALL_CLOCK_FACTOR)
+    try:
+        _, players, size = game.run(t1, t2)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+    settle_timeout(players, t1.value, t2.value)
+    return {
+        "index": index,
+        "won": check_if_won(players),
+        "errors": [player.error for player in players],
+        "size": size
+    }
+
+def run_tournament(code, arena, rounds, champion_code=None, worker_count=None):
+    """Play independent games on a pool of workers, yielding every result as
+    soon as its game finishes. Games still running when no result came for
+    RESULT_TIMEOUT seconds are stopped and lost by the submitted bot."""
+    # Forked workers share the random state of the parent, so every game gets
+    # its own seed
+    tasks = [(i, random.getrandbits(64), code, arena, champion_code) for i in range(rounds)]
+    worker_count = min(rounds, worker_count if worker_count else os.cpu_count())
+    with multiprocessing.Pool(worker_count) as pool:
+        results = pool.imap_unordered(play_game, tasks)
+        pending = set(range(rounds))
+        while pending:
+            try:
+                result = results.next(timeout=RESULT_TIMEOUT)
+            except multiprocessing.TimeoutError:
+                # A bot is stuck where no signal handler can run, such as one
+                # long computation on a huge integer. Leaving the pool
+                # terminates its workers.
+                for index in sorted(pending):
+                    yield {"index": index, "won": 0, "errors": [TIMEOUT_ERROR, ""], "size": None}
+                return
+            pending.discard(result["index"])
+            yield result
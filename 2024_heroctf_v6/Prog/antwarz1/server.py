@@ -5,12 +5,10 @@ import requests
 import random
 import string
 from engine.game import Game
+from engine.tournament import timeout_handler, get_timeout, check_if_won, settle_timeout, run_tournament, Timer
 import os
-import json
 from dotenv import load_dotenv
-from math import ceil
 import signal
-import multiprocessing
 import uuid
 import time
 from random import randint
@@ -26,9 +24,6 @@ CHALLENGES = [os.environ.get('CHALLENGE1'), os.environ.get('CHALLENGE2')]
 FLAGS = [os.environ.get('FLAG1'), os.environ.get('FLAG2')]
 PLATEFORM = os.environ.get('PLATEFORM')
 
-def timeout_handler(signum, frame):
-    raise Exception("TIMEOUT")
-
 def welcome():
     """Print welcome message with basic information"""
     print('            ,')
@@ -64,15 +59,18 @@ def generate_random_endpoint(length=32):
     characters = string.ascii_lowercase + string.digits
     return ''.join(random.choice(characters) for _ in range(length))
 
-def create_random_endpoint(endpoint_name, game_data, code, grid_size):
+def create_random_endpoint(endpoint_name, replay, code, grid_size):
     filename = os.path.join("/var/www/html", f"{endpoint_name}.html")
     template = open('/app/review.html', 'r').read()
-    template = template.replace('REPLACE_ME_WITH_GAME_DATA', json.dumps(game_data, indent = 4))
-    template = template.replace('REPLACE_ME_WITH_CODE', code)
-    template = template.replace('REPLACE_ME_WITH_GRID_SIZE', str(grid_size))
+    # The replay is streamed into the page between these two parts
+    parts = template.split('REPLACE_ME_WITH_GAME_DATA', 1)
+    parts = [part.replace('REPLACE_ME_WITH_CODE', code) for part in parts]
+    parts = [part.replace('REPLACE_ME_WITH_GRID_SIZE', str(grid_size)) for part in parts]
     try:
         with open(filename, "w") as file:
-            file.write(template)
+            file.write(parts[0])
+            replay.write_json(file)
+            file.write(parts[1])
         print(f"[+] Access it at: {PLATEFORM}/{endpoint_name}.html")
     except PermissionError:
         print("[-] Permission denied: ensure the script has write access to /var/www/html")
@@ -139,14 +137,6 @@ def check_current_step(token):
         return 1
     return 0
 
-def check_if_won(players):
-    """Given to players objects, checks if player[0] won"""
-    if players[0].lost and not players[1].lost:
-        return 0
-    elif players[1].lost and not players[0].lost:
-        return 1
-    return -1
-
 def new_champion(team_id, code):
     bot_id = uuid.uuid4()
     a = open('/app/names/adjectives.txt').readlines()
@@ -172,34 +162,24 @@ def run_single_game(team, code, arena):
     print(champion_code)
 
     game = Game(player_bot_code=code, arena=arena, champion_code=champion_code)
-    timeout = ceil(game.max_rounds * 0.005)
-    t1 = multiprocessing.Value('d', 0)
-    t2 = multiprocessing.Value('d', 0)
+    timeout = get_timeout(game)
+    t1 = Timer()
+    t2 = Timer()
 
     signal.signal(signal.SIGALRM, timeout_handler)
     signal.alarm(timeout)
     log(f"Running game for {team}. Arena: {arena}")
-    game_states, players, size = game.run(t1, t2)
+    replay, players, size = game.run(t1, t2)
     signal.alarm(0)
-    
-    if "TIMEOUT" in players[0].error or "TIMEOUT" in players[1].error:
-        t1 = t1.value
-        t2 = t2.value
-        if t1 > t2:
-            players[0].error = "Your bot timed out. Make sure you don't have an infinite loop in your code. If not, your code is probably taking to long to execute."
-            players[0].lost = True
-            players[1].lost = False
-        elif t1 < t2:
-            players[1].error = "Your bot timed out. Make sure you don't have an infinite loop in your code. If not, your code is probably taking to long to execute."
-            players[1].lost = True
-            players[0].lost = False
+
+    settle_timeout(players, t1.value, t2.value)
 
     if players[0].error:
         print(f'[!] Error: {players[0].error}')
 
     won = check_if_won(players)
     log(f"Finished processing game for {team}. Arena: {arena} / won: {won} / player1: {players[0].error} / player2: {players[1].error}")
-    return game_states, players, size
+    return replay, players, size
 
 def run_multiple_games(team, code, arena, rounds):
     """Run multiple games to get a flag"""
@@ -212,36 +192,14 @@ def run_multiple_games(team, code, arena, rounds):
         champion_code = open(f'/app/champions/{team_id}_{bot_id}.py').read()
         print(champion_code)
 
-    games = [Game(player_bot_code=code, arena=arena, champion_code=None) for _ in range(rounds)]
     looses = 0
     log(f"Running game submission for {team}. Arena: {arena}")
-    for i, game in enumerate(games):
-        timeout = ceil(game.max_rounds * 0.005)
-        t1 = multiprocessing.Value('d', 0)
-        t2 = multiprocessing.Value('d', 0)
-
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(timeout)
-        log(f"Running game for {team}. Arena: {arena} {i+1}/15")
-        game_states, players, size = game.run(t1, t2)
-        signal.alarm(0)
-        
-        if "TIMEOUT" in players[0].error or "TIMEOUT" in players[1].error:
-            t1 = t1.value
-            t2 = t2.value
-            if t1 > t2:
-                players[0].error = "Your bot timed out. Make sure you don't have an infinite loop in your code. If not, your code is probably taking to long to execute."
-                players[0].lost = True
-                players[1].lost = False
-            elif t1 < t2:
-                players[1].error = "Your bot timed out. Make sure you don't have an infinite loop in your code. If not, your code is probably taking to long to execute."
-                players[1].lost = True
-                players[0].lost = False
-        
-        won = check_if_won(players)
+    for i, result in enumerate(run_tournament(code, arena, rounds)):
+        won = result["won"]
+        errors = result["errors"]
         looses += 1 if won == 0 else 0
         print(f'[*] Processed game {i+1}/{rounds} {"(won)" if won == 1 else ""}', flush=True)
-        log(f"Finished processing game for {team}. Arena: {arena} / won: {won} / player1: {players[0].error} / player2: {players[1].error}")
+        log(f"Finished processing game for {team}. Arena: {arena} {result['index']+1}/{rounds} / won: {won} / player1: {errors[0]} / player2: {errors[1]}")
 
     return looses
 